@@ -0,0 +1,44 @@
+import random
+import time
+
+from dataset.dataset import Dataset
+from benchmark.load_dataset import make_synthetic_json
+
+def make_small_bbox_json(main_json, num_images, seed):
+    # A refine_small_bbox folder: a subset of the main images plus a few unknown ones
+    rng = random.Random(seed)
+    images = [dict(image) for image in rng.sample(main_json["images"], num_images)]
+    images += [{"id": -i - 1, "file_name": f"unknown_{seed}_{i}.jpg"} for i in range(num_images // 10)]
+    annotations = []
+    for i, image in enumerate(images):
+        annotations.append({
+            "id": i + 1,
+            "image_id": image["id"],
+            "category": "fish",
+            "category_id": 0,
+            "caption": "undefined",
+            "label": 1,
+            "negative_tags": "",
+            "bbox": [rng.randint(0, 800), rng.randint(0, 300), rng.randint(2, 30), rng.randint(2, 30)],
+            "segmentation": [],
+        })
+    return {"images": images, "annotations": annotations}
+
+def main(num_annotations, num_folders, images_per_folder):
+    main_json = make_synthetic_json(num_annotations)
+    small_jsons = [make_small_bbox_json(main_json, images_per_folder, seed) for seed in range(num_folders)]
+
+    main_dataset = Dataset(main_json)
+    small_datasets = [Dataset(json_data) for json_data in small_jsons]
+
+    start = time.perf_counter()
+    for dataset in small_datasets:
+        main_dataset.append_dataset(dataset)
+    elapsed = time.perf_counter() - start
+
+    print(f"Merged {num_folders} folders of {images_per_folder} images into {len(main_dataset.get_images())} images in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.append_dataset
+    main(num_annotations=200_000, num_folders=50, images_per_folder=2_000)
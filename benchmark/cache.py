@@ -0,0 +1,42 @@
+import gc
+import io
+import os
+import json
+import time
+import tempfile
+import contextlib
+
+from dataset.cache import load_json, load_dataset
+from benchmark.load_dataset import make_synthetic_json
+
+def time_call(func):
+    # The result is freed after the measurement, and before the next one, so that two
+    # datasets are never in memory at the same time
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    seconds = time.perf_counter() - start
+    # Dataset and its images refer to each other, so only the garbage collector frees them
+    del result
+    gc.collect()
+    return seconds
+
+def main(num_annotations):
+    with tempfile.TemporaryDirectory() as folder:
+        json_path = os.path.join(folder, "combined.json")
+        with open(json_path, 'w', encoding="utf-8") as f:
+            json.dump(make_synthetic_json(num_annotations), f)
+        print(f"{os.path.getsize(json_path) / 2 ** 20:.0f} MiB, {num_annotations} annotations")
+
+        seconds = time_call(lambda: load_json(json_path, cache=False))
+        print(f"{'json.load':>24}: {seconds:.2f}s")
+        for columnar in (False, True):
+            name = "ColumnarDataset" if columnar else "Dataset"
+            build_seconds = time_call(lambda: load_dataset(json_path, columnar, cache=True))
+            cached_seconds = time_call(lambda: load_dataset(json_path, columnar, cache=True))
+            print(f"{name:>24}: {build_seconds:.2f}s parsing and writing the cache, {cached_seconds:.2f}s from the cache")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.cache
+    main(num_annotations=1_000_000)
@@ -0,0 +1,34 @@
+import os
+import time
+
+from dataset.caption import CaptionNormalizer
+from benchmark.generate import MarineDetGenerator
+
+def normalize_old(captions):
+    # What process_caption did before CaptionNormalizer
+    return [caption.strip().replace("  ", " ") for caption in captions]
+
+def normalize_new(captions, processes):
+    normalizer = CaptionNormalizer()
+    normalizer.prepare(captions, processes)
+    return [normalizer.normalize(caption) for caption in captions]
+
+def main(num_annotations, seed):
+    annotations = MarineDetGenerator(num_annotations, seed).make_json()["annotations"]
+    captions = [annotation["caption"] for annotation in annotations]
+    print(f"{len(captions)} captions, {len(set(captions))} distinct")
+    # The synthetic captions repeat a lot; numbered ones are all distinct, which is the worst case
+    unique_captions = [f"{caption} #{i}" for i, caption in enumerate(captions)]
+    for name, values in (("synthetic", captions), ("all distinct", unique_captions)):
+        start = time.perf_counter()
+        normalize_old(values)
+        print(f"{name:>14} {'strip/replace':>24}: {time.perf_counter() - start:.2f}s")
+        for processes in sorted({1, os.cpu_count()}):
+            start = time.perf_counter()
+            normalize_new(values, processes)
+            print(f"{name:>14} {f'CaptionNormalizer x{processes}':>24}: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.caption
+    main(num_annotations=1_000_000, seed=0)
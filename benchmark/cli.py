@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import filecmp
+import tempfile
+import subprocess
+
+from benchmark.combine import write_sources
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The workflow as separate scripts, each reading the file written by the one before it
+SCRIPTS = [
+    "import combine; combine.main({main_path!r}, {small_bbox_folder!r})",
+    "import processing; processing.main('./data/combined.json')",
+    "import verify; verify.main('./data/combined_processed.json')",
+    "import extract_category; extract_category.main('./data/combined_processed.json')",
+    "import clean_segmentation; clean_segmentation.main('./data/combined_processed.json')",
+]
+COMMANDS = ["combine", "process", "verify", "categories", "clean-seg"]
+
+def run_in(folder, args):
+    start = time.perf_counter()
+    subprocess.run(args, cwd=folder, env={**os.environ, "PYTHONPATH": REPO_DIR}, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def main(num_annotations, num_sources):
+    with tempfile.TemporaryDirectory() as folder:
+        main_path, small_bbox_folder = write_sources(folder, num_annotations, num_sources)
+        scripts_dir = os.path.join(folder, "scripts")
+        cli_dir = os.path.join(folder, "cli")
+
+        os.makedirs(os.path.join(scripts_dir, "data"))
+        os.makedirs(os.path.join(cli_dir, "data"))
+
+        # One process per script, as the scripts are run one after another
+        seconds = [run_in(scripts_dir, [sys.executable, "-c", script.format(main_path=main_path, small_bbox_folder=small_bbox_folder)])
+                   for script in SCRIPTS]
+        cli_seconds = run_in(cli_dir, [sys.executable, os.path.join(REPO_DIR, "cli.py"), *COMMANDS, "--main-json-path", main_path,
+                                       "--small-bbox-folder", small_bbox_folder, "--processes", "1"])
+
+        print(f"{num_annotations} annotations and {num_sources} small bbox datasets of {num_annotations // num_sources}")
+        for command, script_seconds in zip(COMMANDS, seconds):
+            print(f"{command:>12} {script_seconds:>7.2f}s")
+        print(f"{'scripts':>12} {sum(seconds):>7.2f}s")
+        print(f"{'cli':>12} {cli_seconds:>7.2f}s")
+
+        names = [name for name in os.listdir(os.path.join(scripts_dir, "data")) if not name.endswith("_trace.json")]
+        _, mismatch, errors = filecmp.cmpfiles(os.path.join(scripts_dir, "data"), os.path.join(cli_dir, "data"), names, shallow=False)
+        assert not mismatch and not errors, (mismatch, errors)
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.cli
+    main(num_annotations=500_000, num_sources=8)
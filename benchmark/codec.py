@@ -0,0 +1,57 @@
+import gc
+import os
+import time
+import tempfile
+
+from dataset import codec
+from dataset.pipeline import paused_gc
+from benchmark.load_dataset import make_synthetic_json
+
+def get_codecs():
+    codecs = [codec.get_codec("json", compact=False), codec.get_codec("json")]
+    if codec.orjson is not None:
+        codecs.append(codec.get_codec("orjson"))
+    return codecs
+
+def get_extensions():
+    extensions = ["", ".gz"]
+    if codec.zstandard is not None:
+        extensions.append(".zst")
+    return extensions
+
+def best_time(func, repeat):
+    # With the garbage collector paused, as the loads of the scripts are
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with paused_gc():
+            result = func()
+        seconds.append(time.perf_counter() - start)
+        del result
+        gc.collect()
+    return min(seconds)
+
+def main(num_annotations, non_ascii_share, repeat):
+    json_data = make_synthetic_json(num_annotations)
+    # Some captions with accents, which the default ensure_ascii=True escapes
+    for anno_data in json_data["annotations"][::round(1 / non_ascii_share)]:
+        anno_data["caption"] = "une raie pastenague près du récif"
+
+    print(f"{num_annotations} annotations, MB/s of uncompressed JSON, best of {repeat}")
+    print(f"{'codec':>16} {'file':>6} {'MiB':>8} {'load':>8} {'save':>8} {'save ascii=False':>17}")
+    with tempfile.TemporaryDirectory() as folder:
+        for json_codec in get_codecs():
+            size = len(json_codec.dumps(json_data))
+            for extension in get_extensions():
+                path = os.path.join(folder, "annotations.json" + extension)
+                save = best_time(lambda: json_codec.dump(json_data, path), repeat)
+                save_unicode = best_time(lambda: json_codec.dump(json_data, path, ensure_ascii=False), repeat)
+                load = best_time(lambda: json_codec.load(path), repeat)
+                speeds = [size / 1e6 / seconds for seconds in (load, save, save_unicode)]
+                print(f"{json_codec.get_name():>16} {'.json' + extension:>6} {os.path.getsize(path) / 2 ** 20:>8.1f} "
+                      f"{speeds[0]:>8.0f} {speeds[1]:>8.0f} {speeds[2]:>17.0f}")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.codec
+    main(num_annotations=500_000, non_ascii_share=0.1, repeat=3)
@@ -0,0 +1,59 @@
+import gc
+import io
+import json
+import time
+import contextlib
+import tracemalloc
+
+import processing
+from dataset.dataset import Dataset
+from dataset.columnar import ColumnarDataset
+from benchmark.load_dataset import make_synthetic_json
+
+def measure_load(dataset_class, text):
+    gc.collect()
+    tracemalloc.start()
+    dataset = dataset_class(json.loads(text))
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dataset, size
+
+def measure_annotations(dataset_class, json_data):
+    # Memory of the annotations alone: the whole dataset minus the same dataset without annotations
+    dataset, size = measure_load(dataset_class, json.dumps(json_data))
+    _, images_size = measure_load(dataset_class, json.dumps({"images": json_data["images"], "annotations": []}))
+    return dataset, (size - images_size) / len(json_data["annotations"])
+
+def main(num_annotations):
+    json_data = make_synthetic_json(num_annotations)
+
+    datasets = {}
+    for name, dataset_class in [("dict", Dataset), ("columnar", ColumnarDataset)]:
+        dataset, size = measure_annotations(dataset_class, json_data)
+        datasets[name] = dataset
+        print(f"{name:>10}: {size:.0f} bytes per annotation")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        processing.build_pipeline("/dev/null").run(datasets["dict"])
+        pipeline_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        processing.process_columnar(datasets["columnar"], "/dev/null")
+        columnar_seconds = time.perf_counter() - start
+    print(f"processing: {pipeline_seconds:.3f}s with the pipeline, {columnar_seconds:.3f}s vectorized")
+
+    dataset = datasets["columnar"]
+    start = time.perf_counter()
+    small = dataset.small_bbox_mask()
+    dataset.fill(small, "label", -1)
+    dataset.rearrange_ids()
+    print(f"small bbox + relabel + rearrange ids: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    assert datasets["dict"].to_json() == datasets["columnar"].to_json(), "Columnar output differs"
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.columnar
+    main(num_annotations=500_000)
@@ -0,0 +1,46 @@
+import io
+import os
+import json
+import time
+import tempfile
+import contextlib
+
+import combine
+from benchmark.load_dataset import make_synthetic_json
+
+def write_sources(folder, num_annotations, num_sources):
+    # A main dataset and num_sources small bbox datasets on the same images
+    main_json = make_synthetic_json(num_annotations)
+    main_path = os.path.join(folder, "main.json")
+    with open(main_path, 'w', encoding="utf-8") as f:
+        json.dump(main_json, f)
+
+    small_bbox_folder = os.path.join(folder, "small")
+    for i in range(num_sources):
+        json_data = make_synthetic_json(num_annotations // num_sources, seed=i + 1)
+        for annotation in json_data["annotations"]:
+            annotation["caption"] = "undefined"
+        os.makedirs(os.path.join(small_bbox_folder, f"source_{i}"))
+        with open(os.path.join(small_bbox_folder, f"source_{i}", "annotations.json"), 'w', encoding="utf-8") as f:
+            json.dump(json_data, f)
+    return main_path, small_bbox_folder
+
+def main(num_annotations, num_sources, process_counts):
+    with tempfile.TemporaryDirectory() as folder:
+        main_path, small_bbox_folder = write_sources(folder, num_annotations, num_sources)
+        cwd = os.getcwd()
+        os.makedirs(os.path.join(folder, "data"))
+        os.chdir(folder)
+        try:
+            for processes in process_counts:
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    combine.main(main_path, small_bbox_folder, processes=processes)
+                print(f"{processes:>3} processes: {time.perf_counter() - start:.2f}s")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.combine
+    main(num_annotations=200_000, num_sources=8, process_counts=sorted({1, 2, os.cpu_count()}))
@@ -0,0 +1,132 @@
+import os
+import json
+import random
+import itertools
+
+from processing import REFINE_MAP
+
+# Shape of the combined dataset
+ANNOTATIONS_PER_IMAGE = 6
+SMALL_BBOX_RATIO = 0.3
+# Annotations whose category is not normalized yet ("Coral ", "Fish") or is a key of REFINE_MAP
+RAW_CATEGORY_RATIO = 0.05
+# Annotations whose caption still has double spaces, "<image>" or "description:"
+DIRTY_CAPTION_RATIO = 0.05
+SEGMENTATION_POINTS = 8
+IMAGE_SIZES = [(1920, 1080), (1280, 720), (3840, 2160), (640, 480)]
+CHUNK_SIZE = 100_000
+
+ACTIONS = ["swimming", "resting", "hiding", "feeding", "moving slowly", "partially visible"]
+PLACES = ["near the coral", "over the sand", "in open water", "among the rocks", "under a ledge", "in the seagrass"]
+DIRTY_CAPTIONS = ["<image> {}", "description: {}", " {}  ", "{}  with  others"]
+
+def read_category_counts(category_analysis_path):
+    # category_analysis.txt lines are category_id;category;count
+    counts = {}
+    with open(category_analysis_path, 'r', encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split(";")
+            counts[";".join(parts[1:-1])] = int(parts[-1])
+    return counts
+
+class MarineDetGenerator:
+    # Synthetic annotations shaped like the combined dataset: categories drawn with the frequencies
+    # of category_analysis.txt, SMALL_BBOX_RATIO of the bboxes below SMALL_BBOX_AREA (with an empty
+    # caption, as combine.py leaves them), and a few raw categories and dirty captions for
+    # processing.py to clean. The same arguments always give the same dataset.
+    def __init__(self, num_annotations, seed=0, category_analysis_path="category_analysis.txt",
+                 small_bbox_ratio=SMALL_BBOX_RATIO, num_images=None):
+        self.num_annotations = num_annotations
+        self.num_images = num_images or max(1, num_annotations // ANNOTATIONS_PER_IMAGE)
+        self.seed = seed
+        self.small_bbox_ratio = small_bbox_ratio
+        counts = read_category_counts(category_analysis_path)
+        self.categories = list(counts)
+        self.cum_weights = list(itertools.accumulate(counts.values()))
+        refine_keys = [category for category in REFINE_MAP if category in counts or REFINE_MAP[category] in counts]
+        self.raw_categories = refine_keys + [category.title() for category in self.categories[:50]] + ["coral ", " fish"]
+
+    def make_images(self):
+        rng = random.Random(self.seed)
+        images = []
+        for i in range(self.num_images):
+            width, height = rng.choice(IMAGE_SIZES)
+            images.append({"id": i + 1, "file_name": f"{i + 1:08d}.jpg", "width": width, "height": height})
+        return images
+
+    def make_bbox(self, rng, width, height, small):
+        if small:
+            w = rng.uniform(2, 40)
+            h = rng.uniform(2, 1000 / w)
+        else:
+            w = rng.uniform(32, width / 2)
+            h = rng.uniform(max(1100 / w, 8), height / 2)
+        x = rng.uniform(0, width - w)
+        y = rng.uniform(0, height - h)
+        return [round(x, 2), round(y, 2), round(w, 2), round(h, 2)]
+
+    def make_caption(self, rng, category):
+        caption = f"a {category} {rng.choice(ACTIONS)} {rng.choice(PLACES)}"
+        if rng.random() < DIRTY_CAPTION_RATIO:
+            caption = rng.choice(DIRTY_CAPTIONS).format(caption)
+        return caption
+
+    def iter_annotation_chunks(self, images):
+        # Annotations are not sorted by image, as in the merged dataset
+        rng = random.Random(self.seed + 1)
+        for start in range(0, self.num_annotations, CHUNK_SIZE):
+            stop = min(start + CHUNK_SIZE, self.num_annotations)
+            categories = rng.choices(self.categories, cum_weights=self.cum_weights, k=stop - start)
+            chunk = []
+            for annotation_id, category in enumerate(categories, start + 1):
+                image = images[rng.randrange(self.num_images)]
+                small = rng.random() < self.small_bbox_ratio
+                bbox = self.make_bbox(rng, image["width"], image["height"], small)
+                x, y, w, h = bbox
+                chunk.append({
+                    "id": annotation_id,
+                    "image_id": image["id"],
+                    "category": rng.choice(self.raw_categories) if rng.random() < RAW_CATEGORY_RATIO else category,
+                    "category_id": 0,
+                    "caption": "" if small else self.make_caption(rng, category),
+                    "label": rng.choice((0, 1, 1, 1)),
+                    "negative_tags": rng.choice(("", "", "", rng.choice(self.categories))),
+                    "bbox": bbox,
+                    "segmentation": [[round(v, 2) for _ in range(SEGMENTATION_POINTS)
+                                      for v in (x + rng.random() * w, y + rng.random() * h)]],
+                })
+            yield chunk
+
+    def make_json(self):
+        images = self.make_images()
+        annotations = [annotation for chunk in self.iter_annotation_chunks(images) for annotation in chunk]
+        return {"images": images, "annotations": annotations}
+
+    def write_json(self, output_path):
+        # Written chunk by chunk, so that 10M annotations never have to be in memory at once.
+        # The bytes are the same as json.dump(self.make_json(), f).
+        images = self.make_images()
+        with open(output_path, 'w', encoding="utf-8") as f:
+            f.write('{"images": ' + json.dumps(images) + ', "annotations": [')
+            for i, chunk in enumerate(self.iter_annotation_chunks(images)):
+                if i:
+                    f.write(", ")
+                f.write(json.dumps(chunk)[1:-1])
+            f.write("]}")
+
+def make_marinedet_json(num_annotations, seed=0, **kwargs):
+    return MarineDetGenerator(num_annotations, seed, **kwargs).make_json()
+
+def main(num_annotations, output_path, seed):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    MarineDetGenerator(num_annotations, seed).write_json(output_path)
+    print(f"Wrote {num_annotations} annotations to {output_path} ({os.path.getsize(output_path) / 2 ** 20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.generate
+    # Anything from 1_000 to 10_000_000 annotations
+    num_annotations = 1_000_000
+    output_path = f"./data/synthetic_{num_annotations}.json"
+    seed = 0
+    main(num_annotations, output_path, seed)
@@ -0,0 +1,42 @@
+import gc
+import json
+import time
+import tracemalloc
+
+from dataset.dataset import Dataset
+from benchmark.load_dataset import make_synthetic_json
+
+def extract_categories(dataset):
+    # What extract_category.py reads
+    categories = {}
+    for image in dataset.get_images():
+        for anno_data in image.get_anno_datas():
+            categories.setdefault(anno_data["category_id"], anno_data["category"])
+    return categories
+
+def measure(text, lazy):
+    json_data = json.loads(text)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    dataset = Dataset(json_data, lazy=lazy)
+    load_seconds = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    extract_categories(dataset)
+    dataset.get_filename_index()
+    read_seconds = time.perf_counter() - start
+    tracemalloc.stop()
+    return load_seconds, read_seconds, size
+
+def main(num_annotations):
+    text = json.dumps(make_synthetic_json(num_annotations))
+    print(f"{'mode':>6} {'Dataset s':>10} {'read s':>8} {'MiB on top of the JSON':>24}")
+    for lazy in (False, True):
+        load_seconds, read_seconds, size = measure(text, lazy)
+        print(f"{'lazy' if lazy else 'eager':>6} {load_seconds:>10.2f} {read_seconds:>8.2f} {size / 2 ** 20:>24.1f}")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.lazy
+    main(num_annotations=500_000)
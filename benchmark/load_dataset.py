@@ -0,0 +1,46 @@
+import random
+import time
+
+from dataset.dataset import Dataset
+
+ANNOTATIONS_PER_IMAGE = 5
+CATEGORIES = ["fish", "coral", "sea anemone", "moray eels", "Sea Urchin ", "whale shark", "octopus", "sponge"]
+
+def make_synthetic_json(num_annotations, seed=0):
+    rng = random.Random(seed)
+    num_images = max(1, num_annotations // ANNOTATIONS_PER_IMAGE)
+    images = [{"id": i + 1, "file_name": f"{i + 1:08d}.jpg", "width": 1280, "height": 720} for i in range(num_images)]
+
+    annotations = []
+    for i in range(num_annotations):
+        w = rng.randint(4, 400)
+        h = rng.randint(4, 400)
+        annotations.append({
+            "id": i + 1,
+            # Annotations are not sorted by image, as in the merged dataset
+            "image_id": rng.randint(1, num_images),
+            "category": rng.choice(CATEGORIES),
+            "category_id": 0,
+            "caption": "a fish  swimming near the coral",
+            "label": 1,
+            "negative_tags": "",
+            "bbox": [rng.randint(0, 800), rng.randint(0, 300), w, h],
+            "segmentation": [],
+        })
+    return {"images": images, "annotations": annotations}
+
+def main(sizes):
+    print(f"{'annotations':>12} {'images':>10} {'seconds':>10} {'us/anno':>10}")
+    for size in sizes:
+        json_data = make_synthetic_json(size)
+        start = time.perf_counter()
+        dataset = Dataset(json_data)
+        elapsed = time.perf_counter() - start
+        assert len(dataset.get_all_annotations()) == size
+        print(f"{size:>12} {len(dataset.get_images()):>10} {elapsed:>10.3f} {elapsed / size * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.load_dataset
+    sizes = [1_000, 10_000, 100_000, 1_000_000]
+    main(sizes)
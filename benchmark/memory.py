@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import random
+import subprocess
+import tempfile
+import time
+
+from benchmark.load_dataset import make_synthetic_json
+
+def add_segmentation(json_data, num_points, seed=0):
+    rng = random.Random(seed)
+    for anno in json_data["annotations"]:
+        x, y, w, h = anno["bbox"]
+        anno["segmentation"] = [[round(v, 2) for _ in range(num_points) for v in (x + rng.random() * w, y + rng.random() * h)]]
+    return json_data
+
+def run_current(json_path, output_path):
+    import processing
+    from dataset.dataset import Dataset
+    with open(json_path, 'r', encoding="utf-8") as f:
+        dataset = Dataset(json.load(f))
+    processing.build_pipeline(output_path + ".txt").run(dataset)
+    with open(output_path, 'w', encoding="utf-8") as f:
+        json.dump(dataset.to_json(), f)
+
+def run_streaming(json_path, output_path):
+    import processing
+    from dataset.stream import StreamingDataset
+    dataset = StreamingDataset(json_path)
+    processing.build_pipeline(output_path + ".txt").run_streaming(dataset, output_path)
+    dataset.close()
+
+def peak_rss_kb():
+    # VmHWM is reset on exec, unlike ru_maxrss, which can report the parent's RSS at fork time
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+
+def main(num_annotations, num_points):
+    work_dir = tempfile.mkdtemp()
+    json_path = os.path.join(work_dir, "combined.json")
+    with open(json_path, 'w', encoding="utf-8") as f:
+        json.dump(add_segmentation(make_synthetic_json(num_annotations), num_points), f)
+    print(f"{num_annotations} annotations, {os.path.getsize(json_path) / 2**20:.1f} MiB")
+
+    outputs = []
+    for mode in ["current", "streaming"]:
+        output_path = os.path.join(work_dir, f"{mode}_processed.json")
+        # Each mode runs in a fresh process so that its peak RSS is measured on its own
+        result = subprocess.run([sys.executable, "-m", "benchmark.memory", mode, json_path, output_path],
+                                capture_output=True, text=True, check=True)
+        seconds, max_rss_kb = result.stdout.split()[-2:]
+        print(f"{mode:>10}: {float(seconds):.2f}s, peak RSS {int(max_rss_kb) / 1024:.1f} MiB")
+        with open(output_path, 'rb') as f:
+            outputs.append(f.read())
+
+    assert outputs[0] == outputs[1], "Streaming output differs"
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.memory
+    if len(sys.argv) == 4:
+        mode, json_path, output_path = sys.argv[1:]
+        run = run_current if mode == "current" else run_streaming
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            run(json_path, output_path)
+            sys.stdout = sys.__stdout__
+        print(time.perf_counter() - start, peak_rss_kb())
+    else:
+        main(num_annotations=200_000, num_points=20)
@@ -0,0 +1,60 @@
+import time
+import random
+
+from dataset import overlap
+from dataset.dataset import Dataset
+
+def make_json(num_images, boxes_per_image, num_categories, seed):
+    # Images crowded with boxes, a tenth of them repeated or shifted by a pixel
+    rng = random.Random(seed)
+    images = [{"id": i + 1, "file_name": f"{i + 1:08d}.jpg", "width": 1280, "height": 720} for i in range(num_images)]
+    annotations = []
+    for image in images:
+        boxes = []
+        for _ in range(boxes_per_image):
+            if boxes and rng.random() < 0.1:
+                category, box = rng.choice(boxes)
+                box = [box[0] + rng.choice((0, 1)), box[1], box[2], box[3]]
+            else:
+                category = f"category {rng.randrange(num_categories)}"
+                box = [rng.randrange(1200), rng.randrange(650), rng.randrange(4, 80), rng.randrange(4, 70)]
+            boxes.append((category, box))
+            annotations.append({"id": len(annotations) + 1, "image_id": image["id"], "category": category, "bbox": box})
+    return {"images": images, "annotations": annotations}
+
+def find_quadratic(images, threshold):
+    # Every pair of annotations of an image, a duplicate counting once as in find_overlapping_annotations
+    count = 0
+    for image in images:
+        anno_datas = image.get_anno_datas()
+        for j, second in enumerate(anno_datas):
+            duplicate = False
+            for first in anno_datas[:j]:
+                if first["category"] != second["category"]:
+                    continue
+                if first["bbox"] == second["bbox"]:
+                    count += not duplicate
+                    duplicate = True
+                elif overlap.get_iou(first["bbox"], second["bbox"]) >= threshold:
+                    count += 1
+    return count
+
+def time_call(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main(num_annotations, boxes_per_image, num_categories, seed):
+    dataset = Dataset(make_json(num_annotations // boxes_per_image, boxes_per_image, num_categories, seed), lazy=True)
+    images = dataset.get_images()
+    count, seconds = time_call(lambda: find_quadratic(images, overlap.OVERLAP_THRESHOLD))
+    print(f"{'every pair':>16}: {seconds:>6.2f}s {count} pairs")
+    for name, min_boxes in (("sweep, Python", float("inf")), ("sweep, NumPy", 0)):
+        overlap.NUMPY_MIN_BOXES = min_boxes
+        pairs, seconds = time_call(lambda: overlap.find_overlapping_annotations(images))
+        print(f"{name:>16}: {seconds:>6.2f}s {len(pairs)} pairs")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.overlap
+    main(num_annotations=200_000, boxes_per_image=400, num_categories=10, seed=0)
@@ -0,0 +1,51 @@
+import gc
+import io
+import os
+import time
+import tempfile
+import contextlib
+
+import combine
+from dataset.prefetch import PrefetchReader
+from benchmark.combine import write_sources
+
+class NetworkReader(PrefetchReader):
+    # Reads as from network storage: a fixed latency per file and a limited bandwidth, spent
+    # sleeping so that other threads run meanwhile, as they do during a blocking read
+    def __init__(self, paths, window, latency, bandwidth):
+        super().__init__(paths, window)
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def read_file(self, path):
+        data, seconds = super().read_file(path)
+        delay = self.latency + len(data) / self.bandwidth
+        time.sleep(delay)
+        return data, seconds + delay
+
+def run(main_path, json_files, window, latency, bandwidth):
+    # What combine_files does with a single process, up to the merge
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), NetworkReader(json_files, window, latency, bandwidth) as reader:
+        main_dataset = combine.load_main_dataset(main_path, stream=False)
+        combine.merge_datasets(main_dataset, json_files, combine.parse_small_bbox_datasets(reader))
+    seconds = time.perf_counter() - start
+    totals = {name: sum(timing.seconds.get(name, 0) for timing in reader.timings) for name in ("read", "wait", "parse", "merge")}
+    return seconds, totals
+
+def main(num_annotations, num_sources, windows, latency, bandwidth):
+    with tempfile.TemporaryDirectory() as folder:
+        main_path, small_bbox_folder = write_sources(folder, num_annotations, num_sources)
+        json_files = [os.path.join(small_bbox_folder, name, "annotations.json") for name in sorted(os.listdir(small_bbox_folder))]
+        print(f"{'window':>6} {'total':>8} {'read':>8} {'wait':>8} {'parse':>8} {'merge':>8}")
+        for window in windows:
+            # The datasets of the previous run hold reference cycles (Image.dataset), and slow
+            # down the next one until they are collected
+            gc.collect()
+            seconds, totals = run(main_path, json_files, window, latency, bandwidth)
+            print(f"{window:>6} {seconds:>7.2f}s " + " ".join(f"{totals[name]:>7.2f}s" for name in ("read", "wait", "parse", "merge")))
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.prefetch
+    main(num_annotations=200_000, num_sources=8, windows=[0, 1, 2, 4], latency=0.05, bandwidth=20 * 2 ** 20)
@@ -0,0 +1,48 @@
+import contextlib
+import copy
+import io
+import os
+import tempfile
+import time
+
+import processing
+from dataset.dataset import Dataset
+from benchmark.load_dataset import make_synthetic_json
+
+def run_sequential(dataset, analysis_path):
+    dataset = processing.process_category(dataset)
+    dataset = processing.process_caption(dataset)
+    dataset = processing.define_category_id(dataset)
+    dataset = processing.rearrange_ids(dataset)
+    dataset = processing.clean_small_bbox_label(dataset)
+    dataset = processing.clean_small_bbox_negative_tags(dataset)
+    processing.category_analysis(dataset, analysis_path)
+    return dataset
+
+def run_fused(dataset, analysis_path):
+    return processing.build_pipeline(analysis_path).run(dataset)
+
+def main(num_annotations):
+    json_data = make_synthetic_json(num_annotations)
+    output_dir = tempfile.mkdtemp()
+
+    outputs = {}
+    seconds = {}
+    for name, run in [("sequential", run_sequential), ("fused", run_fused)]:
+        dataset = Dataset(copy.deepcopy(json_data))
+        analysis_path = os.path.join(output_dir, f"{name}.txt")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dataset = run(dataset, analysis_path)
+        elapsed = time.perf_counter() - start
+        outputs[name] = dataset.to_json()
+        seconds[name] = elapsed
+        print(f"{name:>12}: {elapsed:.3f}s")
+    print(f"{'speedup':>12}: {seconds['sequential'] / seconds['fused']:.2f}x")
+
+    assert outputs["sequential"] == outputs["fused"], "Fused pipeline output differs"
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.processing_pipeline
+    main(num_annotations=500_000)
@@ -0,0 +1,49 @@
+import time
+
+from dataset.dataset import Dataset
+from dataset.small_bbox import SmallBboxFilter
+from benchmark.load_dataset import make_synthetic_json
+
+def time_call(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+def scan_queries(dataset, small_bbox_filter, category):
+    # The same questions as query_queries, each as a pass over every annotation
+    mask = small_bbox_filter.get_mask(dataset)
+    annotations = dataset.get_all_annotations()
+    return [
+        sum(annotation.get_category() == category for annotation in annotations),
+        sum(small and annotation.get_caption() != "" for annotation, small in zip(annotations, mask)),
+        sum(small and annotation.get_label() != -1 for annotation, small in zip(annotations, mask)),
+        sum(1024 <= annotation.get_area() < 4096 for annotation in annotations),
+    ]
+
+def query_queries(dataset, small_bbox_filter, category):
+    query = dataset.query()
+    return [
+        query.category(category).count(),
+        query.small(small_bbox_filter).caption_empty(False).count(),
+        query.small(small_bbox_filter).exclude(query.label(-1)).count(),
+        query.area(1024, 4096).count(),
+    ]
+
+def main(num_annotations, lazy):
+    dataset = Dataset(make_synthetic_json(num_annotations), lazy=lazy)
+    small_bbox_filter = SmallBboxFilter()
+    small_bbox_filter.get_mask(dataset)
+    category = dataset.get_images()[0].get_annotations()[0].get_category()
+
+    scanned, scan_ms = time_call(lambda: scan_queries(dataset, small_bbox_filter, category))
+    _, build_ms = time_call(dataset.get_query_index)
+    queried, query_ms = time_call(lambda: query_queries(dataset, small_bbox_filter, category))
+    assert scanned == queried, (scanned, queried)
+    print(f"{'full scans':>14}: {scan_ms:>8.1f} ms")
+    print(f"{'index build':>14}: {build_ms:>8.1f} ms")
+    print(f"{'queries':>14}: {query_ms:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.query
+    main(num_annotations=500_000, lazy=False)
@@ -0,0 +1,69 @@
+import os
+import time
+import random
+import tempfile
+
+from dataset.dataset import Dataset
+from dataset.pipeline import paused_gc
+from dataset.remap import IdRemap, load_remap, np
+from benchmark.load_dataset import make_synthetic_json
+
+def rearrange_two_passes(dataset):
+    # The renumbering before IdRemap: the annotations, then the images again, keeping no table
+    for i, anno in enumerate(dataset.get_all_annotations()):
+        anno.set_id(i + 1)
+    for i, image in enumerate(dataset.get_images()):
+        image.set_id(i + 1)
+        for anno in image.get_annotations():
+            anno.set_image_id(i + 1)
+    dataset.reindex()
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main(num_annotations, num_lookups):
+    json_data = make_synthetic_json(num_annotations)
+    # Sparse old ids, as in a file that was filtered before
+    for anno_data in json_data["annotations"]:
+        anno_data["id"] = anno_data["id"] * 3 + 1000
+    old_ids = [anno_data["id"] for anno_data in json_data["annotations"]]
+    print(f"{num_annotations} annotations, {num_lookups} ids translated")
+    with paused_gc():
+        dataset = Dataset(make_synthetic_json(num_annotations))
+        _, seconds = timed(lambda: rearrange_two_passes(dataset))
+        print(f"{'renumber, two passes':>28} {seconds:>7.3f}s")
+        dataset = Dataset(json_data)
+        remap = IdRemap()
+        _, seconds = timed(lambda: remap.renumber(dataset))
+        print(f"{'renumber, IdRemap':>28} {seconds:>7.3f}s")
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "annotations.json.ids")
+            _, seconds = timed(lambda: remap.save(path))
+            print(f"{'save':>28} {seconds:>7.3f}s {os.path.getsize(path) / 2 ** 20:>6.1f} MiB")
+            remap, seconds = timed(lambda: load_remap(path))
+            print(f"{'load':>28} {seconds:>7.3f}s")
+        _, seconds = timed(remap.annotations.get_lookups)
+        print(f"{'build old -> new lookup':>28} {seconds:>7.3f}s")
+
+        rng = random.Random(0)
+        # Some ids that are not in the file
+        queries = [rng.choice(old_ids) if rng.random() < 0.9 else rng.randint(0, 10 ** 9) for _ in range(num_lookups)]
+        _, seconds = timed(lambda: [remap.annotations.get_new_id(old_id) for old_id in queries[:num_lookups // 100]])
+        print(f"{'get_new_id, one by one':>28} {seconds * 100:>7.3f}s (extrapolated from {num_lookups // 100})")
+        new_ids, seconds = timed(lambda: remap.annotations.translate(queries))
+        print(f"{'translate, list':>28} {seconds:>7.3f}s")
+        if np is not None:
+            array_ids = np.array(queries, dtype=np.int64)
+            array_new_ids, seconds = timed(lambda: remap.annotations.translate(array_ids))
+            print(f"{'translate, NumPy array':>28} {seconds:>7.3f}s")
+            assert array_new_ids.tolist() == new_ids
+        _, seconds = timed(lambda: remap.annotations.translate_back(new_ids))
+        print(f"{'translate_back, list':>28} {seconds:>7.3f}s")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.remap
+    main(num_annotations=500_000, num_lookups=5_000_000)
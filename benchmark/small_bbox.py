@@ -0,0 +1,30 @@
+import time
+
+from dataset.dataset import Dataset
+from dataset.columnar import ColumnarDataset
+from dataset.small_bbox import SmallBboxFilter
+from benchmark.load_dataset import make_synthetic_json
+
+def time_call(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+def main(num_annotations, thresholds):
+    json_data = make_synthetic_json(num_annotations)
+    datasets = [("dict", Dataset(json_data)), ("columnar", ColumnarDataset(make_synthetic_json(num_annotations)))]
+
+    print(f"{'dataset':>10} {'threshold':>10} {'per anno ms':>12} {'mask ms':>10} {'cached ms':>10} {'small':>8}")
+    for name, dataset in datasets:
+        for threshold in thresholds:
+            # One is_small_bbox call per annotation, as the scripts used to do
+            _, per_annotation_ms = time_call(lambda: [a.is_small_bbox(threshold) for a in dataset.get_all_annotations()])
+            small_bbox_filter = SmallBboxFilter(threshold)
+            _, mask_ms = time_call(lambda: small_bbox_filter.get_mask(dataset))
+            count, cached_ms = time_call(lambda: small_bbox_filter.count(dataset))
+            print(f"{name:>10} {threshold:>10} {per_annotation_ms:>12.1f} {mask_ms:>10.1f} {cached_ms:>10.1f} {count:>8}")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.small_bbox
+    main(num_annotations=500_000, thresholds=[256, 1024, 4096])
@@ -0,0 +1,87 @@
+import io
+import sys
+import copy
+import time
+import subprocess
+import contextlib
+
+import processing
+from dataset.dataset import Dataset
+from dataset.pipeline import paused_gc
+from dataset.category import CategoryNormalizer
+from dataset.small_bbox import SmallBboxFilter
+from dataset.snapshot import fork_dataset, diff_datasets, count_changes
+from dataset.codec import DEFAULT_CODEC
+from benchmark.load_dataset import make_synthetic_json
+
+# "in place" runs both variants on the dataset itself, for reference: the processing scatters
+# the records in memory, which makes the variants slower on it and on its forks than on a
+# reloaded copy, whose records are laid out in order
+STRATEGIES = ("in place", "reload", "deepcopy", "fork")
+
+def read_rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+def refine_variant(dataset):
+    # processing.REFINE_MAP with sponges counted as corals, which also shifts the category ids after it
+    CategoryNormalizer({"sponge": "coral"}).apply(dataset)
+    processing.define_category_id(dataset)
+
+def threshold_variant(dataset):
+    # Captions cleared below 2048 pixels instead of 1024
+    SmallBboxFilter(2048).clear_captions(dataset)
+
+def make_copy(dataset, text, strategy):
+    if strategy == "in place":
+        return dataset
+    if strategy == "reload":
+        return Dataset(DEFAULT_CODEC.loads(text))
+    if strategy == "deepcopy":
+        return copy.deepcopy(dataset)
+    return fork_dataset(dataset)
+
+def run(strategy, num_annotations):
+    # Two copies of the processed dataset, with a variant run on each, with the garbage
+    # collector paused as in the pipelines
+    with contextlib.redirect_stdout(io.StringIO()):
+        dataset = Dataset(make_synthetic_json(num_annotations))
+        processing.build_pipeline("/dev/null").run(dataset)
+    text = DEFAULT_CODEC.dumps(dataset.to_json())
+    rss_kb = read_rss_kb()
+    with paused_gc():
+        start = time.perf_counter()
+        copies = [make_copy(dataset, text, strategy) for _ in range(2)]
+        copy_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            refine_variant(copies[0])
+            threshold_variant(copies[1])
+        variant_seconds = time.perf_counter() - start
+        rss_mib = (read_rss_kb() - rss_kb) / 1024
+        print(f"{strategy:>10} {copy_seconds:>7.2f}s {variant_seconds:>8.2f}s {rss_mib:>6.0f} MiB")
+        if strategy == "fork":
+            for variant in copies:
+                start = time.perf_counter()
+                changes = diff_datasets(dataset, variant)
+                seconds = time.perf_counter() - start
+                print(f"{'diff':>10} {seconds:>7.2f}s {dict(count_changes(changes))}")
+
+def main(num_annotations):
+    print(f"{num_annotations} annotations, two copies of the processed dataset with a variant on each")
+    print(f"{'strategy':>10} {'copy':>8} {'variants':>9} {'memory':>10}")
+    for strategy in STRATEGIES:
+        # Each strategy runs in a fresh process so that its memory is measured on its own
+        result = subprocess.run([sys.executable, "-m", "benchmark.snapshot", strategy, str(num_annotations)],
+                                capture_output=True, text=True, check=True)
+        print(result.stdout, end="")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.snapshot
+    if len(sys.argv) == 3:
+        run(sys.argv[1], int(sys.argv[2]))
+    else:
+        main(num_annotations=500_000)
@@ -0,0 +1,188 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import contextlib
+
+import verify
+import processing
+from dataset.dataset import Dataset
+from dataset.codec import DEFAULT_CODEC
+from benchmark.generate import MarineDetGenerator
+
+# suite_<commit>.json files are written there, to compare commits with compare()
+RESULTS_DIR = "./data/benchmark"
+
+def read_status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+class Recorder:
+    def __init__(self):
+        self.steps = []
+
+    def measure(self, group, name, func, items=None):
+        # Wall time, CPU time and peak RSS growth of func(), with its prints silenced
+        can_reset = reset_peak_rss()
+        rss_kb = read_status_kb("VmRSS")
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        peak_kb = max(0, read_status_kb("VmHWM") - rss_kb) if can_reset else None
+        self.steps.append({
+            "group": group,
+            "name": name,
+            "seconds": round(seconds, 4),
+            "cpu_seconds": round(cpu_seconds, 4),
+            "peak_rss_mib": None if peak_kb is None else round(peak_kb / 1024, 1),
+            "items": items,
+        })
+        print(f"{group:>10} {name:>32} {seconds:>9.3f}s {'' if peak_kb is None else f'{peak_kb / 1024:>8.1f} MiB'}")
+        return result
+
+def run_processing(recorder, dataset, analysis_path):
+    # The steps processing.main fuses into its pipeline, one at a time
+    steps = [
+        ("process_category", processing.process_category),
+        ("process_caption", processing.process_caption),
+        ("define_category_id", processing.define_category_id),
+        ("rearrange_ids", processing.rearrange_ids),
+        ("clean_small_bbox_label", processing.clean_small_bbox_label),
+        ("clean_small_bbox_negative_tags", processing.clean_small_bbox_negative_tags),
+        ("category_analysis", lambda dataset: processing.category_analysis(dataset, analysis_path)),
+    ]
+    num_annotations = len(dataset.get_all_annotations())
+    for name, step in steps:
+        recorder.measure("processing", name, lambda: step(dataset), num_annotations)
+    recorder.measure("processing", "build_pipeline (fused)", lambda: processing.build_pipeline(analysis_path).run(dataset), num_annotations)
+
+def run_verify(recorder, dataset):
+    checks = [
+        ("check_image_id", verify.check_image_id),
+        ("check_annotation_id", verify.check_annotation_id),
+        ("check_image_annotation_id", verify.check_image_annotation_id),
+        ("check_image_filename", verify.check_image_filename),
+        ("check_category", verify.check_category),
+        ("check_segmentation", verify.check_segmentation),
+        ("check_caption", verify.check_caption),
+        ("check_double_space", verify.check_double_space),
+        ("check_small_bbox_caption", verify.check_small_bbox_caption),
+        ("check_small_bbox_label", verify.check_small_bbox_label),
+        ("check_small_bbox_negative_tags", verify.check_small_bbox_negative_tags),
+        ("check_overlap", verify.check_overlap),
+        ("count_small_bbox", verify.count_small_bbox),
+    ]
+    num_annotations = len(dataset.get_all_annotations())
+    for name, check in checks:
+        recorder.measure("verify", name, lambda: check(dataset), num_annotations)
+    recorder.measure("verify", "validator", lambda: verify.build_validator().run(dataset), num_annotations)
+
+def run_size(num_annotations, seed, output_path):
+    recorder = Recorder()
+    generator = MarineDetGenerator(num_annotations, seed)
+    text = json.dumps(generator.make_json())
+    # A refine_small_bbox folder: small bboxes only, on the first tenth of the images
+    small_generator = MarineDetGenerator(max(1, num_annotations // 20), seed + 1, small_bbox_ratio=1.0,
+                                         num_images=max(1, generator.num_images // 10))
+    small_text = json.dumps(small_generator.make_json())
+
+    json_data = recorder.measure("load", "json.loads", lambda: json.loads(text), num_annotations)
+    # The parser the scripts use, which is orjson when it is installed
+    recorder.measure("load", "codec.loads", lambda: DEFAULT_CODEC.loads(text), num_annotations)
+    del text
+    dataset = recorder.measure("load", "Dataset", lambda: Dataset(json_data), num_annotations)
+    recorder.measure("load", "Dataset (lazy)", lambda: Dataset(json.loads(small_text), lazy=True), small_generator.num_annotations)
+    small_dataset = Dataset(json.loads(small_text))
+    recorder.measure("combine", "append_dataset", lambda: dataset.append_dataset(small_dataset), small_generator.num_annotations)
+
+    num_annotations = len(dataset.get_all_annotations())
+    run_processing(recorder, dataset, output_path + ".category_analysis.txt")
+    run_verify(recorder, dataset)
+
+    output_json = recorder.measure("serialize", "to_json", dataset.to_json, num_annotations)
+    recorder.measure("serialize", "json.dumps", lambda: json.dumps(output_json), num_annotations)
+    recorder.measure("serialize", "codec.dumps", lambda: DEFAULT_CODEC.dumps(output_json), num_annotations)
+    os.remove(output_path + ".category_analysis.txt")
+    return recorder.steps
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_path, new_path):
+    # Ratio of the new time to the old one for every step both results have
+    with open(old_path, 'r', encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    for size, new_steps in new["sizes"].items():
+        old_steps = {(step["group"], step["name"]): step for step in old["sizes"].get(size, [])}
+        print(f"{size} annotations")
+        for step in new_steps:
+            old_step = old_steps.get((step["group"], step["name"]))
+            if old_step is None:
+                continue
+            ratio = step["seconds"] / old_step["seconds"] if old_step["seconds"] else float("nan")
+            print(f"{step['group']:>10} {step['name']:>32} {old_step['seconds']:>9.3f}s {step['seconds']:>9.3f}s {ratio:>6.2f}x")
+
+def main(sizes, seed, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    commit = get_commit()
+    results = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "sizes": {},
+    }
+    for size in sizes:
+        print(f"{size} annotations")
+        # Each size is measured in a fresh process, so that the memory of a step is not hidden by
+        # what an earlier, larger run left allocated
+        steps_path = os.path.join(results_dir, f"steps_{size}.json")
+        subprocess.run([sys.executable, "-m", "benchmark.suite", "run", str(size), str(seed), steps_path], check=True)
+        with open(steps_path, 'r', encoding="utf-8") as f:
+            results["sizes"][str(size)] = json.load(f)
+        os.remove(steps_path)
+
+    output_path = os.path.join(results_dir, f"suite_{commit}.json")
+    with open(output_path, 'w', encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.suite
+    # python -m benchmark.suite <old results.json> <new results.json> compares two runs
+    if len(sys.argv) == 5 and sys.argv[1] == "run":
+        size, seed, steps_path = int(sys.argv[2]), int(sys.argv[3]), sys.argv[4]
+        steps = run_size(size, seed, steps_path)
+        with open(steps_path, 'w', encoding="utf-8") as f:
+            json.dump(steps, f)
+    elif len(sys.argv) == 3:
+        compare(sys.argv[1], sys.argv[2])
+    else:
+        # From 1_000 up to 10_000_000 annotations, memory permitting
+        main(sizes=[1_000, 100_000], seed=0)
@@ -0,0 +1,41 @@
+import io
+import os
+import time
+import contextlib
+
+import verify
+from dataset.dataset import Dataset
+from benchmark.load_dataset import make_synthetic_json
+
+def run_checks(dataset):
+    # The checks verify.main used to run, one pass over the dataset each
+    verify.check_small_bbox_caption(dataset)
+    verify.check_image_id(dataset)
+    verify.check_annotation_id(dataset)
+    verify.check_image_annotation_id(dataset)
+    verify.check_image_filename(dataset)
+    verify.check_category(dataset)
+    verify.check_caption(dataset)
+    verify.check_double_space(dataset)
+    verify.check_small_bbox_label(dataset)
+    verify.check_small_bbox_negative_tags(dataset)
+    verify.count_small_bbox(dataset)
+
+def main(num_annotations, process_counts):
+    dataset = Dataset(make_synthetic_json(num_annotations))
+    validator = verify.build_validator()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        run_checks(dataset)
+    print(f"{'separate checks':>20}: {time.perf_counter() - start:.2f}s")
+
+    for processes in process_counts:
+        start = time.perf_counter()
+        report = validator.run(dataset, processes)
+        print(f"{f'validator, {processes} proc':>20}: {time.perf_counter() - start:.2f}s, {len(report.violations)} violations")
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m benchmark.verify
+    main(num_annotations=1_000_000, process_counts=sorted({1, 2, os.cpu_count()}))
@@ -1,27 +1,106 @@
 import os
-import json
 
-from dataset.dataset import Dataset, Image, Annotation
+from dataset import trace
+from dataset.dataset import Dataset, Image, Annotation, FieldProjection, ProjectionError, normalize_category
+from dataset.stream import StreamingDataset, iter_json_items, write_json
+from dataset.cache import load_json
+from dataset.codec import DEFAULT_CODEC, get_codec, open_file
+
+# The segmentations are replaced with [] while the file is read, so the polygons are never parsed
+SEGMENTATION_PROJECTION = FieldProjection(clear=("segmentation",))
 
 def clear_segmentation(dataset):
     for annotation in dataset.get_all_annotations():
         annotation.set_segmentation([])
     return dataset
 
-def main(json_path:str):
-    with open(json_path, 'r', encoding="utf-8") as f:
-        print(f"Loading {json_path}")
-        json_data = json.load(f)
+def iter_cleared_images(dataset):
+    for image in dataset.get_images():
+        for annotation in image.get_annotations():
+            annotation.set_segmentation([])
+        yield image
+
+def rewrite_cleared(json_path, output_path, codec=DEFAULT_CODEC):
+    # Copy json_path to output_path with every segmentation cleared, one item at a time and
+    # without grouping the annotations by image. This gives the same file as the other paths
+    # when json_path is in the order Dataset.to_json writes: the images first, each image id
+    # once, and the annotations grouped by image in image order. Returns False as soon as it
+    # is not (or when another field named segmentation was cleared), leaving output_path incomplete.
+    item_separator = codec.item_separator.encode()
+    key_separator = codec.key_separator.encode()
+    annotations_start = b"]" + item_separator + codec.dumps("annotations") + key_separator + b"["
+    # Key is the image id, value is the position of the image
+    positions = {}
+    last_position = 0
+    num_annotations = 0
+    with open_file(output_path, 'wb') as f:
+        f.write(b"{" + codec.dumps("images") + key_separator + b"[")
+        try:
+            for key, value, _, _ in iter_json_items(json_path, projection=SEGMENTATION_PROJECTION):
+                if key == "images":
+                    if num_annotations or value["id"] in positions:
+                        return False
+                    f.write(item_separator if positions else b"")
+                    positions[value["id"]] = len(positions)
+                    f.write(codec.dumps(value))
+                elif key == "annotations":
+                    position = positions.get(value["image_id"])
+                    if position is None or position < last_position:
+                        return False
+                    last_position = position
+                    # As Annotation does on creation
+                    value["category"] = normalize_category(value["category"])
+                    value["segmentation"] = []
+                    f.write(item_separator if num_annotations else annotations_start)
+                    f.write(codec.dumps(value))
+                    num_annotations += 1
+        except ProjectionError:
+            # A segmentation of an image or of a nested record was cleared too
+            return False
+        f.write(b"]}" if num_annotations else annotations_start + b"]}")
+    trace.info(f"Wrote {len(positions)} images and {num_annotations} annotations")
+    return True
+
+def get_output_path(json_path):
+    return json_path.replace(".json", "_cleaned.json")
+
+def main(json_path:str, stream=False, cache=False, codec=DEFAULT_CODEC):
+    output_path = get_output_path(json_path)
+    if stream:
+        trace.info(f"Streaming {json_path} to {output_path}")
+        if rewrite_cleared(json_path, output_path, codec):
+            return
+        trace.info(f"{json_path} cannot be rewritten one item at a time, regrouping its annotations by image")
+        dataset = StreamingDataset(json_path, codec)
+        write_json(output_path, iter_cleared_images(dataset), codec)
+        dataset.close()
+        return
+
+    trace.info(f"Loading {json_path}")
+    json_data = load_json(json_path, cache, SEGMENTATION_PROJECTION, codec)
+
+    dataset = Dataset(json_data, lazy=True)
 
-    dataset = Dataset(json_data)
+    # Only the segmentations that are not arrays of numbers (such as RLE) are left to clear
+    write_cleared(dataset, output_path, codec)
 
+def write_cleared(dataset, output_path, codec=DEFAULT_CODEC):
+    # Clears the segmentations of dataset itself before writing it
     clear_segmentation(dataset)
-    output_path = json_path.replace(".json", "_cleaned.json")
-    with open(output_path, 'w', encoding="utf-8") as f:
-        print(f"Writing to {output_path}")
-        json.dump(dataset.to_json(), f)
+    trace.info(f"Writing to {output_path}")
+    codec.dump(dataset.to_json(), output_path)
 
 
 if __name__ == "__main__":
     json_path = "./data/combined_processed.json"
-    main(json_path)
\ No newline at end of file
+    # Rewrite the file in a single pass over it, image by image, instead of loading it all
+    stream = False
+    # Keep a binary snapshot of the parsed file next to it, reused while the file is unchanged.
+    # It takes up to twice the size of the file on disk (see dataset.cache).
+    cache = False
+    # The JSON parser and serializer: orjson when it is installed, json otherwise. Output is
+    # compact either way; get_codec("json", compact=False) writes the spaced json.dumps layout.
+    # A json_path ending in .gz (or .zst, with zstandard installed) is read and written
+    # compressed, but cannot be regrouped by the stream path when its annotations need it.
+    codec = get_codec()
+    main(json_path, stream, cache, codec)
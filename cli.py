@@ -0,0 +1,138 @@
+import time
+import argparse
+
+import combine
+import processing
+import verify
+import extract_category
+import clean_segmentation
+from dataset import trace
+from dataset.cache import load_dataset
+from dataset.remap import IdRemap
+from dataset.small_bbox import SmallBboxFilter, SMALL_BBOX_AREA
+from dataset.overlap import OVERLAP_THRESHOLD
+from dataset.codec import get_codec
+
+# Runs several steps of the workflow in one process, e.g. all of them:
+#   python cli.py combine process verify categories clean-seg
+# The dataset is loaded once, by combine or from --json-path, and handed from command to command
+# in memory instead of every script parsing the file the previous one wrote. Each command still
+# writes its output file, and the time of every command is printed at the end.
+COMMANDS = ("combine", "process", "verify", "categories", "clean-seg")
+
+
+class Session:
+    # The dataset handed from command to command, and the file it was read from or last written to
+    def __init__(self, args):
+        self.args = args
+        self.codec = get_codec(args.codec)
+        self.small_bbox_filter = SmallBboxFilter(args.small_bbox_area)
+        self.json_path = args.json_path
+        self.dataset = None
+
+    def get_dataset(self):
+        if self.dataset is None:
+            trace.info(f"Loading {self.json_path}")
+            with trace.span("load", "io", path=self.json_path):
+                self.dataset = load_dataset(self.json_path, cache=self.args.cache, codec=self.codec)
+        return self.dataset
+
+
+def run_combine(session):
+    args = session.args
+    remap = IdRemap(args.main_json_path)
+    # Read ahead as combine.py does
+    dataset = combine.load_merged_dataset(args.main_json_path, args.small_bbox_folder, processes=args.processes,
+                                          read_ahead=2, read_ahead_bytes=512 * 2 ** 20, codec=session.codec, remap=remap)
+    session.dataset = combine.combine_dataset(dataset, session.small_bbox_filter, args.dedup_threshold, remap)
+    session.json_path = "./data/combined.json"
+    combine.write_combined(session.dataset, session.json_path, session.codec, remap)
+
+def run_process(session):
+    args = session.args
+    output_path = processing.get_output_path(session.json_path)
+    remap = IdRemap(session.json_path)
+    session.dataset = processing.process_dataset(session.get_dataset(), session.small_bbox_filter, processes=args.processes, remap=remap)
+    processing.write_processed(session.dataset, session.json_path, codec=session.codec, remap=remap)
+    session.json_path = output_path
+
+def run_verify(session):
+    args = session.args
+    verify.verify_dataset(session.get_dataset(), session.small_bbox_filter, args.processes, args.report_path, args.overlap_threshold)
+
+def run_categories(session):
+    extract_category.print_categories(extract_category.get_category_list(session.get_dataset()))
+
+def run_clean_segmentation(session):
+    # clean-seg is the last command, so the segmentations are cleared in the dataset itself
+    output_path = clean_segmentation.get_output_path(session.json_path)
+    clean_segmentation.write_cleared(session.get_dataset(), output_path, session.codec)
+
+COMMAND_FUNCS = {
+    "combine": run_combine,
+    "process": run_process,
+    "verify": run_verify,
+    "categories": run_categories,
+    "clean-seg": run_clean_segmentation,
+}
+
+def get_default_json_path(command):
+    # The file the scripts read when run on their own
+    if command == "process":
+        return "./data/combined.json"
+    return "./data/combined_processed.json"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run steps of the dataset workflow in one process, loading the dataset once.")
+    parser.add_argument("commands", nargs="+", choices=COMMANDS, metavar="command",
+                        help=f"one or more of {', '.join(COMMANDS)}, in this order")
+    parser.add_argument("--json-path", help="the file the first command reads when it is not combine "
+                        "(default: ./data/combined.json for process, ./data/combined_processed.json otherwise)")
+    parser.add_argument("--main-json-path", default="../final_caption_annotations.json", help="the main dataset combine reads")
+    parser.add_argument("--small-bbox-folder", default="../refine_small_bbox/refine_small_bbox", help="the small bbox datasets combine appends")
+    parser.add_argument("--small-bbox-area", type=int, default=SMALL_BBOX_AREA, help="annotations with a smaller bbox area are small bboxes")
+    parser.add_argument("--dedup-threshold", type=float, help="drop the annotations overlapping an earlier one with this IoU in combine")
+    parser.add_argument("--overlap-threshold", type=float, default=OVERLAP_THRESHOLD, help="report the annotations overlapping with this IoU in verify")
+    parser.add_argument("--report-path", default="./data/verify_report.json", help="where verify writes every violation")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes of combine, process and verify (default 1: "
+                        "the pools only pay off with several idle cores)")
+    parser.add_argument("--cache", action="store_true", help="keep a binary snapshot of the file read first, see dataset.cache")
+    parser.add_argument("--codec", choices=("json", "orjson"), help="the JSON parser and serializer (default: orjson when installed)")
+    parser.add_argument("--trace-path", default="./data/cli_trace.json", help="where to write the Chrome trace of the run")
+    args = parser.parse_args(argv)
+
+    if args.commands != sorted(set(args.commands), key=COMMANDS.index):
+        parser.error(f"commands must be given at most once each, in the order {' '.join(COMMANDS)}")
+    if args.json_path is None:
+        args.json_path = get_default_json_path(args.commands[0])
+    return args
+
+def main(args):
+    session = Session(args)
+    timings = []
+    try:
+        with trace.span("cli", "script", commands=args.commands):
+            if args.commands[0] != "combine":
+                start = time.perf_counter()
+                session.get_dataset()
+                timings.append(("load", time.perf_counter() - start))
+            for command in args.commands:
+                trace.info(f"Running {command}")
+                start = time.perf_counter()
+                with trace.span(command, "command"):
+                    COMMAND_FUNCS[command](session)
+                timings.append((command, time.perf_counter() - start))
+    finally:
+        trace.tracer.flush()
+        trace.tracer.write(args.trace_path)
+    print_timings(timings)
+
+def print_timings(timings):
+    trace.info("Time per command:")
+    for name, seconds in timings:
+        trace.info(f"  {name:<12} {seconds:>8.2f}s")
+    trace.info(f"  {'total':<12} {sum(seconds for _, seconds in timings):>8.2f}s")
+
+
+if __name__ == "__main__":
+    main(parse_args())
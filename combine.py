@@ -1,67 +1,237 @@
 import os
-import json
+import functools
+import multiprocessing
+from dataset import trace
 from dataset.dataset import Dataset, Image, Annotation
+from dataset.pipeline import Pipeline
+from dataset.stream import StreamingDataset
+from dataset.small_bbox import SmallBboxFilter, DEFAULT_SMALL_BBOX_FILTER
+from dataset.shard import Sharding, write_shards
+from dataset.overlap import OVERLAP_THRESHOLD, get_redundant_annotations
+from dataset.prefetch import PrefetchReader
+from dataset.codec import DEFAULT_CODEC, get_codec
+from dataset.remap import IdRemap, get_remap_path
     
 
-def remove_small_bbox_caption(dataset):
-    for image in dataset.get_images():
-        for annotation in image.get_annotations():
-            if annotation.get_area() < 1024:
-                annotation.set_caption("")
+def remove_small_bbox_caption(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    return small_bbox_filter.clear_captions(dataset)
+
+def remove_overlapping_annotations(dataset, threshold=OVERLAP_THRESHOLD):
+    # Drop every annotation that duplicates or overlaps an earlier one of its image and category,
+    # such as a refine_small_bbox annotation of an object the main dataset already has
+    dropped = get_redundant_annotations(dataset.get_images(), threshold)
+    dataset.remove_annotations(dropped)
+    trace.info(f"Removed {len(dropped)} duplicate or overlapping annotations.")
     return dataset
 
-def rearrange_ids(dataset):
-    # Rearrange annotation ids
-    for i, anno in enumerate(dataset.get_all_annotations()):
-        anno.json_data["id"] = i + 1
-    
-    # Rearrange image ids and the corresponding annotation ids
-    for i, image in enumerate(dataset.get_images()):
-        image.json_data["id"] = i + 1
-        for anno in image.get_annotations():
-            anno.json_data["image_id"] = i + 1
+def build_pipeline(small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, stage_timing=False, dedup_threshold=None, remap=None):
+    # remove_overlapping_annotations when dedup_threshold is given, rearrange_ids and
+    # remove_small_bbox_caption, one image at a time. The old ids are recorded in remap.
+    if remap is None:
+        remap = IdRemap()
+    num_dropped = 0
 
-    return dataset
+    def remove_overlapping(image):
+        nonlocal num_dropped
+        dropped = {id(anno_data) for anno_data in get_redundant_annotations([image], dedup_threshold)}
+        if dropped:
+            image.set_annotations([annotation for annotation in image.get_annotations() if id(annotation.json_data) not in dropped])
+            num_dropped += len(dropped)
+
+    def report_dropped(dataset):
+        trace.info(f"Removed {num_dropped} duplicate or overlapping annotations.")
+
+    def remove_caption(image):
+        for annotation, small in zip(image.get_annotations(), small_bbox_filter.image_mask(image)):
+            if small:
+                annotation.set_caption("")
+
+    pipeline = Pipeline(stage_timing)
+    if dedup_threshold is not None:
+        pipeline.add_image_stage("remove_overlapping_annotations", remove_overlapping, finish=report_dropped)
+    pipeline.add_image_stage("rearrange_ids", remap.renumber_image)
+    pipeline.add_image_stage("remove_small_bbox_caption", remove_caption)
+    return pipeline
 
 def check_small_dataset_have_caption(dataset):
     for annotation in dataset.get_all_annotations():
         if "caption" not in annotation.json_data:
-            print(f"Annotation id {annotation.get_id()} does not have caption.")
-            annotation.json_data["caption"] = "undefined"
+            trace.warning(f"Annotation id {annotation.get_id()} does not have caption.", key="missing caption")
+            annotation.set_field("caption", "undefined")
         assert annotation.get_caption()  == "undefined", "Small bbox dataset should not have caption."
 
-def main(main_json_path, small_bbox_folder):
+def load_small_bbox_dataset(json_file, codec=DEFAULT_CODEC):
+    with trace.span("load small bbox dataset", "io", path=json_file):
+        trace.info(f"Reading {json_file}...")
+        json_data = codec.load(json_file)
+    dataset = Dataset(json_data)
+    check_small_dataset_have_caption(dataset)
+    return dataset
+
+def parse_small_bbox_datasets(reader, codec=DEFAULT_CODEC):
+    # The small bbox datasets of the files read by a PrefetchReader, in order. The time the
+    # consumer takes between two datasets, merging the previous one, is recorded as "merge".
+    for json_file, data, timing in reader:
+        with timing.measure("parse"), trace.span("parse small bbox dataset", "io", path=json_file):
+            trace.info(f"Parsing {json_file}...")
+            dataset = Dataset(codec.loads(data))
+            check_small_dataset_have_caption(dataset)
+        with timing.measure("merge"):
+            yield dataset
+
+def load_small_bbox_batches(json_file, codec=DEFAULT_CODEC):
+    # Runs in a worker process. Only the file name and the annotation dicts of every image
+    # are sent back, which is all append_dataset needs.
+    dataset = load_small_bbox_dataset(json_file, codec)
+    return [(image.get_filename(), [annotation.json_data for annotation in image.get_annotations()])
+            for image in dataset.get_images()]
+
+def batches_to_dataset(batches):
+    dataset = Dataset({"images": [], "annotations": []})
+    dataset.set_images([Image({"file_name": filename}, anno_datas) for filename, anno_datas in batches])
+    return dataset
+
+def write_dropped_images(dropped_images, output_path):
+    # One line per image that was not merged: source file;file name;number of annotations
+    trace.info(f"Writing {len(dropped_images)} dropped images to {output_path}")
+    with open(output_path, 'w', encoding="utf-8") as f:
+        for json_file, image in dropped_images:
+            f.write(f"{json_file};{image.get_filename()};{len(image.get_annotations())}\n")
+
+def load_main_dataset(main_json_path, stream, codec=DEFAULT_CODEC):
+    if stream:
+        # Only the small bbox datasets are loaded, the main dataset is read image by image
+        trace.info(f"Streaming {main_json_path}...")
+        return StreamingDataset(main_json_path, codec)
 
-    with open(main_json_path, 'r', encoding="utf-8") as f:
-        print(f"Reading {main_json_path}...")
-        main_json_data = json.load(f)
+    with trace.span("load main dataset", "io", path=main_json_path):
+        trace.info(f"Reading {main_json_path}...")
+        main_json_data = codec.load(main_json_path)
 
     main_dataset = Dataset(main_json_data)
 
-    print(f"There are in total {len(main_dataset.get_images())} images and {len(main_dataset.get_all_annotations())} annotations in the main dataset.")
+    trace.info(f"There are in total {len(main_dataset.get_images())} images and {len(main_dataset.get_all_annotations())} annotations in the main dataset.")
+    return main_dataset
+
+def merge_datasets(main_dataset, json_files, datasets, remap=None):
+    # Append the datasets loaded from json_files, returning the (json_file, image) of every image
+    # not merged. The merged annotations are added to remap as coming from their json_file.
+    dropped_images = []
+    for json_file, dataset in zip(json_files, datasets):
+        trace.info(f"Adding {len(dataset.get_images())} images and {len(dataset.get_all_annotations())} annotations from {json_file}.")
+        dropped = main_dataset.append_dataset(dataset)
+        if remap is not None:
+            dropped_ids = {id(image) for image in dropped}
+            remap.add_source(json_file, [annotation for image in dataset.get_images() if id(image) not in dropped_ids
+                                         for annotation in image.get_annotations()])
+        if dropped:
+            trace.info(f"Dropped {len(dropped)} images of {json_file} that are not in the main dataset.")
+        dropped_images.extend((json_file, image) for image in dropped)
+    return dropped_images
+
+def main(main_json_path, small_bbox_folder, stream=False, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, processes=1, trace_path=None, stage_timing=False, sharding=None, dedup_threshold=None, read_ahead=2, read_ahead_bytes=None, codec=DEFAULT_CODEC):
+    # The spans of the worker processes are not traced
+    try:
+        with trace.span("combine", "script", path=main_json_path):
+            combine_files(main_json_path, small_bbox_folder, stream, small_bbox_filter, processes, stage_timing, sharding, dedup_threshold, read_ahead, read_ahead_bytes, codec)
+    finally:
+        trace.tracer.flush()
+        if trace_path is not None:
+            trace.tracer.write(trace_path)
+
+def combine_files(main_json_path, small_bbox_folder, stream, small_bbox_filter, processes, stage_timing, sharding, dedup_threshold, read_ahead, read_ahead_bytes, codec):
+    if stream and sharding is not None:
+        raise ValueError("Sharded output needs the whole dataset, it cannot be streamed")
+    # The old ids of the combined dataset, written next to it. The annotations of every small
+    # bbox dataset keep their ids apart, as they overlap those of the main dataset.
+    remap = IdRemap(main_json_path)
+    main_dataset = load_merged_dataset(main_json_path, small_bbox_folder, stream, processes, read_ahead, read_ahead_bytes, codec, remap)
+
+    if stream:
+        num_images, num_annotations = build_pipeline(small_bbox_filter, stage_timing, dedup_threshold, remap).run_streaming(main_dataset, "./data/combined.json", codec=codec, ensure_ascii=False)
+        main_dataset.close()
+        remap.save(get_remap_path("./data/combined.json"))
+        trace.info(f"There are in total {num_images} images and {num_annotations} annotations in the combined dataset.")
+        return
+
+    main_dataset = combine_dataset(main_dataset, small_bbox_filter, dedup_threshold, remap)
+    if sharding is not None:
+        # The category ids are only defined by processing.py, so the categories table is left empty
+        write_shards(main_dataset, "./data/combined", sharding, [], processes, ensure_ascii=False, codec=codec)
+        remap.save(get_remap_path("./data/combined"))
+        return
+    write_combined(main_dataset, "./data/combined.json", codec, remap)
+
+def load_merged_dataset(main_json_path, small_bbox_folder, stream=False, processes=1, read_ahead=2, read_ahead_bytes=None, codec=DEFAULT_CODEC, remap=None):
+    # The main dataset with the small bbox datasets appended, a StreamingDataset when stream is True
     additional_json_files = []
     for folder_name in os.listdir(small_bbox_folder):
         json_file = os.path.join(small_bbox_folder, folder_name, "annotations.json")
         additional_json_files.append(json_file)
 
-    for json_file in additional_json_files:
-        with open(json_file, 'r', encoding="utf-8") as f:
-            print(f"Reading {json_file}...")
-            json_data = json.load(f)
-        dataset = Dataset(json_data)
-        check_small_dataset_have_caption(dataset)
-        print(f"Adding {len(dataset.get_images())} images and {len(dataset.get_all_annotations())} annotations from {json_file}.")
-        main_dataset.append_dataset(dataset)
-    
-    main_dataset = rearrange_ids(main_dataset)
-    main_dataset = remove_small_bbox_caption(main_dataset)
+    # The datasets are merged in the order of additional_json_files either way
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            # The workers start parsing the small bbox datasets while the main dataset is loaded
+            small_bbox_batches = pool.imap(functools.partial(load_small_bbox_batches, codec=codec), additional_json_files)
+            main_dataset = load_main_dataset(main_json_path, stream, codec)
+            small_bbox_datasets = (batches_to_dataset(batches) for batches in small_bbox_batches)
+            dropped_images = merge_datasets(main_dataset, additional_json_files, small_bbox_datasets, remap)
+    else:
+        with PrefetchReader(additional_json_files, read_ahead, read_ahead_bytes) as reader:
+            # The first small bbox datasets are read while the main dataset is loaded, and
+            # each next one while the current one is parsed and merged
+            main_dataset = load_main_dataset(main_json_path, stream, codec)
+            dropped_images = merge_datasets(main_dataset, additional_json_files, parse_small_bbox_datasets(reader, codec), remap)
+        reader.print_timings()
+    write_dropped_images(dropped_images, "./data/dropped_images.txt")
+    return main_dataset
+
+def combine_dataset(main_dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, dedup_threshold=None, remap=None):
+    if dedup_threshold is not None:
+        with trace.span("remove_overlapping_annotations", "stage"):
+            main_dataset = remove_overlapping_annotations(main_dataset, dedup_threshold)
+    with trace.span("rearrange_ids", "stage"):
+        main_dataset = (IdRemap() if remap is None else remap).renumber(main_dataset)
+    with trace.span("remove_small_bbox_caption", "stage"):
+        main_dataset = remove_small_bbox_caption(main_dataset, small_bbox_filter)
+
+    trace.info(f"There are in total {len(main_dataset.get_images())} images and {len(main_dataset.get_all_annotations())} annotations in the combined dataset.")
+    return main_dataset
 
-    print(f"There are in total {len(main_dataset.get_images())} images and {len(main_dataset.get_all_annotations())} annotations in the combined dataset.")
-    with open("./data/combined.json", 'w', encoding="utf-8") as f:
-        json.dump(main_dataset.to_json(), f, ensure_ascii=False)
+def write_combined(dataset, output_path, codec=DEFAULT_CODEC, remap=None):
+    with trace.span("write", "io", path=output_path):
+        codec.dump(dataset.to_json(), output_path, ensure_ascii=False)
+    if remap is not None:
+        remap.save(get_remap_path(output_path))
 
 
 if __name__ == "__main__":
     json_path = "../final_caption_annotations.json"
     small_bbox_folder = "../refine_small_bbox/refine_small_bbox"
-    main(json_path, small_bbox_folder)
\ No newline at end of file
+    # Read the main dataset image by image instead of loading it all
+    stream = False
+    # Annotations with a bbox area below SMALL_BBOX_AREA (1024 pixels) get their caption removed
+    small_bbox_filter = SmallBboxFilter()
+    # Parse the small bbox datasets in this many worker processes
+    processes = os.cpu_count()
+    # With a single process, read this many small bbox datasets ahead in background threads,
+    # holding at most read_ahead_bytes of them in memory when it is not None. The read, wait,
+    # parse and merge time of every file is logged: waits well above 0 call for a larger window.
+    read_ahead = 2
+    read_ahead_bytes = 512 * 2 ** 20
+    # Write a Chrome trace of the run (open it in chrome://tracing or ui.perfetto.dev); None to skip it
+    trace_path = "./data/combine_trace.json"
+    # Also time every call of every stage of the streamed pipeline, which makes it slower
+    stage_timing = False
+    # Write the combined dataset as shards in ./data/combined/ (with a manifest.json) instead of
+    # one file, e.g. Sharding(num_shards=8); None for the combined.json processing.py reads
+    sharding = None
+    # Drop the annotations that duplicate or overlap (IoU >= dedup_threshold) an earlier one of
+    # their image and category, e.g. OVERLAP_THRESHOLD; None keeps them all
+    dedup_threshold = None
+    # The JSON parser and serializer: orjson when it is installed, json otherwise. Output is
+    # compact either way; get_codec("json", compact=False) writes the spaced json.dump layout.
+    # A json_path ending in .gz (or .zst, with zstandard installed) is decompressed as it is read
+    codec = get_codec()
+    main(json_path, small_bbox_folder, stream, small_bbox_filter, processes, trace_path, stage_timing, sharding, dedup_threshold, read_ahead, read_ahead_bytes, codec)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import re
+import collections
+import multiprocessing
+
+from dataset.pipeline import paused_gc
+
+# The artifacts verify.rule_caption reports, as (rule name, pattern, replacement)
+CAPTION_RULES = (
+    ("image_token", r"<image>", " "),
+    ("description_prefix", r"description:", " "),
+)
+# Distinct captions are normalized in a pool of processes from this many on, BATCH_SIZE at a time,
+# when prepare is given processes > 1. Sending the captions to the workers and back costs about
+# as much as normalizing them, so the pool only pays off with several idle cores.
+PARALLEL_MIN_CAPTIONS = 100_000
+BATCH_SIZE = 20_000
+
+
+class CaptionNormalizer:
+    # Normalizes captions with a compiled rule set: the substitutions of rules, then every run of
+    # whitespace collapsed to one space and the ends stripped. Captions of small bboxes are
+    # cleared. Every distinct caption is normalized once, and the number of annotations each
+    # rule changed is kept for a summary.
+    def __init__(self, rules=CAPTION_RULES):
+        # A pattern without special characters is replaced with str.replace, a few times faster
+        # than a regular expression. literal is None for the others.
+        self.rules = [(pattern if is_literal(pattern, replacement) else None, re.compile(pattern), replacement)
+                      for _, pattern, replacement in rules]
+        self.literals = [literal for literal, _, _ in self.rules if literal is not None]
+        # Most captions match no rule, looking for the literals (or one search for all the
+        # patterns, when a rule is not a literal) skips the substitutions
+        self.any_rule = re.compile("|".join(f"(?:{pattern})" for _, pattern, _ in rules)) if rules else None
+        self.rule_names = [name for name, _, _ in rules] + ["whitespace", "small_bbox"]
+        # Key is the raw caption, value is the normalized caption and the indexes of the rules that changed it
+        self.cache = {}
+        # Key is the rule name, value is the number of annotations it changed
+        self.counts = {name: 0 for name in self.rule_names}
+
+    def normalize_text(self, caption):
+        return self.normalize_texts([caption])[0]
+
+    def normalize_texts(self, captions):
+        # The normalized caption and the indexes of the rules that changed it, for every caption
+        literals = self.literals
+        all_literal = len(literals) == len(self.rules)
+        whitespace = (len(self.rules),)
+        results = []
+        for caption in captions:
+            if all_literal:
+                matched = False
+                for literal in literals:
+                    if literal in caption:
+                        matched = True
+                        break
+            else:
+                matched = self.any_rule.search(caption) is not None
+            # str.split without arguments splits on runs of any whitespace and drops the ends
+            if not matched:
+                result = " ".join(caption.split())
+                results.append((result, () if result == caption else whitespace))
+            else:
+                results.append(self.apply_rules(caption))
+        return results
+
+    def apply_rules(self, caption):
+        changed = []
+        for i, (literal, pattern, replacement) in enumerate(self.rules):
+            result = caption.replace(literal, replacement) if literal is not None else pattern.sub(replacement, caption)
+            if result != caption:
+                changed.append(i)
+                caption = result
+        result = " ".join(caption.split())
+        if result != caption:
+            changed.append(len(self.rules))
+        return result, tuple(changed)
+
+    def prepare(self, captions, processes=1):
+        # Normalize the distinct captions that are not cached yet, split into batches across
+        # processes when there are many of them. The counts are left to normalize.
+        distinct = [caption for caption in dict.fromkeys(captions) if type(caption) is str and caption not in self.cache]
+        if processes > 1 and len(distinct) >= PARALLEL_MIN_CAPTIONS and "fork" in multiprocessing.get_all_start_methods():
+            batches = [distinct[start:start + BATCH_SIZE] for start in range(0, len(distinct), BATCH_SIZE)]
+            global _worker_normalizer
+            _worker_normalizer = self
+            try:
+                with multiprocessing.get_context("fork").Pool(processes) as pool:
+                    results = pool.map(normalize_batch, batches)
+            finally:
+                _worker_normalizer = None
+            for batch, batch_results in zip(batches, results):
+                self.cache.update(zip(batch, batch_results))
+        else:
+            self.cache.update(zip(distinct, self.normalize_texts(distinct)))
+
+    def normalize(self, caption, count=1, small=False):
+        # The normalized caption, counting count annotations for every rule that changed it
+        if small:
+            if caption != "":
+                self.counts["small_bbox"] += count
+            return ""
+        if type(caption) is not str:
+            return caption
+        result = self.cache.get(caption)
+        if result is None:
+            result = self.cache[caption] = self.normalize_text(caption)
+        for i in result[1]:
+            self.counts[self.rule_names[i]] += count
+        return result[0]
+
+    def normalize_annotation(self, annotation, small=False):
+        annotation.set_field("caption", self.normalize(annotation.json_data["caption"], small=small))
+
+    def apply(self, dataset, small_bbox_filter, processes=1):
+        mask = small_bbox_filter.get_mask(dataset)
+        if hasattr(dataset, "store"):
+            # Every distinct caption is normalized and counted once, then written to its rows
+            column = dataset.store.objects["caption"]
+            rows = dataset.get_rows()
+            large_rows = [row for row in rows[~mask].tolist() if type(column[row]) is str]
+            occurrences = collections.Counter(column[row] for row in large_rows)
+            self.prepare(occurrences, processes)
+            results = {caption: self.normalize(caption, count) for caption, count in occurrences.items()}
+            for row in large_rows:
+                column[row] = results[column[row]]
+            small_rows = rows[mask].tolist()
+            self.counts["small_bbox"] += sum(1 for row in small_rows if column[row] != "")
+            dataset.fill(mask, "caption", "")
+            return dataset
+
+        with paused_gc():
+            annotations = dataset.get_all_annotations()
+            self.prepare((annotation.json_data["caption"] for annotation, small in zip(annotations, mask) if not small), processes)
+            for annotation, small in zip(annotations, mask):
+                self.normalize_annotation(annotation, small)
+        return dataset
+
+    def print_summary(self):
+        print("Normalized captions, annotations changed by each rule:")
+        for name, count in self.counts.items():
+            print(f"{name}: {count}")
+
+
+_worker_normalizer = None
+
+def normalize_batch(captions):
+    # Runs in a worker process, which inherited the normalizer through fork
+    return _worker_normalizer.normalize_texts(captions)
+
+def is_literal(pattern, replacement):
+    # Whether re.sub(pattern, replacement, text) is text.replace(pattern, replacement)
+    return re.escape(pattern) == pattern and "\\" not in replacement
@@ -0,0 +1,66 @@
+from dataset.dataset import normalize_category
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class CategoryNormalizer:
+    # Maps raw category names to canonical ones: strip().lower(), then refine_map applied until
+    # the name is no longer refined (so a -> b and b -> c give a -> c). Every distinct raw
+    # name is resolved once, and the number of annotations refined is kept for a summary.
+    def __init__(self, refine_map):
+        self.refine_map = {normalize_category(category): normalize_category(refined)
+                           for category, refined in refine_map.items()}
+        self.resolved = {category: self.resolve(category) for category in self.refine_map}
+        # Key is the raw category, value is the canonical category
+        self.cache = {}
+        # Key is the raw category, value is the number of annotations changed by normalize
+        self.counts = {}
+
+    def resolve(self, category):
+        chain = [category]
+        while category in self.refine_map and self.refine_map[category] != category:
+            category = self.refine_map[category]
+            if category in chain:
+                raise ValueError(f"Category refinement cycle: {' -> '.join(chain + [category])}")
+            chain.append(category)
+        return category
+
+    def get_canonical(self, category):
+        canonical = self.cache.get(category)
+        if canonical is None:
+            normalized = normalize_category(category)
+            canonical = self.resolved.get(normalized, normalized)
+            self.cache[category] = canonical
+        return canonical
+
+    def normalize(self, category, count=1):
+        # The canonical category, counting count annotations as refined if it differs
+        canonical = self.get_canonical(category)
+        if canonical != category and count:
+            self.counts[category] = self.counts.get(category, 0) + count
+        return canonical
+
+    def normalize_annotation(self, annotation):
+        annotation.set_field("category", self.normalize(annotation.json_data["category"]))
+
+    def apply(self, dataset):
+        if hasattr(dataset, "store"):
+            # Count the rows of every interned category, then remap each category once
+            table = dataset.store.strings["category"]
+            counts = np.bincount(dataset.store.codes["category"][dataset.get_rows()], minlength=len(table))
+            raw_counts = {table[code]: count for code, count in enumerate(counts.tolist()) if count}
+            dataset.remap_categories(lambda category: self.normalize(category, raw_counts.get(category, 0)))
+            return dataset
+
+        for annotation in dataset.get_all_annotations():
+            self.normalize_annotation(annotation)
+        return dataset
+
+    def print_summary(self):
+        total = sum(self.counts.values())
+        print(f"Refined {total} annotations in {len(self.counts)} categories")
+        for category, count in sorted(self.counts.items()):
+            print(f"Refine {category} to {self.cache[category]}: {count}")
@@ -0,0 +1,145 @@
+import os
+import gzip
+import json
+import codecs
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def get_compression(path):
+    # Files ending in .gz and .zst are compressed, whatever comes before (such as .json.gz)
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return None
+
+def open_file(path, mode="rb"):
+    # A binary file object, compressing or decompressing as the extension of path says
+    compression = get_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError(f"{path} is compressed with zstd, which requires the zstandard package")
+        return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+    return open(path, mode)
+
+def decompress(data, compression):
+    # data as read from a file compressed with compression, as get_compression(path) gives it
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("Decompressing zstd requires the zstandard package")
+        # decompressobj does not need the content size in the frame header, which streamed writes leave out
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+def get_temp_path(path):
+    # A name next to path, to write a file or folder that then replaces path with os.replace, so
+    # that a half-written path is never read. Created with open(..., 'xb') or os.mkdir, it gets
+    # the permissions of any new file, where tempfile.mkstemp and mkdtemp only let the owner in.
+    return f"{path}.{os.getpid()}-{os.urandom(4).hex()}.tmp"
+
+def read_bytes(path):
+    with open_file(path, 'rb') as f:
+        return f.read()
+
+def write_bytes(path, data):
+    with open_file(path, 'wb') as f:
+        f.write(data)
+
+def escape_json(error):
+    # Encoding error handler replacing a run of non-ASCII characters with the escapes json.dumps
+    # writes for them (its C encoder, without the quotes it adds)
+    return encode_basestring_ascii(error.object[error.start:error.end])[1:-1], error.end
+
+codecs.register_error("json_escape", escape_json)
+
+def escape_non_ascii(data):
+    # The UTF-8 JSON data with every non-ASCII character escaped, and DEL, as json.dumps does
+    # by default. The encoder finds the characters to escape, which is about twice as fast as
+    # a regular expression, and only calls escape_json for them. DEL is only found in strings.
+    if not data.isascii():
+        data = data.decode("utf-8").encode("ascii", "json_escape")
+    return data.replace(b"\x7f", b"\\u007f")
+
+
+class JsonCodec:
+    # Parses and serializes JSON with the json module. dumps returns UTF-8 bytes, with the
+    # non-ASCII characters escaped unless ensure_ascii=False. With compact=True, there are no
+    # spaces after the separators.
+    name = "json"
+
+    def __init__(self, compact=True):
+        self.compact = compact
+        self.item_separator, self.key_separator = (",", ":") if compact else (", ", ": ")
+        self.encoders = {ensure_ascii: json.JSONEncoder(separators=(self.item_separator, self.key_separator), ensure_ascii=ensure_ascii)
+                         for ensure_ascii in (True, False)}
+
+    def get_name(self):
+        return f"{self.name} ({'compact' if self.compact else 'spaced'})"
+
+    def loads(self, data):
+        # data is bytes or str
+        return json.loads(data)
+
+    def dumps(self, obj, ensure_ascii=True):
+        return self.encoders[ensure_ascii].encode(obj).encode("utf-8")
+
+    def load(self, path):
+        return self.loads(read_bytes(path))
+
+    def dump(self, obj, path, ensure_ascii=True):
+        write_bytes(path, self.dumps(obj, ensure_ascii))
+
+
+class OrjsonCodec(JsonCodec):
+    # orjson, several times faster than json both ways. Its output is always compact, and writes
+    # floats in their shortest form (1e-5 where json writes 1e-05), which parse to the same values.
+    # It does not read NaN and Infinity, which json reads and writes, and would write them as null:
+    # a file with them can only be read with JsonCodec, which also writes them back.
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("OrjsonCodec requires the orjson package")
+        super().__init__(compact=True)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj, ensure_ascii=True):
+        data = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        if ensure_ascii and (not data.isascii() or b"\x7f" in data):
+            return escape_non_ascii(data)
+        return data
+
+
+def get_codec(name=None, compact=True):
+    # The codec called name ("json" or "orjson"), or the fastest one installed when name is None
+    if name is None:
+        name = "orjson" if orjson is not None and compact else "json"
+    if name == "orjson":
+        if not compact:
+            raise ValueError("orjson only writes compact JSON")
+        return OrjsonCodec()
+    if name == "json":
+        return JsonCodec(compact)
+    raise ValueError(f"Unknown JSON codec {name!r}")
+
+
+DEFAULT_CODEC = get_codec()
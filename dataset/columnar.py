@@ -0,0 +1,529 @@
+import itertools
+
+from dataset.dataset import SMALL_BBOX_AREA, normalize_category
+from dataset.remap import NO_ID
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Integer fields kept in int64 columns
+INT_FIELDS = ("id", "image_id", "category_id", "label")
+# String fields with few distinct values, kept as codes into a string table
+INTERNED_FIELDS = ("category", "negative_tags")
+# Every other field (caption, segmentation, ...) is kept as a list with one object per row
+
+MAX_EXACT_INT = 2 ** 53
+MIN_INT64 = -2 ** 63
+MAX_INT64 = 2 ** 63 - 1
+
+BBOX_INT = 0
+BBOX_FLOAT = 1
+
+# Stands for [] in object columns, so that empty segmentations do not cost a list each.
+# JSON has no tuples, and the empty tuple is a singleton that survives marshal (see dataset.cache).
+EMPTY_LIST = ()
+
+
+class InternTable:
+    # Each distinct value is stored once and referred to by its code
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def intern(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+
+def is_int64(value):
+    return type(value) is int and MIN_INT64 <= value <= MAX_INT64
+
+
+def bbox_kind(bbox):
+    # BBOX_INT or BBOX_FLOAT if the bbox round-trips through a float64 row, otherwise None
+    if type(bbox) is not list or len(bbox) != 4:
+        return None
+    if all(type(v) is int and -MAX_EXACT_INT < v < MAX_EXACT_INT for v in bbox):
+        return BBOX_INT
+    if all(type(v) is float for v in bbox):
+        return BBOX_FLOAT
+    return None
+
+
+def is_typed_field(field):
+    return field in INT_FIELDS or field in INTERNED_FIELDS or field == "bbox"
+
+
+class AnnotationStore:
+    # Column-oriented storage for annotations, one row per annotation. Values that do not fit
+    # their typed column (wrong type, out of range) are kept in `others`, which takes
+    # precedence over the column. The key order of every row is kept in `schemas`, so that
+    # rows turn back into the exact same dicts.
+    def __init__(self):
+        self.size = 0
+        self.schemas = InternTable()
+        self.schema_codes = np.zeros(0, dtype=np.int32)
+        self.ints = {field: np.zeros(0, dtype=np.int64) for field in INT_FIELDS}
+        self.strings = {field: InternTable() for field in INTERNED_FIELDS}
+        self.codes = {field: np.zeros(0, dtype=np.int32) for field in INTERNED_FIELDS}
+        self.bboxes = np.zeros((0, 4), dtype=np.float64)
+        self.bbox_kinds = np.zeros(0, dtype=np.int8)
+        # Key is the field, value is the list of values of every row
+        self.objects = {}
+        # Key is the field, value is {row: value}
+        self.others = {}
+        # Bumped when rows are added or bboxes change, so that cached small bbox masks know when to recompute
+        self.bbox_version = 0
+
+    def append_rows(self, anno_datas):
+        # Append one row per dict and return the row numbers
+        start = self.size
+        schema_codes = []
+        ints = {field: [] for field in INT_FIELDS}
+        codes = {field: [] for field in INTERNED_FIELDS}
+        bboxes = []
+        bbox_kinds = []
+        objects = {}
+        # Captions repeat a lot ("", "undefined"), so keep a single copy of each
+        captions = {}
+
+        for row, anno_data in enumerate(anno_datas, start):
+            schema_codes.append(self.schemas.intern(tuple(anno_data)))
+
+            for field in INT_FIELDS:
+                value = anno_data.get(field)
+                if is_int64(value):
+                    ints[field].append(value)
+                else:
+                    ints[field].append(0)
+                    if field in anno_data:
+                        self.others.setdefault(field, {})[row] = value
+
+            for field in INTERNED_FIELDS:
+                value = anno_data.get(field)
+                if type(value) is str:
+                    codes[field].append(self.strings[field].intern(value))
+                else:
+                    codes[field].append(0)
+                    if field in anno_data:
+                        self.others.setdefault(field, {})[row] = value
+
+            bbox = anno_data.get("bbox")
+            kind = bbox_kind(bbox)
+            if kind is None:
+                bboxes.append((0, 0, 0, 0))
+                bbox_kinds.append(BBOX_INT)
+                if "bbox" in anno_data:
+                    self.others.setdefault("bbox", {})[row] = bbox
+            else:
+                bboxes.append(bbox)
+                bbox_kinds.append(kind)
+
+            for field, value in anno_data.items():
+                if not is_typed_field(field):
+                    if field == "caption" and type(value) is str:
+                        value = captions.setdefault(value, value)
+                    elif type(value) is list and not value:
+                        value = EMPTY_LIST
+                    objects.setdefault(field, {})[row] = value
+
+        count = len(schema_codes)
+        self.schema_codes = np.concatenate([self.schema_codes, np.array(schema_codes, dtype=np.int32)])
+        for field in INT_FIELDS:
+            self.ints[field] = np.concatenate([self.ints[field], np.array(ints[field], dtype=np.int64)])
+        for field in INTERNED_FIELDS:
+            self.codes[field] = np.concatenate([self.codes[field], np.array(codes[field], dtype=np.int32)])
+        self.bboxes = np.concatenate([self.bboxes, np.array(bboxes, dtype=np.float64).reshape(count, 4)])
+        self.bbox_kinds = np.concatenate([self.bbox_kinds, np.array(bbox_kinds, dtype=np.int8)])
+        for field in set(self.objects) | set(objects):
+            column = self.objects.setdefault(field, [None] * start)
+            values = objects.get(field, {})
+            column.extend([values.get(row) for row in range(start, start + count)])
+        self.size += count
+        self.bbox_version += 1
+        return range(start, self.size)
+
+    def has_field(self, row, field):
+        return field in self.schemas[self.schema_codes[row]]
+
+    def get(self, row, field):
+        if not self.has_field(row, field):
+            raise KeyError(field)
+        others = self.others.get(field)
+        if others is not None and row in others:
+            return others[row]
+        if field in INT_FIELDS:
+            return int(self.ints[field][row])
+        if field in INTERNED_FIELDS:
+            return self.strings[field][self.codes[field][row]]
+        if field == "bbox":
+            if self.bbox_kinds[row] == BBOX_INT:
+                return [int(v) for v in self.bboxes[row]]
+            return [float(v) for v in self.bboxes[row]]
+        value = self.objects[field][row]
+        return [] if value is EMPTY_LIST else value
+
+    def set(self, row, field, value):
+        self.fill(np.array([row], dtype=np.int64), field, value)
+
+    def fill(self, rows, field, value):
+        # Set one field to the same value on every given row
+        rows = np.asarray(rows, dtype=np.int64)
+        self.add_field(rows, field)
+        if field == "bbox":
+            self.bbox_version += 1
+        others = self.others.get(field)
+        if others:
+            for row in rows.tolist():
+                others.pop(row, None)
+
+        if field in INT_FIELDS and is_int64(value):
+            self.ints[field][rows] = value
+        elif field in INTERNED_FIELDS and type(value) is str:
+            self.codes[field][rows] = self.strings[field].intern(value)
+        elif field == "bbox" and bbox_kind(value) is not None:
+            self.bboxes[rows] = value
+            self.bbox_kinds[rows] = bbox_kind(value)
+        elif is_typed_field(field):
+            others = self.others.setdefault(field, {})
+            for row in rows.tolist():
+                others[row] = value
+        else:
+            column = self.objects.setdefault(field, [None] * self.size)
+            for row in rows.tolist():
+                column[row] = value
+
+    def add_field(self, rows, field):
+        # Append field to the key order of the rows that do not have it yet, as a dict would
+        if len(rows) == 0:
+            return
+        schema_codes = self.schema_codes[rows]
+        for code in np.unique(schema_codes).tolist():
+            schema = self.schemas[code]
+            if field not in schema:
+                self.schema_codes[rows[schema_codes == code]] = self.schemas.intern(schema + (field,))
+
+    def field_mask(self, field):
+        # Rows that have the field
+        has_field = np.array([field in schema for schema in self.schemas.values], dtype=bool)
+        if len(has_field) == 0:
+            return np.zeros(self.size, dtype=bool)
+        return has_field[self.schema_codes]
+
+    def get_areas(self):
+        # Same as Annotation.get_area for every row, NaN where there is no usable bbox
+        areas = self.bboxes[:, 3] * self.bboxes[:, 2]
+        areas[~self.field_mask("bbox")] = np.nan
+        for row, bbox in self.others.get("bbox", {}).items():
+            try:
+                areas[row] = bbox[3] * bbox[2]
+            except (TypeError, IndexError, KeyError):
+                areas[row] = np.nan
+        return areas
+
+    def to_dict(self, row):
+        return {field: self.get(row, field) for field in self.schemas[self.schema_codes[row]]}
+
+    def to_dicts(self, rows):
+        # Same as [self.to_dict(row) for row in rows], converting each column only once
+        rows = np.asarray(rows, dtype=np.int64)
+        row_list = rows.tolist()
+        columns = {}
+        for field in INT_FIELDS:
+            columns[field] = self.ints[field][rows].tolist()
+        for field in INTERNED_FIELDS:
+            values = self.strings[field].values
+            if not values:
+                # No row has a string value for the field
+                columns[field] = [None] * len(row_list)
+                continue
+            columns[field] = [values[code] for code in self.codes[field][rows].tolist()]
+        bboxes = self.bboxes[rows]
+        is_int = self.bbox_kinds[rows] == BBOX_INT
+        columns["bbox"] = bboxes.tolist()
+        for i, bbox in zip(np.flatnonzero(is_int).tolist(), bboxes[is_int].astype(np.int64).tolist()):
+            columns["bbox"][i] = bbox
+        for field, column in self.objects.items():
+            columns[field] = [[] if column[row] is EMPTY_LIST else column[row] for row in row_list]
+
+        for field, others in self.others.items():
+            if others:
+                column = columns[field]
+                for i, row in enumerate(row_list):
+                    if row in others:
+                        column[i] = others[row]
+
+        schemas = self.schemas.values
+        return [
+            {field: columns[field][i] for field in schemas[code]}
+            for i, code in enumerate(self.schema_codes[rows].tolist())
+        ]
+
+    def nbytes(self):
+        # Memory used by the columns, not counting the Python objects they point to
+        arrays = [self.schema_codes, self.bboxes, self.bbox_kinds] + list(self.ints.values()) + list(self.codes.values())
+        return sum(array.nbytes for array in arrays) + sum(8 * len(column) for column in self.objects.values())
+
+
+class AnnotationView:
+    # Thin view of one row of an AnnotationStore, with the same methods as Annotation
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def json_data(self):
+        # A copy of the row: changes to it are not written back, use the setters
+        return self.store.to_dict(self.row)
+
+    def get_caption(self):
+        return self.store.get(self.row, "caption")
+
+    def get_category(self):
+        return self.store.get(self.row, "category")
+
+    def set_field(self, field, value):
+        self.store.set(self.row, field, value)
+
+    def get_id(self):
+        return self.store.get(self.row, "id")
+
+    def set_id(self, annotation_id):
+        self.store.set(self.row, "id", annotation_id)
+
+    def get_image_id(self):
+        return self.store.get(self.row, "image_id")
+
+    def set_image_id(self, image_id):
+        self.store.set(self.row, "image_id", image_id)
+
+    def get_area(self):
+        bbox = self.store.get(self.row, "bbox")
+        return bbox[3] * bbox[2]
+
+    def is_small_bbox(self, threshold=SMALL_BBOX_AREA):
+        return self.get_area() < threshold
+
+    def get_bbox(self):
+        return self.store.get(self.row, "bbox")
+
+    def set_bbox(self, bbox):
+        self.store.set(self.row, "bbox", bbox)
+
+    def get_category_id(self):
+        return self.store.get(self.row, "category_id")
+
+    def set_category_id(self, category_id):
+        self.store.set(self.row, "category_id", category_id)
+
+    def set_category(self, category):
+        self.store.set(self.row, "category", category)
+
+    def set_caption(self, caption):
+        self.store.set(self.row, "caption", caption)
+
+    def get_segmentation(self):
+        return self.store.get(self.row, "segmentation")
+
+    def set_segmentation(self, segmentation):
+        self.store.set(self.row, "segmentation", segmentation)
+
+    def set_label(self, label):
+        self.store.set(self.row, "label", label)
+
+    def set_negative_tags(self, negative_tags):
+        self.store.set(self.row, "negative_tags", negative_tags)
+
+    def get_label(self):
+        return self.store.get(self.row, "label")
+
+    def get_negative_tags(self):
+        return self.store.get(self.row, "negative_tags")
+
+
+class ColumnarImage:
+    def __init__(self, image_data, store, rows):
+        self.json_data = image_data
+        self.store = store
+        # A range while the rows are contiguous, a list once annotations are added
+        self.rows = rows
+
+    def get_annotations(self):
+        return [AnnotationView(self.store, row) for row in self.rows]
+
+    def get_anno_datas(self):
+        # Copies: changing them does not change the store
+        return self.store.to_dicts(self.rows)
+
+    def get_num_annotations(self):
+        return len(self.rows)
+
+    def add_annotation(self, annotation):
+        self.rows = list(self.rows)
+        self.rows.extend(self.store.append_rows([annotation.json_data]))
+
+    def get_filename(self):
+        return self.json_data["file_name"]
+
+    def get_id(self):
+        return self.json_data["id"]
+
+
+class ColumnarDataset:
+    # Dataset backed by an AnnotationStore. It offers the read API of Dataset, plus
+    # vectorized passes over all annotations. Requires NumPy.
+    def __init__(self, json_data):
+        if np is None:
+            raise ImportError("ColumnarDataset requires numpy")
+
+        anno_groups = {}
+        for anno_data in json_data["annotations"]:
+            anno_groups.setdefault(anno_data["image_id"], []).append(anno_data)
+
+        # Rows are stored in image order, so every image starts with a contiguous range.
+        # Images with the same id share their rows, as they share the annotation dicts in Dataset.
+        ordered_datas = []
+        image_rows = {}
+        for image_data in json_data["images"]:
+            image_id = image_data["id"]
+            if image_id not in image_rows:
+                anno_datas = anno_groups.get(image_id, [])
+                image_rows[image_id] = range(len(ordered_datas), len(ordered_datas) + len(anno_datas))
+                ordered_datas.extend(anno_datas)
+
+        self.store = AnnotationStore()
+        self.store.append_rows(ordered_datas)
+        self.images = [ColumnarImage(image_data, self.store, image_rows[image_data["id"]]) for image_data in json_data["images"]]
+
+        # Same as Annotation.process_category, once per distinct category
+        self.remap_categories(normalize_category)
+        self.filename_index = None
+        # Key is SmallBboxFilter.get_key(), value is the bbox version and the mask
+        self.small_bbox_masks = {}
+
+    @classmethod
+    def from_store(cls, store, images):
+        # A dataset over an existing store and its images, such as one loaded by dataset.cache
+        dataset = cls.__new__(cls)
+        dataset.store = store
+        dataset.images = images
+        dataset.filename_index = None
+        dataset.small_bbox_masks = {}
+        return dataset
+
+    def get_images(self):
+        return self.images
+
+    def get_all_annotations(self):
+        return [anno for image in self.images for anno in image.get_annotations()]
+
+    def get_rows(self):
+        # Row numbers in output order
+        if not self.images:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.asarray(image.rows, dtype=np.int64) for image in self.images])
+
+    def get_image(self, filename):
+        if self.filename_index is None:
+            self.filename_index = {}
+            for image in self.images:
+                self.filename_index.setdefault(image.get_filename(), image)
+        return self.filename_index.get(filename)
+
+    def append_dataset(self, dataset):
+        # Returns the images of dataset that were not added
+        dropped = []
+        targets = []
+        anno_datas = []
+        for image in dataset.get_images():
+            my_image = self.get_image(image.get_filename())
+            if my_image is None:
+                # Do not add the image with only small bbox
+                dropped.append(image)
+            else:
+                targets.append((my_image, len(image.get_annotations())))
+                anno_datas.extend(annotation.json_data for annotation in image.get_annotations())
+
+        # Append all the rows at once, then hand them out to the images
+        rows = iter(self.store.append_rows(anno_datas))
+        for my_image, count in targets:
+            my_image.rows = list(my_image.rows)
+            my_image.rows.extend(itertools.islice(rows, count))
+        return dropped
+
+    def remap_categories(self, func):
+        # Apply func to every distinct category string instead of every annotation
+        table = self.store.strings["category"]
+        lookup = np.array([table.intern(func(category)) for category in list(table.values)], dtype=np.int32)
+        codes = self.store.codes["category"]
+        if len(lookup):
+            self.store.codes["category"] = lookup[codes]
+        for row, category in self.store.others.get("category", {}).items():
+            self.store.others["category"][row] = func(category)
+        return lookup
+
+    def small_bbox_mask(self, threshold=SMALL_BBOX_AREA):
+        # Same as Annotation.is_small_bbox, for every row
+        return self.store.get_areas() < threshold
+
+    def fill(self, mask, field, value):
+        # Set one field to the same value on every row in mask, like a setter of Annotation
+        self.store.fill(np.flatnonzero(mask), field, value)
+
+    def define_category_ids(self):
+        # Same as processing.define_category_id: ids are the ranks of the sorted category names
+        rows = self.get_rows()
+        table = self.store.strings["category"]
+        used_codes = np.unique(self.store.codes["category"][rows])
+        names = sorted(table[code] for code in used_codes.tolist())
+        lookup = np.zeros(len(table), dtype=np.int64)
+        for category_id, name in enumerate(names):
+            lookup[table.codes[name]] = category_id
+
+        self.store.add_field(rows, "category_id")
+        self.store.others.pop("category_id", None)
+        self.store.ints["category_id"][rows] = lookup[self.store.codes["category"][rows]]
+        return names
+
+    def rearrange_ids(self, remap=None):
+        # Image ids become 1..M in image order, annotation ids 1..N in output order, recording
+        # the old ids in remap (an IdRemap) when given
+        rows = self.get_rows()
+        if remap is not None:
+            remap.images.extend([image.json_data.get("id") for image in self.images])
+            old_ids = np.where(self.store.field_mask("id")[rows], self.store.ints["id"][rows], NO_ID)
+            # Ids that do not fit the column are kept in others, and are not integer ids
+            others = self.store.others.get("id", {})
+            if others:
+                old_ids[np.isin(rows, list(others))] = NO_ID
+            remap.annotations.extend(old_ids)
+        for i, image in enumerate(self.images):
+            image.json_data["id"] = i + 1
+        counts = [len(image.rows) for image in self.images]
+        # As set_id and set_image_id, which add the key to the annotations without it
+        for field in ("id", "image_id"):
+            self.store.add_field(rows, field)
+            self.store.others.pop(field, None)
+        self.store.ints["id"][rows] = np.arange(1, len(rows) + 1)
+        self.store.ints["image_id"][rows] = np.repeat(np.arange(1, len(self.images) + 1), counts)
+        self.filename_index = None
+
+    def to_json(self):
+        return {
+            "images": [image.json_data for image in self.images],
+            "annotations": self.store.to_dicts(self.get_rows())
+        }
@@ -1,15 +1,172 @@
 import os
-import json
+import re
+import codecs
+
+from dataset import trace
+from dataset.query import AnnotationIndex, Query
+from dataset.codec import DEFAULT_CODEC, open_file
+
+# Annotations with a bbox area below this many pixels are small bboxes
+SMALL_BBOX_AREA = 1024
+
+# An array of numbers, or of arrays of numbers (polygons, bboxes): only numbers, whitespace,
+# commas and brackets, so a regular expression can skip it without parsing it
+NUMERIC_ARRAY = r"\[[-+.0-9eE \t\n\r,\[\]]*\]"
+PROJECTION_CHUNK_SIZE = 1 << 24
+
+# Stands for a field a record does not have
+_missing = object()
+
+# Annotation.set_field bumps _version on every change and _bbox_version on every bbox change,
+# so that the query index and cached small bbox masks know when to rebuild. Module globals:
+# writing a class attribute on every change would throw away the interpreter's caches of Annotation.
+_version = 0
+_bbox_version = 0
+
+def get_annotation_bbox_version():
+    return _bbox_version
+
+# Key is a raw category, value is the same category stripped and lowercased. The annotations
+# share the normalized strings, which are computed once per distinct category.
+_normalized_categories = {}
+
+def normalize_category(category):
+    normalized = _normalized_categories.get(category)
+    if normalized is None:
+        normalized = category.strip().lower()
+        _normalized_categories[category] = normalized
+    return normalized
+
+class ProjectionError(ValueError):
+    # FieldProjection replaced a value in the text that project would have kept
+    pass
+
+class FieldProjection:
+    # The annotation fields a reader needs: keep is the fields to keep (None for all), drop the
+    # fields to remove and clear the fields whose value becomes [] with the key left in place.
+    # The dropped and cleared values that are arrays of numbers are replaced with [] in the JSON
+    # text before it is parsed, so polygons are never materialized. Other values are parsed,
+    # then discarded by project.
+    # The text is not parsed when the values are replaced, so a field of the same name in an
+    # image or a nested record is replaced too. The readers count the values replaced against
+    # count_skipped of the annotations to detect it.
+    def __init__(self, keep=None, drop=(), clear=()):
+        self.keep = None if keep is None else set(keep)
+        self.drop = set(drop)
+        self.clear = set(clear)
+        self.skipped = sorted(self.drop | self.clear)
+        # One pattern per field: a pattern starting with a literal is searched much faster than
+        # an alternation. The key must not start with an escaped quote, as inside a string.
+        self.patterns = [re.compile(rf'("(?<!\\")' + re.escape(field) + rf'"\s*:\s*){NUMERIC_ARRAY}(?=\s*[,}}])')
+                         for field in self.skipped]
+
+    def get_key(self):
+        return [None if self.keep is None else sorted(self.keep), sorted(self.drop), sorted(self.clear)]
+
+    def filter_text(self, text, final=False):
+        # Returns text with the skipped values replaced, the tail to put in front of the next
+        # text and the number of values replaced. The tail starts at the last "{", as a value
+        # cut in two has no "{" in it.
+        if not self.patterns:
+            return text, "", 0
+        split = len(text) if final else max(text.rfind("{"), 0)
+        head = text[:split]
+        replaced = 0
+        for pattern in self.patterns:
+            head, count = pattern.subn(r"\1[]", head)
+            replaced += count
+        return head, text[split:], replaced
+
+    def count_skipped(self, anno_data):
+        # The number of skipped fields of an annotation that are [] before project: at most the
+        # number of values filter_text replaced in it, the same when it replaced no other value
+        count = 0
+        for field in self.skipped:
+            value = anno_data.get(field)
+            if type(value) is list and not value:
+                count += 1
+        return count
+
+    def project(self, anno_data):
+        if self.keep is not None:
+            for field in [field for field in anno_data if field not in self.keep and field not in self.clear]:
+                del anno_data[field]
+        for field in self.drop:
+            anno_data.pop(field, None)
+        for field in self.clear:
+            if field in anno_data:
+                anno_data[field] = []
+        return anno_data
+
+    def read_json(self, json_path, codec=DEFAULT_CODEC):
+        # Same as codec.load followed by project on every annotation, with the file read in chunks
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        parts = []
+        tail = ""
+        replaced = 0
+        with open_file(json_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(PROJECTION_CHUNK_SIZE), b""):
+                text, tail, count = self.filter_text(tail + decoder.decode(chunk))
+                parts.append(text)
+                replaced += count
+        text, _, count = self.filter_text(tail + decoder.decode(b"", final=True), final=True)
+        parts.append(text)
+        replaced += count
+        json_data = codec.loads("".join(parts))
+        del parts
+        if replaced != sum(self.count_skipped(anno_data) for anno_data in json_data["annotations"]):
+            # A value outside the annotation fields was replaced: parse the text as it is
+            trace.info(f"{json_path} has skipped fields outside the annotations, reading it without filtering")
+            json_data = codec.load(json_path)
+        for anno_data in json_data["annotations"]:
+            self.project(anno_data)
+        return json_data
+
 
 class Annotation:
-    def __init__(self, json_data):
-        self.json_data = json_data 
-        self.process_category()
+    # Slots keep the millions of annotations small, with room for the fork fields
+    __slots__ = ("json_data", "shared", "origin")
+
+    def __init__(self, json_data, normalize=True):
+        self.json_data = json_data
+        # Set by fork on both copies: json_data is shared with another dataset until set_field
+        # copies it. origin is the record of the first fork, which dataset.snapshot pairs them by.
+        self.shared = False
+        self.origin = None
+        if normalize:
+            self.process_category()
 
     def process_category(self):
         category = self.json_data["category"]
-        new_category = category.strip().lower()
+        new_category = normalize_category(category)
         self.json_data["category"] = new_category
+
+    def set_field(self, field, value):
+        # Every change of json_data goes through here, replacing values rather than changing
+        # them in place, so that a shared record is copied before its first change. Writing
+        # the value a field already has (of the same type: 1, 1.0 and True are written
+        # differently) leaves it shared.
+        global _version, _bbox_version
+        if self.shared:
+            old = self.json_data.get(field, _missing)
+            if type(old) is type(value) and old == value:
+                return
+            self.json_data = dict(self.json_data)
+            self.shared = False
+        self.json_data[field] = value
+        _version += 1
+        if field == "bbox":
+            _bbox_version += 1
+
+    def fork(self):
+        # A copy of this annotation sharing its record, see dataset.snapshot
+        if self.origin is None:
+            self.origin = self.json_data
+        self.shared = True
+        annotation = Annotation(self.json_data, normalize=False)
+        annotation.origin = self.origin
+        annotation.shared = True
+        return annotation
     
     def get_caption(self):
         return self.json_data["caption"]
@@ -19,39 +176,52 @@ class Annotation:
     
     def get_id(self):
         return self.json_data["id"]
+
+    def set_id(self, annotation_id):
+        self.set_field("id", annotation_id)
     
     def get_image_id(self):
         return self.json_data["image_id"]
+
+    def set_image_id(self, image_id):
+        self.set_field("image_id", image_id)
     
     def get_area(self):
         return self.json_data["bbox"][3] * self.json_data["bbox"][2]
     
-    def is_small_bbox(self):
-        return self.get_area() < 1024
+    def is_small_bbox(self, threshold=SMALL_BBOX_AREA):
+        bbox = self.json_data["bbox"]
+        return bbox[3] * bbox[2] < threshold
+
+    def get_bbox(self):
+        return self.json_data["bbox"]
+
+    def set_bbox(self, bbox):
+        self.set_field("bbox", bbox)
     
     def get_category_id(self):
         return self.json_data["category_id"]
     
     def set_category_id(self, category_id):
-        self.json_data["category_id"] = category_id
+        self.set_field("category_id", category_id)
 
     def set_category(self, category):
-        self.json_data["category"] = category
+        self.set_field("category", category)
 
     def set_caption(self, caption):
-        self.json_data["caption"] = caption
+        self.set_field("caption", caption)
 
     def get_segmentation(self):
         return self.json_data["segmentation"]
     
     def set_segmentation(self, segmentation):
-        self.json_data["segmentation"] = segmentation
+        self.set_field("segmentation", segmentation)
 
     def set_label(self, label):
-        self.json_data["label"] = label
+        self.set_field("label", label)
 
     def set_negative_tags(self, negative_tags):
-        self.json_data["negative_tags"] = negative_tags
+        self.set_field("negative_tags", negative_tags)
 
     def get_label(self):
         return self.json_data["label"]
@@ -60,63 +230,221 @@ class Annotation:
         return self.json_data["negative_tags"]
     
 class Image:
-    def __init__(self, image_data, anno_datas):
+    # Set by fork on both copies, as for Annotation
+    shared = False
+
+    def __init__(self, image_data, anno_datas, lazy=False):
         self.json_data = image_data
-        self.annotations = [Annotation(anno_data) for anno_data in anno_datas]
+        # A lazy image keeps the annotation dicts as they are, normalizes their categories on first
+        # access, and wraps them in new Annotation objects on every get_annotations call
+        self.lazy = lazy
+        if lazy:
+            self.anno_datas = anno_datas
+            self.normalized = False
+        else:
+            self.annotations = [Annotation(anno_data) for anno_data in anno_datas]
+        # The dataset indexing this image, notified when annotations change
+        self.dataset = None
 
     def get_annotations(self):
+        if self.lazy:
+            return [Annotation(anno_data, normalize=False) for anno_data in self.get_anno_datas()]
         return self.annotations
+
+    def get_anno_datas(self):
+        # The annotation dicts, without creating Annotation objects when lazy
+        if not self.lazy:
+            return [annotation.json_data for annotation in self.annotations]
+        if not self.normalized:
+            for anno_data in self.anno_datas:
+                anno_data["category"] = normalize_category(anno_data["category"])
+            self.normalized = True
+        return self.anno_datas
+
+    def get_num_annotations(self):
+        if self.lazy:
+            return len(self.anno_datas)
+        return len(self.annotations)
     
     def set_annotations(self, annotations):
-        self.annotations = annotations
+        if self.lazy:
+            self.anno_datas = [annotation.json_data for annotation in annotations]
+            self.normalized = False
+        else:
+            self.annotations = annotations
+        if self.dataset is not None:
+            self.dataset.reindex()
 
     def add_annotation(self, annotation):
-        self.annotations.append(annotation)
+        if self.lazy:
+            self.anno_datas.append(annotation.json_data)
+            self.normalized = False
+        else:
+            self.annotations.append(annotation)
+        if self.dataset is not None:
+            self.dataset.index_annotation(annotation)
+        
+    def set_field(self, field, value):
+        # Same as Annotation.set_field
+        if self.shared:
+            old = self.json_data.get(field, _missing)
+            if type(old) is type(value) and old == value:
+                return
+            self.json_data = dict(self.json_data)
+            self.shared = False
+        self.json_data[field] = value
+
+    def fork(self):
+        # A copy of this image sharing its record and the records of its annotations, see dataset.snapshot
+        if self.lazy:
+            # A lazy image wraps its annotation dicts anew on every call, so it could not tell
+            # that they are shared: it keeps Annotation objects from now on
+            self.annotations = [Annotation(anno_data, normalize=False) for anno_data in self.get_anno_datas()]
+            self.lazy = False
+            del self.anno_datas, self.normalized
+        self.shared = True
+        image = Image(self.json_data, [])
+        image.shared = True
+        image.annotations = [annotation.fork() for annotation in self.annotations]
+        return image
         
     def get_filename(self):
         return self.json_data["file_name"] 
     
     def get_id(self):
         return self.json_data["id"]
+
+    def set_id(self, image_id):
+        self.set_field("id", image_id)
     
 
 class Dataset:
-    def __init__(self, json_data):
-        self.images = []
-        for image_data in json_data["images"]:
-            image_id = image_data["id"]
-            anno_datas = [anno_data for anno_data in json_data["annotations"] if anno_data["image_id"] == image_id]
-            self.images.append(Image(image_data, anno_datas))
+    def __init__(self, json_data, lazy=False):
+        with trace.span("Dataset", "dataset", images=len(json_data["images"]), annotations=len(json_data["annotations"]), lazy=lazy):
+            # Group the annotations by image id in a single pass, keeping the original order
+            anno_groups = {}
+            for anno_data in json_data["annotations"]:
+                anno_groups.setdefault(anno_data["image_id"], []).append(anno_data)
+
+            # With lazy=True, Annotation objects are only created when they are asked for
+            self.images = []
+            used_ids = set()
+            for image_data in json_data["images"]:
+                image_id = image_data["id"]
+                anno_datas = anno_groups.get(image_id, [])
+                if lazy and image_id in used_ids:
+                    # Images with the same id share the annotation dicts, but not the list of them
+                    anno_datas = list(anno_datas)
+                used_ids.add(image_id)
+                self.images.append(Image(image_data, anno_datas, lazy))
+
+        self.reindex()
+
+    def reindex(self):
+        # Called when images are replaced or ids are rewritten in place.
+        # The lookup indexes are rebuilt on the next lookup.
+        for image in self.images:
+            image.dataset = self
+        self.filename_index = None
+        self.image_id_index = None
+        self.annotation_id_index = None
+        # Key is SmallBboxFilter.get_key(), value is the bbox version and the mask
+        self.small_bbox_masks = {}
+        self.query_index = None
+
+    def build_image_indexes(self):
+        # The first image / annotation wins when keys are duplicated, as in a linear search.
+        # The annotation index is built separately, so that image lookups do not touch annotations.
+        with trace.span("build_image_indexes", "dataset", images=len(self.images)):
+            self.filename_index = {}
+            self.image_id_index = {}
+            for image in self.images:
+                self.filename_index.setdefault(image.get_filename(), image)
+                self.image_id_index.setdefault(image.get_id(), image)
+
+    def build_annotation_index(self):
+        with trace.span("build_annotation_index", "dataset", images=len(self.images)):
+            self.annotation_id_index = {}
+            for image in self.images:
+                for annotation in image.get_annotations():
+                    self.annotation_id_index.setdefault(annotation.json_data["id"], annotation)
 
+    def index_annotation(self, annotation):
+        self.small_bbox_masks = {}
+        self.query_index = None
+        if self.annotation_id_index is not None:
+            self.annotation_id_index.setdefault(annotation.get_id(), annotation)
 
     def get_images(self):
         return self.images
     
     def set_images(self, images):
         self.images = images
+        self.reindex()
 
     def get_all_annotations(self):
         return [anno for image in self.images for anno in image.get_annotations()]
+
+    def remove_annotations(self, anno_datas):
+        # Remove these annotation dicts from their images, reindexing once at the end
+        removed = {id(anno_data) for anno_data in anno_datas}
+        for image in self.images:
+            if any(id(anno_data) in removed for anno_data in image.get_anno_datas()):
+                image.dataset = None
+                image.set_annotations([annotation for annotation in image.get_annotations() if id(annotation.json_data) not in removed])
+        self.reindex()
     
     def append_dataset(self, dataset):
-        for image in dataset.get_images():
-            my_image = self.get_image(image.get_filename())
-            if my_image is None:
-                pass
-                # Do not add the image with only small bbox
-                # self.images.append(image)
-            else:
-                for annotation in image.get_annotations():
-                    my_image.add_annotation(annotation)
+        # Returns the images of dataset that were not added
+        dropped = []
+        with trace.span("append_dataset", "dataset", images=len(dataset.get_images())):
+            for image in dataset.get_images():
+                my_image = self.get_image(image.get_filename())
+                if my_image is None:
+                    # Do not add the image with only small bbox
+                    # self.images.append(image)
+                    dropped.append(image)
+                else:
+                    for annotation in image.get_annotations():
+                        my_image.add_annotation(annotation)
+        return dropped
     
     def get_image(self, filename):
-        for image in self.images:
-            if image.get_filename() == filename:
-                return image
-        return None
+        return self.get_filename_index().get(filename)
+
+    def get_image_by_id(self, image_id):
+        return self.get_image_id_index().get(image_id)
+
+    def get_annotation_by_id(self, annotation_id):
+        return self.get_annotation_id_index().get(annotation_id)
+
+    def get_filename_index(self):
+        if self.filename_index is None:
+            self.build_image_indexes()
+        return self.filename_index
+
+    def get_image_id_index(self):
+        if self.image_id_index is None:
+            self.build_image_indexes()
+        return self.image_id_index
+
+    def get_annotation_id_index(self):
+        if self.annotation_id_index is None:
+            self.build_annotation_index()
+        return self.annotation_id_index
+
+    def get_query_index(self):
+        if self.query_index is None or self.query_index.version != _version:
+            self.query_index = AnnotationIndex(self, _version)
+        return self.query_index
+
+    def query(self):
+        # A Query over every annotation, see dataset.query
+        return Query(self.get_query_index())
     
     def to_json(self):
-        return {
-            "images": [image.json_data for image in self.images],
-            "annotations": [anno.json_data for image in self.images for anno in image.get_annotations()]
-        }
\ No newline at end of file
+        with trace.span("to_json", "dataset", images=len(self.images)):
+            return {
+                "images": [image.json_data for image in self.images],
+                "annotations": [anno_data for image in self.images for anno_data in image.get_anno_datas()]
+            }
\ No newline at end of file
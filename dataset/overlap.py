@@ -0,0 +1,126 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Annotations of the same image and category overlap when their bboxes intersect with an IoU of at least this
+OVERLAP_THRESHOLD = 0.9
+# Fewer boxes than this are compared in Python, where NumPy would spend more time converting them
+NUMPY_MIN_BOXES = 64
+
+
+def get_boxes(images):
+    # The annotation dicts of the images with at least two annotations, the position of their
+    # image, their group (one per image and category, as only annotations of a group are
+    # compared) and their bboxes
+    anno_datas = []
+    image_positions = []
+    for position, image in enumerate(images):
+        image_datas = image.get_anno_datas()
+        if len(image_datas) > 1:
+            anno_datas.extend(image_datas)
+            image_positions.extend([position] * len(image_datas))
+    categories = [anno_data.get("category") for anno_data in anno_datas]
+    codes = {category: code for code, category in enumerate(dict.fromkeys(categories))}
+    groups = [position * len(codes) + codes[category] for position, category in zip(image_positions, categories)]
+    boxes = [anno_data["bbox"] for anno_data in anno_datas]
+    return anno_datas, image_positions, groups, boxes
+
+def get_iou(box, other):
+    width = min(box[0] + box[2], other[0] + other[2]) - max(box[0], other[0])
+    height = min(box[1] + box[3], other[1] + other[3]) - max(box[1], other[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (box[2] * box[3] + other[2] * other[3] - intersection)
+
+def find_overlaps(groups, boxes, threshold=OVERLAP_THRESHOLD):
+    # (first, second, iou) for the pairs of boxes of a group, first < second, that are equal
+    # (iou is None) or intersect with iou >= threshold. The boxes of a group are sorted by their left edge,
+    # so the only boxes that can overlap a box are the ones after it up to the first starting
+    # past its right edge.
+    if np is not None and len(boxes) >= NUMPY_MIN_BOXES:
+        return find_overlaps_numpy(groups, boxes, threshold)
+
+    order = sorted(range(len(boxes)), key=lambda i: (groups[i], boxes[i][0]))
+    pairs = []
+    for k, i in enumerate(order):
+        box = boxes[i]
+        right = box[0] + box[2]
+        for m in range(k + 1, len(order)):
+            j = order[m]
+            other = boxes[j]
+            if groups[j] != groups[i] or other[0] > right:
+                break
+            if box == other:
+                pairs.append((min(i, j), max(i, j), None))
+                continue
+            iou = get_iou(box, other)
+            # Boxes that only touch, with an IoU of 0, are within the sweep but do not overlap
+            if iou > 0 and iou >= threshold:
+                pairs.append((min(i, j), max(i, j), iou))
+    return pairs
+
+def find_overlaps_numpy(groups, boxes, threshold=OVERLAP_THRESHOLD):
+    groups = np.asarray(groups, dtype=np.int64)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    count = len(boxes)
+    lefts = boxes[:, 0]
+    rights = lefts + boxes[:, 2]
+    # The edges ranked together, so that (group, edge) is a single exact integer key
+    _, ranks = np.unique(np.concatenate([lefts, rights]), return_inverse=True)
+    num_ranks = int(ranks.max()) + 1
+    order = np.lexsort((lefts, groups))
+    left_keys = (groups * num_ranks + ranks[:count])[order]
+    right_keys = (groups * num_ranks + ranks[count:])[order]
+
+    # Box order[k] is compared with order[k + 1:stop], stop being the first box of another group
+    # or starting past its right edge
+    starts = np.arange(1, count + 1)
+    counts = np.maximum(np.searchsorted(left_keys, right_keys, side="right") - starts, 0)
+    candidates = np.repeat(np.arange(count), counts)
+    offsets = np.arange(len(candidates)) - np.repeat(np.cumsum(counts) - counts, counts)
+    firsts = order[candidates]
+    seconds = order[starts[candidates] + offsets]
+
+    box = boxes[firsts]
+    other = boxes[seconds]
+    widths = np.minimum(box[:, 0] + box[:, 2], other[:, 0] + other[:, 2]) - np.maximum(box[:, 0], other[:, 0])
+    heights = np.minimum(box[:, 1] + box[:, 3], other[:, 1] + other[:, 3]) - np.maximum(box[:, 1], other[:, 1])
+    overlapping = (widths > 0) & (heights > 0)
+    intersections = widths * heights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ious = np.where(overlapping, intersections / (box[:, 2] * box[:, 3] + other[:, 2] * other[:, 3] - intersections), 0.0)
+    equal = (box == other).all(axis=1)
+    selected = (overlapping & (ious >= threshold)) | equal
+
+    pairs = zip(np.minimum(firsts, seconds)[selected].tolist(), np.maximum(firsts, seconds)[selected].tolist(),
+                ious[selected].tolist(), equal[selected].tolist())
+    return [(first, second, None if is_equal else iou) for first, second, iou, is_equal in pairs]
+
+def find_overlapping_annotations(images, threshold=OVERLAP_THRESHOLD):
+    # (image position, first anno_data, second anno_data, iou) for every annotation of images that
+    # duplicates (iou is None) or overlaps an earlier annotation of the same image and category,
+    # in the order of the second annotations. A duplicate is only paired with the first
+    # annotation it duplicates.
+    anno_datas, image_positions, groups, boxes = get_boxes(images)
+    pairs = find_overlaps(groups, boxes, threshold)
+    pairs.sort(key=lambda pair: (pair[1], pair[0]))
+    duplicated = set()
+    result = []
+    for first, second, iou in pairs:
+        if iou is None:
+            if second in duplicated:
+                continue
+            duplicated.add(second)
+        result.append((image_positions[second], anno_datas[first], anno_datas[second], iou))
+    return result
+
+def get_redundant_annotations(images, threshold=OVERLAP_THRESHOLD):
+    # The anno_datas to drop so that no two annotations left duplicate or overlap: every
+    # annotation that does with an earlier one that is kept
+    dropped = {}
+    for _, first, second, _ in find_overlapping_annotations(images, threshold):
+        if id(first) not in dropped:
+            dropped[id(second)] = second
+    return list(dropped.values())
@@ -0,0 +1,172 @@
+import os
+import gc
+import tempfile
+import time
+import contextlib
+
+from dataset import trace
+from dataset.stream import write_json, spool_images, iter_spooled_images
+
+
+@contextlib.contextmanager
+def paused_gc():
+    # The stages allocate many short-lived objects but no reference cycles, and the cyclic
+    # garbage collector would otherwise keep rescanning every record of the dataset
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+class Stage:
+    def __init__(self, name, kind, func, needs=(), finish=None):
+        # kind is "image" (func(image)) or "annotation" (func(annotation))
+        self.name = name
+        self.kind = kind
+        self.func = func
+        # Stages whose finish(dataset) must have run, i.e. that need a whole pass over the dataset first
+        self.needs = list(needs)
+        self.finish = finish
+
+
+class Pipeline:
+    def __init__(self, stage_timing=False):
+        self.stages = []
+        # Time every call of every stage, to trace the stages fused into a pass separately
+        self.stage_timing = stage_timing
+        # Key is the stage name, value is [seconds, calls], while a pass is timed
+        self.timings = None
+
+    def add_image_stage(self, name, func, needs=(), finish=None):
+        self.stages.append(Stage(name, "image", func, needs, finish))
+        return self
+
+    def add_annotation_stage(self, name, func, needs=(), finish=None):
+        self.stages.append(Stage(name, "annotation", func, needs, finish))
+        return self
+
+    def plan(self):
+        # Fuse the stages into as few passes as possible. A stage stays in the pass of the
+        # stage before it (keeping the registration order), unless it needs the result of a
+        # stage in the current pass, in which case a new pass is started.
+        passes = []
+        stage_pass = {}
+        for stage in self.stages:
+            for name in stage.needs:
+                assert name in stage_pass, f"Stage {stage.name} needs {name}, which is not registered before it"
+
+            pass_index = len(passes) - 1
+            if pass_index < 0 or any(stage_pass[name] == pass_index for name in stage.needs):
+                passes.append([])
+                pass_index += 1
+            passes[pass_index].append(stage)
+            stage_pass[stage.name] = pass_index
+        return passes
+
+    def run(self, dataset):
+        with paused_gc():
+            for stages in self.plan():
+                images = dataset.get_images()
+                with self.pass_span(stages, images=len(images)):
+                    for image in self.iter_pass(images, stages):
+                        pass
+                self.finish_pass(dataset, stages)
+        return dataset
+
+    @contextlib.contextmanager
+    def pass_span(self, stages, **args):
+        names = ', '.join(stage.name for stage in stages)
+        trace.info(f"Running pass: {names}")
+        timings = {}
+        with trace.span(f"pass: {names}", "pass", **args) as span:
+            if self.stage_timing:
+                self.timings = timings
+            try:
+                yield span
+            finally:
+                self.timings = None
+        # The time of the stages is summed over the calls, so they are laid out one after
+        # another from the start of the pass
+        start = span.start
+        for stage in stages:
+            if stage.name in timings:
+                seconds, calls = timings[stage.name]
+                trace.tracer.add_event(stage.name, "stage", start, seconds, {"calls": calls, "summed": True})
+                start += seconds
+
+    def run_streaming(self, dataset, output_path, **kwargs):
+        # Like run, but for a StreamingDataset: the images of every pass but the last are spooled
+        # to a temporary file for the next pass, and the last pass writes output_path directly.
+        # Returns the number of images and annotations written.
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        passes = self.plan()
+        images = dataset.get_images()
+        with paused_gc(), contextlib.ExitStack() as stack:
+            for i, stages in enumerate(passes):
+                with self.pass_span(stages):
+                    processed = self.iter_pass(images, stages)
+                    if i < len(passes) - 1:
+                        spool = stack.enter_context(tempfile.TemporaryFile('w+', encoding="utf-8", dir=output_dir))
+                        spool_images(processed, spool)
+                        images = iter_spooled_images(spool)
+                    else:
+                        images = processed
+                        counts = write_json(output_path, images, **kwargs)
+                self.finish_pass(dataset, stages)
+
+            if not passes:
+                counts = write_json(output_path, images, **kwargs)
+        return counts
+
+    def iter_pass(self, images, stages):
+        segments = self.segment(stages, self.timings)
+        total = len(images) if hasattr(images, "__len__") else None
+        for count, image in enumerate(images, 1):
+            if not count & 0xfff:
+                trace.progress("Images", count, total)
+            for kind, funcs in segments:
+                if kind == "image":
+                    for func in funcs:
+                        func(image)
+                else:
+                    for annotation in image.get_annotations():
+                        for func in funcs:
+                            func(annotation)
+            yield image
+
+    @staticmethod
+    def finish_pass(dataset, stages):
+        for stage in stages:
+            if stage.finish is not None:
+                with trace.span(f"finish: {stage.name}", "finish"):
+                    stage.finish(dataset)
+
+    @staticmethod
+    def segment(stages, timings=None):
+        # Group consecutive stages of the same kind, so that consecutive annotation stages
+        # are applied to one annotation after another in a single loop
+        segments = []
+        for stage in stages:
+            func = stage.func if timings is None else timed(stage.func, stage.name, timings)
+            if segments and segments[-1][0] == stage.kind:
+                segments[-1][1].append(func)
+            else:
+                segments.append((stage.kind, [func]))
+        return segments
+
+
+def timed(func, name, timings):
+    # func, adding its time and number of calls to timings[name]
+    timings[name] = [0.0, 0]
+    timing = timings[name]
+    perf_counter = time.perf_counter
+
+    def timed_func(item):
+        start = perf_counter()
+        func(item)
+        timing[0] += perf_counter() - start
+        timing[1] += 1
+    return timed_func
@@ -0,0 +1,116 @@
+import os
+import time
+import contextlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from dataset import trace
+from dataset.codec import read_bytes
+
+
+class FileTiming:
+    # Seconds spent on one file: "read" by a reader thread, "wait" for the consumer blocked on
+    # the read, and whatever the consumer measures, such as "parse" and "merge"
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.seconds = {}
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0) + time.perf_counter() - start
+
+    def format(self):
+        times = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.seconds.items())
+        return f"{self.path}: {self.size / 2 ** 20:.1f} MiB, {times}"
+
+
+class PrefetchReader:
+    # Reads files in background threads while the consumer works on the ones already read, so
+    # that read time (slow on network storage) overlaps parse time. At most window files are
+    # being read or waiting to be consumed, and with max_bytes, no file is read ahead while that
+    # would put more than max_bytes in those buffers (counted as stored, before decompression).
+    # Compressed files are decompressed by the reader threads. window=0 reads each file when it
+    # is asked for.
+    #   with PrefetchReader(paths, window=2) as reader:
+    #       for path, data, timing in reader:
+    #           with timing.measure("parse"):
+    #               json.loads(data)
+    def __init__(self, paths, window=2, max_bytes=None):
+        self.paths = list(paths)
+        self.window = window
+        self.max_bytes = max_bytes
+        # FileTiming of every file given to the consumer, in order
+        self.timings = []
+        self.executor = None
+        # (path, size, future) of the files being read ahead, in order
+        self.pending = collections.deque()
+        self.next_index = 0
+
+    def __enter__(self):
+        if self.window > 0:
+            self.executor = ThreadPoolExecutor(max_workers=self.window, thread_name_prefix="prefetch")
+            self.fill()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            for _, _, future in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def fill(self):
+        pending_bytes = sum(size for _, size, _ in self.pending)
+        while self.next_index < len(self.paths) and len(self.pending) < self.window:
+            path = self.paths[self.next_index]
+            size = os.path.getsize(path)
+            if self.max_bytes is not None and self.pending and pending_bytes + size > self.max_bytes:
+                break
+            self.pending.append((path, size, self.executor.submit(self.read_file, path)))
+            pending_bytes += size
+            self.next_index += 1
+
+    def read_file(self, path):
+        # Runs in a reader thread. The tracer's spans are not thread safe, only add_event is.
+        start = time.perf_counter()
+        data = read_bytes(path)
+        seconds = time.perf_counter() - start
+        trace.tracer.add_event(f"read {os.path.basename(path)}", "io", start, seconds, {"path": path, "bytes": len(data)})
+        return data, seconds
+
+    def __iter__(self):
+        # Outside of a with block, every file is read when it is asked for
+        while self.pending or self.next_index < len(self.paths):
+            start = time.perf_counter()
+            if self.executor is None:
+                path = self.paths[self.next_index]
+                self.next_index += 1
+                size = os.path.getsize(path)
+                data, read_seconds = self.read_file(path)
+            else:
+                # fill always leaves a file pending while there are files left
+                path, size, future = self.pending.popleft()
+                data, read_seconds = future.result()
+            timing = FileTiming(path, size)
+            timing.seconds["read"] = read_seconds
+            timing.seconds["wait"] = time.perf_counter() - start
+            if self.executor is not None:
+                self.fill()
+            self.timings.append(timing)
+            yield path, data, timing
+
+    def print_timings(self):
+        # Waits close to 0 mean the window is large enough to hide the reads. Every line is its
+        # own rate limit key, so that none is suppressed.
+        for timing in self.timings:
+            trace.info(timing.format())
+        totals = collections.Counter()
+        for timing in self.timings:
+            totals.update(timing.seconds)
+        times = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in totals.items())
+        trace.info(f"Read {len(self.timings)} files with a read-ahead window of {self.window}: {times}")
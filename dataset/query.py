@@ -0,0 +1,146 @@
+import bisect
+import itertools
+import collections
+
+from dataset import trace
+
+
+class AnnotationIndex:
+    # Secondary indexes over the annotations of a Dataset, built together by Dataset.query on
+    # first use. Annotations are numbered by their position in dataset.get_all_annotations(), so
+    # the annotations of an image are a slice of positions. version is the annotation version
+    # when the index was built: Annotation.set_field bumps it, and code that writes json_data
+    # directly must call dataset.reindex().
+    def __init__(self, dataset, version):
+        self.dataset = dataset
+        self.version = version
+        self.images = list(dataset.get_images())
+        self.annotations = []
+        # Position of the first annotation of every image, and the number of annotations at the end
+        self.image_starts = []
+        # Key is the category / label, value is the positions of its annotations
+        self.by_category = collections.defaultdict(list)
+        self.by_label = collections.defaultdict(list)
+        # 1 at the positions of the annotations whose caption is ""
+        self.caption_empty = bytearray()
+        # The areas in increasing order, and the position of each. Annotations without a
+        # usable bbox are left out.
+        self.sorted_areas = []
+        self.area_positions = []
+
+        with trace.span("build_annotation_query_index", "dataset", images=len(self.images)):
+            for image in self.images:
+                self.image_starts.append(len(self.annotations))
+                self.annotations.extend(image.get_annotations())
+            self.image_starts.append(len(self.annotations))
+
+            # One column per field, then grouped by value
+            anno_datas = [annotation.json_data for annotation in self.annotations]
+            for index, field in ((self.by_category, "category"), (self.by_label, "label")):
+                for position, value in enumerate([anno_data.get(field) for anno_data in anno_datas]):
+                    index[value].append(position)
+            self.caption_empty = bytearray([anno_data.get("caption") == "" for anno_data in anno_datas])
+
+            areas = []
+            for anno_data in anno_datas:
+                try:
+                    bbox = anno_data["bbox"]
+                    areas.append(bbox[3] * bbox[2])
+                except (KeyError, TypeError, IndexError):
+                    areas.append(None)
+            self.area_positions = sorted((position for position, area in enumerate(areas) if area is not None), key=areas.__getitem__)
+            self.sorted_areas = [areas[position] for position in self.area_positions]
+
+    def get_image_slice(self, image_position):
+        return range(self.image_starts[image_position], self.image_starts[image_position + 1])
+
+    def get_image_position(self, position):
+        # The position of the image an annotation position belongs to
+        return bisect.bisect_right(self.image_starts, position) - 1
+
+
+class Query:
+    # A set of annotations of a Dataset, narrowed down by the indexes of an AnnotationIndex.
+    # Every filter returns a new Query, e.g.
+    #   dataset.query().category("fish").area(max_area=1024).exclude(dataset.query().label(-1)).ids()
+    def __init__(self, index, positions=None):
+        self.index = index
+        # None stands for every annotation
+        self.positions = positions
+
+    def where(self, positions):
+        positions = positions if isinstance(positions, (set, frozenset)) else set(positions)
+        if self.positions is None:
+            return Query(self.index, positions)
+        return Query(self.index, self.positions & positions)
+
+    def exclude(self, query):
+        if query.positions is None:
+            return Query(self.index, set())
+        return Query(self.index, self.get_position_set() - query.positions)
+
+    def category(self, *categories):
+        return self.where(itertools.chain.from_iterable(self.index.by_category.get(category, ()) for category in categories))
+
+    def label(self, *labels):
+        return self.where(itertools.chain.from_iterable(self.index.by_label.get(label, ()) for label in labels))
+
+    def area(self, min_area=None, max_area=None):
+        # Annotations with min_area <= area < max_area
+        start = 0 if min_area is None else bisect.bisect_left(self.index.sorted_areas, min_area)
+        stop = len(self.index.sorted_areas) if max_area is None else bisect.bisect_left(self.index.sorted_areas, max_area)
+        return self.where(self.index.area_positions[start:stop])
+
+    def small(self, small_bbox_filter):
+        # The small bboxes of small_bbox_filter: a range of the area index when the threshold
+        # is in pixels, its mask when it depends on the image size
+        if not small_bbox_filter.relative:
+            return self.area(max_area=small_bbox_filter.threshold)
+        mask = small_bbox_filter.get_mask(self.index.dataset)
+        return self.where(itertools.compress(itertools.count(), mask))
+
+    def caption_empty(self, empty=True):
+        bitmap = self.index.caption_empty
+        if not empty:
+            bitmap = bitmap.translate(bytes([1, 0]) + bytes(254))
+        return self.where(itertools.compress(itertools.count(), bitmap))
+
+    def in_images(self, *images):
+        # The annotations of the given images, which must be images of the dataset
+        image_positions = {id(image): position for position, image in enumerate(self.index.images)}
+        return self.where(itertools.chain.from_iterable(self.index.get_image_slice(image_positions[id(image)]) for image in images))
+
+    def get_position_set(self):
+        if self.positions is None:
+            return set(range(len(self.index.annotations)))
+        return self.positions
+
+    def get_positions(self):
+        # In dataset order
+        if self.positions is None:
+            return range(len(self.index.annotations))
+        return sorted(self.positions)
+
+    def count(self):
+        if self.positions is None:
+            return len(self.index.annotations)
+        return len(self.positions)
+
+    def annotations(self):
+        annotations = self.index.annotations
+        return [annotations[position] for position in self.get_positions()]
+
+    def ids(self):
+        return [annotation.json_data["id"] for annotation in self.annotations()]
+
+    def images(self, every=False):
+        # The images with at least one annotation in the query, or with every=True, the images
+        # with annotations whose annotations are all in it
+        counts = {}
+        for position in self.get_positions():
+            image_position = self.index.get_image_position(position)
+            counts[image_position] = counts.get(image_position, 0) + 1
+        if every:
+            return [self.index.images[image_position] for image_position, count in counts.items()
+                    if count == len(self.index.get_image_slice(image_position))]
+        return [self.index.images[image_position] for image_position in counts]
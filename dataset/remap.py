@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from dataset.codec import get_temp_path
+
+# The new id of an old id that was not renumbered, and the old id of a record that had no
+# integer id (or of a new id that does not exist)
+NO_ID = -1
+# The new id of an old id that several records of the same source had
+AMBIGUOUS_ID = -2
+# The old id -> new id lookup of a source is an array indexed by the old id while the largest
+# old id is below DENSE_FACTOR times the number of records (plus DENSE_SLACK), a dict otherwise
+DENSE_FACTOR = 4
+DENSE_SLACK = 1024
+MAX_ID = 2 ** 63 - 1
+
+# The sidecar file of an output: a first line with this magic, a JSON line with the sources and
+# sizes of the tables, then the arrays of every table one after another. The sources are saved
+# relative to the folder of the sidecar, so that it can be moved along with the files.
+REMAP_MAGIC = b"idremap 1\n"
+
+def get_remap_path(output_path):
+    return output_path + ".ids"
+
+def get_relative_source(source, folder):
+    # "" stands for a source that is not a file
+    return os.path.relpath(os.path.abspath(source), folder) if source else source
+
+def resolve_source(source, folder):
+    return os.path.normpath(os.path.join(folder, source)) if source else source
+
+def is_old_id(value):
+    return type(value) is int and 0 <= value <= MAX_ID
+
+
+class IdTable:
+    # The new ids 1..N of a renumbering, with the old id of every new id in an array. With several
+    # sources (files whose ids overlap), the source of every new id is kept too, and old ids are
+    # translated within one source. The old id -> new id lookups are built on first use.
+    def __init__(self, sources=("",)):
+        self.sources = list(sources)
+        # Index is the new id - 1
+        self.old_ids = array("q")
+        self.source_codes = array("H")
+        self.lookups = None
+
+    def __len__(self):
+        return len(self.old_ids)
+
+    def add(self, old_id, source=0):
+        # Returns the new id of the next record
+        self.old_ids.append(old_id if is_old_id(old_id) else NO_ID)
+        if len(self.sources) > 1:
+            self.source_codes.append(source)
+        self.lookups = None
+        return len(self.old_ids)
+
+    def add_sources(self, sources):
+        self.sources.extend(sources)
+        if len(self.source_codes) < len(self.old_ids):
+            self.source_codes.extend(array("H", bytes(2 * (len(self.old_ids) - len(self.source_codes)))))
+
+    def extend(self, old_ids):
+        # The old ids of the next records, all from the first source. In an int64 array, the
+        # records without an old id have a negative one.
+        count = len(self.old_ids)
+        if is_array(old_ids):
+            self.old_ids.frombytes(np.where(old_ids >= 0, old_ids, NO_ID).astype(np.int64).tobytes())
+        else:
+            self.old_ids.extend(old_id if is_old_id(old_id) else NO_ID for old_id in old_ids)
+        if len(self.sources) > 1:
+            self.source_codes.extend(array("H", bytes(2 * (len(self.old_ids) - count))))
+        self.lookups = None
+
+    def get_source_code(self, source):
+        if type(source) is not str:
+            return source
+        if source in self.sources or not source:
+            return self.sources.index(source)
+        # The same file by another path, e.g. relative to another folder
+        return [os.path.abspath(name) if name else name for name in self.sources].index(os.path.abspath(source))
+
+    def get_lookups(self):
+        if self.lookups is None:
+            self.lookups = self.build_lookups()
+        return self.lookups
+
+    def build_lookups(self):
+        codes = self.source_codes if len(self.sources) > 1 else array("H", bytes(2 * len(self.old_ids)))
+        max_ids = [NO_ID] * len(self.sources)
+        counts = [0] * len(self.sources)
+        for old_id, source in zip(self.old_ids, codes):
+            counts[source] += 1
+            if old_id > max_ids[source]:
+                max_ids[source] = old_id
+        lookups = []
+        for max_id, count in zip(max_ids, counts):
+            if max_id < DENSE_FACTOR * count + DENSE_SLACK:
+                lookups.append(array("q", [NO_ID]) * (max_id + 1))
+            else:
+                lookups.append({})
+
+        for new_id, (old_id, source) in enumerate(zip(self.old_ids, codes), 1):
+            if old_id == NO_ID:
+                continue
+            lookup = lookups[source]
+            if type(lookup) is dict:
+                lookup[old_id] = AMBIGUOUS_ID if old_id in lookup else new_id
+            else:
+                lookup[old_id] = AMBIGUOUS_ID if lookup[old_id] != NO_ID else new_id
+        return lookups
+
+    def get_new_id(self, old_id, source=0):
+        return self.translate([old_id], source)[0]
+
+    def get_old_id(self, new_id):
+        return self.translate_back([new_id])[0]
+
+    def translate(self, old_ids, source=0):
+        # The new id of every old id of source (its name or position), NO_ID for the ones that
+        # were not renumbered and AMBIGUOUS_ID for the ones several records had. A list, or an
+        # int64 array when old_ids is a NumPy array.
+        lookup = self.get_lookups()[self.get_source_code(source)]
+        if type(lookup) is dict:
+            if is_array(old_ids):
+                return np.array([lookup.get(old_id, NO_ID) for old_id in old_ids.tolist()], dtype=np.int64)
+            return [lookup.get(old_id, NO_ID) for old_id in old_ids]
+        return translate_dense(lookup, old_ids, 0)
+
+    def translate_back(self, new_ids):
+        # The old id of every new id, NO_ID for the ones that do not exist or had no integer id.
+        # A list, or an int64 array when new_ids is a NumPy array.
+        return translate_dense(self.old_ids, new_ids, 1)
+
+    def get_sources(self, new_ids):
+        # The source name of every new id
+        if len(self.sources) == 1:
+            return [self.sources[0]] * len(new_ids)
+        return [self.sources[self.source_codes[new_id - 1]] for new_id in new_ids]
+
+    def to_header(self, folder):
+        return {"sources": [get_relative_source(source, folder) for source in self.sources], "size": len(self.old_ids)}
+
+    def get_arrays(self):
+        return [self.old_ids, self.source_codes] if len(self.sources) > 1 else [self.old_ids]
+
+
+def is_array(values):
+    return np is not None and isinstance(values, np.ndarray)
+
+def translate_dense(table, ids, offset):
+    # table[id - offset] for every id, NO_ID where it is out of range
+    size = len(table)
+    if is_array(ids):
+        values = np.frombuffer(table, dtype=np.int64) if size else np.zeros(0, dtype=np.int64)
+        positions = ids.astype(np.int64) - offset
+        valid = (positions >= 0) & (positions < size)
+        result = np.full(len(positions), NO_ID, dtype=np.int64)
+        result[valid] = values[positions[valid]]
+        return result
+    return [table[i - offset] if 0 <= i - offset < size else NO_ID for i in ids]
+
+
+class IdRemap:
+    # Renumbers the images and annotations of a dataset in order, ids 1..M and 1..N, keeping
+    # the old ids of both in an IdTable to translate ids between the input and the output:
+    #   remap = IdRemap(json_path)
+    #   remap.renumber(dataset)
+    #   remap.save(get_remap_path(output_path))
+    #   new_ids = load_remap(get_remap_path(output_path)).annotations.translate(old_ids)
+    def __init__(self, source=""):
+        self.images = IdTable([source])
+        self.annotations = IdTable([source])
+        # Key is the id of an annotation dict added by add_source, value is (its source, the
+        # dict), which keeps the dict alive so that its id is not reused by another one
+        self.annotation_sources = {}
+
+    def add_source(self, source, annotations):
+        # annotations were merged from another file, whose ids are translated apart from the others
+        code = len(self.annotations.sources)
+        self.annotations.add_sources([source])
+        for annotation in annotations:
+            self.annotation_sources[id(annotation.json_data)] = (code, annotation.json_data)
+
+    def renumber_image(self, image):
+        image_id = self.images.add(image.json_data.get("id"))
+        image.set_id(image_id)
+        for annotation in image.get_annotations():
+            entry = self.annotation_sources.get(id(annotation.json_data))
+            annotation.set_id(self.annotations.add(annotation.json_data.get("id"), 0 if entry is None else entry[0]))
+            annotation.set_image_id(image_id)
+
+    def renumber(self, dataset):
+        for image in dataset.get_images():
+            self.renumber_image(image)
+        # Ids were rewritten in place, so the id lookups must be rebuilt
+        dataset.reindex()
+        return dataset
+
+    def save(self, path):
+        tables = {"images": self.images, "annotations": self.annotations}
+        folder = os.path.dirname(os.path.abspath(path))
+        header = {"byteorder": sys.byteorder, "tables": {name: table.to_header(folder) for name, table in tables.items()}}
+        tmp_path = get_temp_path(path)
+        with open(tmp_path, 'xb') as f:
+            f.write(REMAP_MAGIC)
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for table in tables.values():
+                for values in table.get_arrays():
+                    values.tofile(f)
+        os.replace(tmp_path, path)
+
+
+def load_remap(path):
+    # The IdRemap saved to path, with the sources relative to the current folder again
+    folder = os.path.dirname(path)
+    with open(path, 'rb') as f:
+        if f.readline() != REMAP_MAGIC:
+            raise ValueError(f"{path} is not an id remapping file")
+        header = json.loads(f.readline())
+        remap = IdRemap()
+        for name in ("images", "annotations"):
+            table = IdTable([resolve_source(source, folder) for source in header["tables"][name]["sources"]])
+            size = header["tables"][name]["size"]
+            for values in table.get_arrays():
+                values.fromfile(f, size)
+                if header["byteorder"] != sys.byteorder:
+                    values.byteswap()
+            setattr(remap, name, table)
+    return remap
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+import collections
+import multiprocessing
+
+from dataset import trace
+from dataset.statistics import SUPERCATEGORY
+from dataset.codec import DEFAULT_CODEC
+
+MANIFEST_NAME = "manifest.json"
+
+
+class Sharding:
+    # How a dataset is split by image into shards. Images are first split into named splits
+    # when splits is given ({"train": 0.9, "val": 0.1}), from a hash of their file name, so an
+    # image always lands in the same split. Each split is then cut into num_shards shards of
+    # about the same number of images, or into shards of at most max_annotations annotations.
+    # Images keep their order, so the ids from rearrange_ids stay increasing in every shard.
+    def __init__(self, num_shards=None, max_annotations=None, splits=None):
+        if num_shards is not None and max_annotations is not None:
+            raise ValueError("Give num_shards or max_annotations, not both")
+        if splits is not None and abs(sum(splits.values()) - 1) > 1e-9:
+            raise ValueError(f"The split fractions must add up to 1, not {sum(splits.values())}")
+        self.num_shards = num_shards
+        self.max_annotations = max_annotations
+        self.splits = splits
+
+    def get_split(self, image):
+        # The hash of the file name as a number in [0, 1), compared to the cumulated fractions
+        digest = hashlib.blake2b(image.get_filename().encode("utf-8"), digest_size=8).digest()
+        position = int.from_bytes(digest, "big") / 2 ** 64
+        total = 0
+        for name, fraction in self.splits.items():
+            total += fraction
+            if position < total:
+                return name
+        return name
+
+    def split(self, images):
+        # List of (split name or None, images) for every shard
+        if self.splits is None:
+            groups = {None: images}
+        else:
+            groups = {name: [] for name in self.splits}
+            for image in images:
+                groups[self.get_split(image)].append(image)
+
+        shards = []
+        for name, group in groups.items():
+            shards.extend((name, shard_images) for shard_images in self.cut(group))
+        return shards
+
+    def cut(self, images):
+        if self.max_annotations is not None:
+            shards = [[]]
+            num_annotations = 0
+            for image in images:
+                count = image.get_num_annotations()
+                if shards[-1] and num_annotations + count > self.max_annotations:
+                    shards.append([])
+                    num_annotations = 0
+                shards[-1].append(image)
+                num_annotations += count
+            return shards
+
+        num_shards = max(1, min(self.num_shards or 1, len(images)))
+        bounds = [len(images) * i // num_shards for i in range(num_shards + 1)]
+        return [images[start:stop] for start, stop in zip(bounds, bounds[1:])]
+
+
+def get_shard_filename(split, index, count):
+    return f"{split or 'shard'}-{index:05d}-of-{count:05d}.json"
+
+def get_categories(images):
+    # The COCO categories table of the (category_id, category) pairs of the annotations
+    categories = {(anno_data.get("category_id"), anno_data["category"]) for image in images for anno_data in image.get_anno_datas()}
+    return [{"id": category_id, "name": category, "supercategory": SUPERCATEGORY}
+            for category_id, category in sorted(categories, key=lambda item: (item[0] is None, item))]
+
+def get_anno_datas(images):
+    if images and hasattr(images[0], "store"):
+        # ColumnarImage: the rows of all the images are converted at once
+        rows = [row for image in images for row in image.rows]
+        return images[0].store.to_dicts(rows)
+    return [anno_data for image in images for anno_data in image.get_anno_datas()]
+
+def write_shard(output_path, images, categories, ensure_ascii=True, codec=DEFAULT_CODEC):
+    # A COCO file with the images, their annotations and the categories table of the whole
+    # dataset, and its entry of the manifest
+    anno_datas = get_anno_datas(images)
+    codec.dump({
+        "images": [image.json_data for image in images],
+        "annotations": anno_datas,
+        "categories": categories,
+    }, output_path, ensure_ascii)
+    histogram = collections.Counter(anno_data.get("category_id") for anno_data in anno_datas)
+    return {
+        "file": os.path.basename(output_path),
+        "images": len(images),
+        "annotations": len(anno_datas),
+        "bytes": os.path.getsize(output_path),
+        # Number of annotations per category id
+        "category_histogram": {str(category_id): count for category_id, count in sorted(histogram.items(), key=lambda item: (item[0] is None, item))},
+    }
+
+def write_shards(dataset, output_dir, sharding, categories=None, processes=1, ensure_ascii=True, codec=DEFAULT_CODEC):
+    # Write the shards of dataset to output_dir, in a pool of processes when there are several,
+    # and a manifest with the counts of every shard. Returns the manifest.
+    os.makedirs(output_dir, exist_ok=True)
+    shards = sharding.split(dataset.get_images())
+    if categories is None:
+        categories = get_categories(dataset.get_images())
+    split_counts = collections.Counter(split for split, _ in shards)
+    split_indexes = collections.Counter()
+    tasks = []
+    for split, images in shards:
+        filename = get_shard_filename(split, split_indexes[split], split_counts[split])
+        split_indexes[split] += 1
+        tasks.append((os.path.join(output_dir, filename), images, categories, ensure_ascii, codec))
+
+    trace.info(f"Writing {len(tasks)} shards to {output_dir}")
+    with trace.span("write shards", "io", shards=len(tasks), processes=processes):
+        if processes > 1 and len(tasks) > 1 and "fork" in multiprocessing.get_all_start_methods():
+            # The workers get the images through fork, and only send back the manifest entries
+            global _worker_tasks
+            _worker_tasks = tasks
+            try:
+                with multiprocessing.get_context("fork").Pool(min(processes, len(tasks))) as pool:
+                    entries = pool.map(write_task, range(len(tasks)))
+            finally:
+                _worker_tasks = None
+        else:
+            entries = [write_shard(*task) for task in tasks]
+
+    for (split, _), entry in zip(shards, entries):
+        entry["split"] = split
+    manifest = {
+        "images": sum(entry["images"] for entry in entries),
+        "annotations": sum(entry["annotations"] for entry in entries),
+        "categories": categories,
+        "shards": entries,
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=ensure_ascii)
+    return manifest
+
+
+_worker_tasks = None
+
+def write_task(index):
+    # Runs in a worker process, which inherited the tasks through fork
+    return write_shard(*_worker_tasks[index])
@@ -0,0 +1,96 @@
+from dataset.dataset import SMALL_BBOX_AREA, get_annotation_bbox_version
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SmallBboxFilter:
+    # Decides which annotations are small bboxes. With relative=True, threshold is a fraction
+    # of the image area (width * height) instead of an area in pixels.
+    def __init__(self, threshold=SMALL_BBOX_AREA, relative=False):
+        self.threshold = threshold
+        self.relative = relative
+
+    def get_key(self):
+        return (self.threshold, self.relative)
+
+    def get_image_threshold(self, image):
+        if self.relative:
+            return self.threshold * image.json_data["width"] * image.json_data["height"]
+        return self.threshold
+
+    def image_mask(self, image):
+        # Small bbox flags of the annotations of one image
+        threshold = self.get_image_threshold(image)
+        return [annotation.get_area() < threshold for annotation in image.get_annotations()]
+
+    def compute_mask(self, dataset):
+        # Small bbox flags of dataset.get_all_annotations(), in the same order
+        if hasattr(dataset, "store"):
+            return self.compute_columnar_mask(dataset)
+
+        mask = []
+        for image in dataset.get_images():
+            threshold = self.get_image_threshold(image)
+            for annotation in image.get_annotations():
+                bbox = annotation.json_data["bbox"]
+                mask.append(bbox[3] * bbox[2] < threshold)
+        return mask
+
+    def compute_columnar_mask(self, dataset):
+        rows = dataset.get_rows()
+        areas = dataset.store.get_areas()[rows]
+        if not self.relative:
+            return areas < self.threshold
+        images = dataset.get_images()
+        thresholds = np.array([self.get_image_threshold(image) for image in images], dtype=np.float64)
+        counts = [len(image.rows) for image in images]
+        return areas < np.repeat(thresholds, counts)
+
+    def get_mask(self, dataset):
+        # compute_mask, cached on the dataset until its annotations or their bboxes change
+        version = get_bbox_version(dataset)
+        cached = dataset.small_bbox_masks.get(self.get_key())
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        mask = self.compute_mask(dataset)
+        dataset.small_bbox_masks[self.get_key()] = (version, mask)
+        return mask
+
+    def count(self, dataset):
+        mask = self.get_mask(dataset)
+        if hasattr(dataset, "store"):
+            return int(mask.sum())
+        return sum(mask)
+
+    def fill(self, dataset, field, value):
+        # Set field to value on every small bbox annotation
+        mask = self.get_mask(dataset)
+        if hasattr(dataset, "store"):
+            dataset.store.fill(dataset.get_rows()[mask], field, value)
+            return dataset
+
+        for annotation, small in zip(dataset.get_all_annotations(), mask):
+            if small:
+                annotation.set_field(field, value)
+        return dataset
+
+    def clear_captions(self, dataset):
+        return self.fill(dataset, "caption", "")
+
+    def clear_labels(self, dataset):
+        return self.fill(dataset, "label", -1)
+
+    def clear_negative_tags(self, dataset):
+        return self.fill(dataset, "negative_tags", "")
+
+
+def get_bbox_version(dataset):
+    if hasattr(dataset, "store"):
+        return dataset.store.bbox_version
+    return get_annotation_bbox_version()
+
+
+DEFAULT_SMALL_BBOX_FILTER = SmallBboxFilter()
@@ -0,0 +1,103 @@
+import collections
+
+from dataset import trace
+from dataset.dataset import Dataset
+from dataset.pipeline import paused_gc
+
+# Copy-on-write snapshots of a Dataset, to compare variants of the processing on one loaded
+# dataset without reloading the file or copying every record:
+#   variant = fork_dataset(dataset)
+#   CategoryNormalizer(other_refine_map).apply(variant)
+#   for kind, annotation_id, fields in diff_datasets(dataset, variant):
+#       ...
+
+
+class Missing:
+    # The value of a field an annotation does not have, in the fields of a change
+    def __repr__(self):
+        return "MISSING"
+
+MISSING = Missing()
+
+
+def fork_dataset(dataset):
+    # A fork has its own images and annotations, which share their records with those of
+    # dataset until either side changes them. Both sides must then change records with the
+    # setters (or set_field) only, which copy a shared record before its first change.
+    with paused_gc(), trace.span("fork", "dataset", images=len(dataset.get_images())):
+        fork = Dataset({"images": [], "annotations": []})
+        fork.set_images([image.fork() for image in dataset.get_images()])
+    return fork
+
+def get_origin(annotation):
+    # The record an annotation was first forked from, the same for every copy of it. Ids may
+    # be rewritten by the processing, so they cannot pair the copies.
+    return annotation.origin if annotation.origin is not None else annotation.json_data
+
+def diff_fields(old_data, new_data):
+    # {field: (old value, new value)} of the fields that differ, in the order of the new record
+    fields = {}
+    for field, value in new_data.items():
+        old_value = old_data.get(field, MISSING)
+        if type(old_value) is not type(value) or old_value != value:
+            fields[field] = (old_value, value)
+    for field, old_value in old_data.items():
+        if field not in new_data:
+            fields[field] = (old_value, MISSING)
+    return fields
+
+def diff_datasets(old_dataset, new_dataset):
+    # The annotations that differ between two snapshots of a dataset, as (kind, annotation_id,
+    # fields) tuples. kind is "changed", "added" or "removed", annotation_id is the id in
+    # new_dataset (in old_dataset when removed) and fields is {field: (old value, new value)},
+    # every field for an added or removed annotation. Changed and added annotations are listed
+    # in the order of new_dataset, then the removed ones.
+    # Annotations still sharing their record are not compared field by field.
+    with paused_gc(), trace.span("diff", "dataset", images=len(new_dataset.get_images())):
+        # Key is the id of the origin, value is the first annotation of old_dataset with it
+        old_annotations = {}
+        # The next ones, as a lazy dataset with duplicate image ids has several annotations
+        # on the same record
+        duplicates = collections.defaultdict(collections.deque)
+        for image in old_dataset.get_images():
+            for annotation in image.get_annotations():
+                key = id(get_origin(annotation))
+                if key in old_annotations:
+                    duplicates[key].append(annotation)
+                else:
+                    old_annotations[key] = annotation
+
+        changes = []
+        for image in new_dataset.get_images():
+            for annotation in image.get_annotations():
+                key = id(get_origin(annotation))
+                old_annotation = old_annotations.pop(key, None)
+                if duplicates.get(key):
+                    old_annotations[key] = duplicates[key].popleft()
+                if old_annotation is None:
+                    changes.append(("added", annotation.get_id(), diff_fields({}, annotation.json_data)))
+                elif old_annotation.json_data is not annotation.json_data:
+                    fields = diff_fields(old_annotation.json_data, annotation.json_data)
+                    if fields:
+                        changes.append(("changed", annotation.get_id(), fields))
+
+        for annotation in list(old_annotations.values()) + [annotation for rest in duplicates.values() for annotation in rest]:
+            changes.append(("removed", annotation.get_id(), diff_fields(annotation.json_data, {})))
+    return changes
+
+def count_changes(changes):
+    # Number of added and removed annotations, and of changed annotations per changed field
+    counts = collections.Counter()
+    for kind, _, fields in changes:
+        if kind == "changed":
+            counts.update(fields.keys())
+        else:
+            counts[kind] += 1
+    return counts
+
+def print_changes(changes, limit=10):
+    # A summary of the changes, and the first limit of them
+    for name, count in count_changes(changes).most_common():
+        trace.info(f"{name}: {count} annotations")
+    for kind, annotation_id, fields in changes[:limit]:
+        trace.info(f"{kind} annotation {annotation_id}: " + ", ".join(f"{field} {old!r} -> {new!r}" for field, (old, new) in fields.items()))
@@ -0,0 +1,162 @@
+import os
+import json
+import itertools
+import collections
+
+from dataset.cache import hash_file
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Every category of the COCO categories table gets this supercategory
+SUPERCATEGORY = "marine"
+# The counts kept per category
+STATISTICS = ("annotations", "small_bboxes", "captioned", "images")
+
+
+class CategoryStatistics:
+    # Counts per (category_id, category): annotations, small bboxes, annotations with a non-empty
+    # caption and images with at least one annotation of the category, counted in one pass once
+    # the categories and captions are final. category_analysis.txt and the COCO categories table
+    # are both written from these counts.
+    def __init__(self):
+        # Key is the statistic, value is a Counter keyed by (category_id, category)
+        self.counts = {name: collections.Counter() for name in STATISTICS}
+
+    def add_image(self, image, mask):
+        annotations = self.counts["annotations"]
+        small_bboxes = self.counts["small_bboxes"]
+        captioned = self.counts["captioned"]
+        keys = set()
+        for anno_data, small in zip(image.get_anno_datas(), mask):
+            key = (anno_data["category_id"], anno_data["category"])
+            annotations[key] += 1
+            if small:
+                small_bboxes[key] += 1
+            if anno_data.get("caption"):
+                captioned[key] += 1
+            keys.add(key)
+        images = self.counts["images"]
+        for key in keys:
+            images[key] += 1
+
+    def add_dataset(self, dataset, small_bbox_filter):
+        mask = small_bbox_filter.get_mask(dataset)
+        if hasattr(dataset, "store") and not dataset.store.others.get("category") and not dataset.store.others.get("category_id"):
+            return self.add_columnar(dataset, mask)
+
+        # The same counts as add_image over every image, with one Counter.update per statistic
+        anno_datas = []
+        image_keys = []
+        for image in dataset.get_images():
+            image_datas = image.get_anno_datas()
+            anno_datas.extend(image_datas)
+            image_keys.extend({(anno_data["category_id"], anno_data["category"]) for anno_data in image_datas})
+        keys = [(anno_data["category_id"], anno_data["category"]) for anno_data in anno_datas]
+        self.counts["annotations"].update(keys)
+        self.counts["small_bboxes"].update(itertools.compress(keys, mask))
+        self.counts["captioned"].update(itertools.compress(keys, [anno_data.get("caption") for anno_data in anno_datas]))
+        self.counts["images"].update(image_keys)
+        return self
+
+    def add_columnar(self, dataset, mask):
+        # The same counts as add_image over every image, as bincounts over the columns
+        store = dataset.store
+        rows = dataset.get_rows()
+        if len(rows) == 0:
+            return self
+        table = store.strings["category"]
+        category_ids = store.ints["category_id"][rows]
+        category_codes = store.codes["category"][rows]
+        # One key per (category_id, category) pair, numbered 0..len(unique_keys) - 1 by inverse
+        unique_keys, first_rows, inverse = np.unique(category_ids * len(table) + category_codes,
+                                                     return_index=True, return_inverse=True)
+        num_keys = len(unique_keys)
+        # Rows without a caption hold None in the column
+        column = store.objects.get("caption", [None] * store.size)
+        has_caption = np.fromiter((bool(column[row]) for row in rows.tolist()), dtype=bool, count=len(rows))
+        counts = [len(image.rows) for image in dataset.get_images()]
+        image_keys = np.unique(np.repeat(np.arange(len(counts), dtype=np.int64), counts) * num_keys + inverse)
+        values = {
+            "annotations": np.bincount(inverse, minlength=num_keys),
+            "small_bboxes": np.bincount(inverse[np.asarray(mask, dtype=bool)], minlength=num_keys),
+            "captioned": np.bincount(inverse[has_caption], minlength=num_keys),
+            "images": np.bincount(image_keys % num_keys, minlength=num_keys),
+        }
+        keys = [(category_id, table[code]) for category_id, code in
+                zip(category_ids[first_rows].tolist(), category_codes[first_rows].tolist())]
+        for name, counts in values.items():
+            self.counts[name].update({key: count for key, count in zip(keys, counts.tolist()) if count})
+        return self
+
+    def get_categories(self):
+        # (category_id, category) pairs with at least one annotation, sorted by id
+        categories = sorted(key for key, count in self.counts["annotations"].items() if count > 0)
+        names = {}
+        for category_id, category in categories:
+            # Check is the category_name match or not
+            assert names.setdefault(category_id, category) == category, f"Category name mismatch {names[category_id]} vs {category}"
+        return categories
+
+    def get_category_count(self):
+        # Key is the category_id, value is (category_name, count), as processing.write_category_analysis takes it
+        annotations = self.counts["annotations"]
+        return {category_id: (category, annotations[(category_id, category)]) for category_id, category in self.get_categories()}
+
+    def get_coco_categories(self, supercategory=SUPERCATEGORY):
+        return [{"id": category_id, "name": category, "supercategory": supercategory}
+                for category_id, category in self.get_categories()]
+
+    def get_statistics(self):
+        statistics = []
+        for key in self.get_categories():
+            entry = {"id": key[0], "name": key[1]}
+            for name in STATISTICS:
+                entry[name] = self.counts[name][key]
+            entry["caption_coverage"] = round(entry["captioned"] / entry["annotations"], 4)
+            statistics.append(entry)
+        return statistics
+
+    def write_categories(self, output_path):
+        # The COCO categories table, with the statistics of every category next to it
+        with open(output_path, 'w', encoding="utf-8") as f:
+            json.dump({"categories": self.get_coco_categories(), "statistics": self.get_statistics()}, f, indent=1)
+
+
+def read_categories(categories_path):
+    # The COCO categories table written by CategoryStatistics.write_categories
+    with open(categories_path, 'r', encoding="utf-8") as f:
+        return json.load(f)["categories"]
+
+def get_categories_source(categories_path, source_path):
+    # The path of source_path from the folder of categories_path, and the hash of its content
+    folder = os.path.dirname(os.path.abspath(categories_path))
+    return {"path": os.path.relpath(os.path.abspath(source_path), folder), "sha256": hash_file(source_path)}
+
+def set_categories_source(categories_path, source_path):
+    # Record in the categories table the dataset file it was computed for, once that file is written
+    with open(categories_path, 'r', encoding="utf-8") as f:
+        table = json.load(f)
+    table["source"] = get_categories_source(categories_path, source_path)
+    with open(categories_path, 'w', encoding="utf-8") as f:
+        json.dump(table, f, indent=1)
+
+def read_categories_of(categories_path, source_path):
+    # The COCO categories table of source_path, or None when categories_path is missing or was
+    # computed for another file, or for another version of it
+    try:
+        with open(categories_path, 'r', encoding="utf-8") as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        return None
+    source = table.get("source")
+    if source is None or not os.path.exists(source_path):
+        return None
+    folder = os.path.dirname(os.path.abspath(categories_path))
+    if os.path.realpath(os.path.join(folder, source["path"])) != os.path.realpath(source_path):
+        return None
+    if source["sha256"] != hash_file(source_path):
+        return None
+    return table["categories"]
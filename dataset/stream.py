@@ -0,0 +1,312 @@
+import os
+import json
+import codecs
+import shutil
+import tempfile
+from array import array
+
+from dataset.dataset import Image, ProjectionError
+from dataset.codec import DEFAULT_CODEC, open_file, get_compression
+
+# Top-level arrays that are read one element at a time
+STREAMED_KEYS = ("images", "annotations")
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+class JsonReader:
+    # Incremental reader over a UTF-8 JSON file, tracking the byte offset of the read position.
+    # With a FieldProjection, the text is filtered by it as it is read, and the offsets are
+    # those of the filtered text. replaced is the number of values it replaced so far.
+    def __init__(self, f, chunk_size=CHUNK_SIZE, projection=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.projection = projection
+        # Text read but held back by the projection until the next chunk
+        self.tail = ""
+        self.replaced = 0
+        self.buffer = ""
+        self.pos = 0
+        self.byte_pos = 0
+        self.eof = False
+
+    def decode(self, chunk, final=False):
+        text = self.text_decoder.decode(chunk, final=final)
+        if self.projection is None:
+            return text
+        text, self.tail, count = self.projection.filter_text(self.tail + text, final)
+        self.replaced += count
+        return text
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer += self.decode(b"", final=True)
+            return False
+        # Drop the consumed part of the buffer before growing it
+        self.buffer = self.buffer[self.pos:] + self.decode(chunk)
+        self.pos = 0
+        return True
+
+    def advance(self, new_pos):
+        self.byte_pos += len(self.buffer[self.pos:new_pos].encode("utf-8"))
+        self.pos = new_pos
+
+    def peek(self):
+        # Skip whitespace and return the next character without consuming it
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _whitespace:
+                self.pos += 1
+                self.byte_pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at byte {self.byte_pos}, found {found!r}")
+        self.advance(self.pos + 1)
+
+    def read_value(self):
+        # Decode the next value, returning it with its start and end byte offsets
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # A number cut at the end of the buffer also decodes, so require a following character
+                if end < len(self.buffer) or self.eof:
+                    break
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+        start = self.byte_pos
+        self.advance(end)
+        return value, start, self.byte_pos
+
+
+def iter_json_items(json_path, streamed_keys=STREAMED_KEYS, projection=None):
+    # Yield (key, value, start, end) for every element of the streamed top-level arrays,
+    # and (key, value, None, None) for the other top-level values. With a FieldProjection, the
+    # annotations are projected, and the offsets are only meaningful within the filtered text.
+    # ProjectionError is raised at the end when the projection replaced a value outside the
+    # annotation fields, which was then yielded wrong.
+    # The offsets of a compressed file are those of the decompressed text.
+    with open_file(json_path, 'rb') as f:
+        reader = JsonReader(f, projection=projection)
+        skipped = 0
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key, _, _ = reader.read_value()
+            reader.expect(":")
+            if key in streamed_keys and reader.peek() == "[":
+                reader.expect("[")
+                if reader.peek() == "]":
+                    reader.expect("]")
+                else:
+                    while True:
+                        value, start, end = reader.read_value()
+                        if projection is not None and key == "annotations":
+                            skipped += projection.count_skipped(value)
+                            projection.project(value)
+                        yield key, value, start, end
+                        if reader.peek() == ",":
+                            reader.expect(",")
+                        else:
+                            reader.expect("]")
+                            break
+            else:
+                value, _, _ = reader.read_value()
+                yield key, value, None, None
+
+            if reader.peek() == ",":
+                reader.expect(",")
+            else:
+                reader.expect("}")
+                break
+        if reader.replaced != skipped:
+            raise ProjectionError(f"{json_path} has fields {', '.join(projection.skipped)} outside the annotations")
+
+
+class ImageSequence:
+    # Sized, re-iterable view over the images of a StreamingDataset, loading one image at a time
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset.image_datas)
+
+    def __getitem__(self, position):
+        return self.dataset.load_image(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.dataset.load_image(position)
+
+
+class StreamingDataset:
+    # Read-mostly stand-in for Dataset that keeps only the image records and the byte offsets
+    # of every annotation in memory. Images are materialized one at a time from the file,
+    # so changes made to them are lost unless they are written out while iterating.
+    def __init__(self, json_path, codec=DEFAULT_CODEC):
+        if get_compression(json_path) is not None:
+            # The annotations are read back by seeking to their offsets
+            raise ValueError(f"{json_path} is compressed, it cannot be streamed")
+        self.json_path = json_path
+        self.codec = codec
+        self.image_datas = []
+        # Key is the image id, value is the start and end byte offsets of its annotations
+        self.anno_spans = {}
+        # Key is the image position, value is the annotations added by append_dataset
+        self.extra_annotations = {}
+        self.file = None
+
+        for key, value, start, end in iter_json_items(json_path):
+            if key == "images":
+                self.image_datas.append(value)
+            elif key == "annotations":
+                self.anno_spans.setdefault(value["image_id"], array('q')).extend((start, end))
+
+        self.reindex()
+
+    def reindex(self):
+        self.filename_index = None
+        self.image_id_index = None
+        self.annotation_id_index = None
+        self.small_bbox_masks = {}
+
+    def read_annotations(self, image_id):
+        spans = self.anno_spans.get(image_id)
+        if spans is None:
+            return []
+        if self.file is None:
+            self.file = open(self.json_path, 'rb')
+        anno_datas = []
+        for i in range(0, len(spans), 2):
+            self.file.seek(spans[i])
+            anno_datas.append(self.codec.loads(self.file.read(spans[i + 1] - spans[i])))
+        return anno_datas
+
+    def load_image(self, position):
+        image_data = self.image_datas[position]
+        image = Image(image_data, self.read_annotations(image_data["id"]))
+        for annotation in self.extra_annotations.get(position, []):
+            image.add_annotation(annotation)
+        return image
+
+    def get_images(self):
+        return ImageSequence(self)
+
+    def get_all_annotations(self):
+        for image in self.get_images():
+            yield from image.get_annotations()
+
+    def append_dataset(self, dataset):
+        # Returns the images of dataset that were not added
+        dropped = []
+        for image in dataset.get_images():
+            position = self.get_filename_index().get(image.get_filename())
+            if position is None:
+                # Do not add the image with only small bbox
+                dropped.append(image)
+            else:
+                self.extra_annotations.setdefault(position, []).extend(image.get_annotations())
+        self.small_bbox_masks = {}
+        return dropped
+
+    def get_image(self, filename):
+        position = self.get_filename_index().get(filename)
+        if position is None:
+            return None
+        return self.load_image(position)
+
+    def get_image_by_id(self, image_id):
+        position = self.get_image_id_index().get(image_id)
+        if position is None:
+            return None
+        return self.load_image(position)
+
+    # Unlike Dataset, the indexes map to image positions rather than Image objects
+
+    def get_filename_index(self):
+        if self.filename_index is None:
+            self.filename_index = {}
+            for position, image_data in enumerate(self.image_datas):
+                self.filename_index.setdefault(image_data["file_name"], position)
+        return self.filename_index
+
+    def get_image_id_index(self):
+        if self.image_id_index is None:
+            self.image_id_index = {}
+            for position, image_data in enumerate(self.image_datas):
+                self.image_id_index.setdefault(image_data["id"], position)
+        return self.image_id_index
+
+    def get_annotation_id_index(self):
+        if self.annotation_id_index is None:
+            self.annotation_id_index = {}
+            for position, image in enumerate(self.get_images()):
+                for annotation in image.get_annotations():
+                    self.annotation_id_index.setdefault(annotation.get_id(), position)
+        return self.annotation_id_index
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def write_json(output_path, images, codec=DEFAULT_CODEC, ensure_ascii=True):
+    # Write the images the same way as codec.dump(dataset.to_json(), output_path, ensure_ascii),
+    # one image at a time. The annotations are spooled to a temporary file next to the output
+    # until the images array is complete. Returns the number of images and annotations written.
+    item_separator = codec.item_separator.encode()
+    key_separator = codec.key_separator.encode()
+    num_images = 0
+    num_annotations = 0
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    with open_file(output_path, 'wb') as f, tempfile.TemporaryFile('w+b', dir=output_dir) as spool:
+        f.write(b"{" + codec.dumps("images") + key_separator + b"[")
+        for image in images:
+            if num_images > 0:
+                f.write(item_separator)
+            f.write(codec.dumps(image.json_data, ensure_ascii))
+            num_images += 1
+            for annotation in image.get_annotations():
+                if num_annotations > 0:
+                    spool.write(item_separator)
+                spool.write(codec.dumps(annotation.json_data, ensure_ascii))
+                num_annotations += 1
+
+        f.write(b"]" + item_separator + codec.dumps("annotations") + key_separator + b"[")
+        spool.seek(0)
+        shutil.copyfileobj(spool, f)
+        f.write(b"]}")
+
+    return num_images, num_annotations
+
+
+def spool_images(images, f):
+    # Write one [image, annotations] line per image, for a later pass to read back
+    for image in images:
+        anno_datas = [annotation.json_data for annotation in image.get_annotations()]
+        f.write(json.dumps([image.json_data, anno_datas], ensure_ascii=False))
+        f.write("\n")
+
+
+def iter_spooled_images(f):
+    f.seek(0)
+    for line in f:
+        image_data, anno_datas = json.loads(line)
+        yield Image(image_data, anno_datas)
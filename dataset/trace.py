@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING"}
+
+# At most RATE_LIMIT messages with the same key are printed per RATE_WINDOW seconds, the others
+# are counted, and the count printed when the next window starts or by Tracer.flush
+RATE_LIMIT = 20
+RATE_WINDOW = 1.0
+PROGRESS_INTERVAL = 5.0
+
+def read_status_kb(field):
+    # VmRSS / VmHWM of this process, or None where /proc is not available
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class Span:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        # Shown by the trace viewer, e.g. the number of images the span went through
+        self.args = args
+        self.start = None
+        self.cpu_start = None
+        self.rss_kb = None
+        self.peak_kb = None
+
+
+class Tracer:
+    # Records named spans (wall time, CPU time, peak RSS growth and item counts) and writes
+    # them as a Chrome trace (chrome://tracing or https://ui.perfetto.dev). Also the leveled,
+    # rate-limited log of the scripts, printed to stdout.
+    def __init__(self, level=INFO):
+        self.level = level
+        self.origin = time.perf_counter()
+        self.events = []
+        self.open_spans = []
+        # Key is the message key, value is [window start, messages in the window, suppressed]
+        self.rates = {}
+        # Key is the progress name, value is the time of the last progress message
+        self.last_progress = {}
+        self.track_rss = read_status_kb("VmHWM") is not None
+
+    def set_level(self, level):
+        self.level = level
+
+    def log(self, level, message, key=None):
+        if level < self.level:
+            return
+        # Messages are rate limited by key, which defaults to the message itself
+        key = message if key is None else key
+        now = time.perf_counter()
+        rate = self.rates.get(key)
+        if rate is None or now - rate[0] >= RATE_WINDOW:
+            if rate is not None and rate[2]:
+                self.print_suppressed(key, rate[2])
+            rate = self.rates[key] = [now, 0, 0]
+        rate[1] += 1
+        if rate[1] > RATE_LIMIT:
+            rate[2] += 1
+            return
+        if level == INFO:
+            print(message)
+        else:
+            print(f"[{LEVEL_NAMES[level]}] {message}")
+
+    def print_suppressed(self, key, count):
+        print(f"({count} more messages like {key!r} suppressed)")
+
+    def flush(self):
+        # Report the messages suppressed since the last one that got through
+        for key, rate in self.rates.items():
+            if rate[2]:
+                self.print_suppressed(key, rate[2])
+                rate[2] = 0
+
+    def debug(self, message, key=None):
+        self.log(DEBUG, message, key)
+
+    def info(self, message, key=None):
+        self.log(INFO, message, key)
+
+    def warning(self, message, key=None):
+        self.log(WARNING, message, key)
+
+    def progress(self, name, done, total=None):
+        # Printed at most every PROGRESS_INTERVAL seconds per name
+        now = time.perf_counter()
+        last = self.last_progress.setdefault(name, now)
+        if now - last < PROGRESS_INTERVAL:
+            return
+        self.last_progress[name] = now
+        if total:
+            self.info(f"{name}: {done}/{total} ({done / total:.0%})", key=name)
+        else:
+            self.info(f"{name}: {done}", key=name)
+
+    def update_peaks(self):
+        # The peak of every open span is folded in before VmHWM is reset, so nested spans
+        # do not hide the peak of the spans around them
+        peak_kb = read_status_kb("VmHWM")
+        for span in self.open_spans:
+            span.peak_kb = max(span.peak_kb, peak_kb)
+
+    @contextlib.contextmanager
+    def span(self, name, category="stage", **args):
+        span = Span(name, category, args)
+        if self.track_rss:
+            self.update_peaks()
+            reset_peak_rss()
+            span.rss_kb = span.peak_kb = read_status_kb("VmRSS")
+        self.open_spans.append(span)
+        span.start = time.perf_counter()
+        span.cpu_start = time.process_time()
+        try:
+            yield span
+        finally:
+            self.end_span(span)
+
+    def end_span(self, span):
+        seconds = time.perf_counter() - span.start
+        args = dict(span.args)
+        args["cpu_seconds"] = round(time.process_time() - span.cpu_start, 6)
+        if self.track_rss:
+            self.update_peaks()
+            args["peak_rss_delta_mib"] = round((span.peak_kb - span.rss_kb) / 1024, 1)
+        self.open_spans.remove(span)
+        self.add_event(span.name, span.category, span.start, seconds, args)
+        self.debug(f"{span.name}: {seconds:.3f}s", key=span.name)
+
+    def add_event(self, name, category, start, seconds, args):
+        # A complete ("X") event, with times in microseconds since the tracer was created
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self.origin) * 1e6, 1),
+            "dur": round(seconds * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def write(self, output_path):
+        self.info(f"Writing trace to {output_path}")
+        with open(output_path, 'w', encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms",
+                       "otherData": {"argv": sys.argv}}, f)
+
+
+# The tracer of the process, shared by the dataset package and the scripts
+tracer = Tracer()
+span = tracer.span
+debug = tracer.debug
+info = tracer.info
+warning = tracer.warning
+progress = tracer.progress
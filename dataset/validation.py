@@ -0,0 +1,241 @@
+import os
+import csv
+import json
+import itertools
+import multiprocessing
+
+from dataset import trace
+from dataset.pipeline import paused_gc
+from dataset.small_bbox import DEFAULT_SMALL_BBOX_FILTER
+
+REPORT_FIELDS = ("rule", "image_id", "annotation_id", "message")
+# Number of images given at once to the "images" rules
+IMAGES_RULE_BATCH = 4096
+
+
+class Rule:
+    def __init__(self, name, kind, func):
+        # kind is one of
+        #   "image": func(image, small_mask) returns a message or None
+        #   "annotation": func(image, annotation, small) returns a message or None
+        #   "unique_image" / "unique_annotation": func(image) / func(annotation) returns a key
+        #   that must be unique over the whole dataset
+        #   "images": func(images) returns the (position in images, annotation_id, message) of
+        #   every violation in a batch of images, for rules checked on many images at once
+        self.name = name
+        self.kind = kind
+        self.func = func
+
+
+class ShardResult:
+    # What checking a range of images found, merged into the Report by Validator.run
+    def __init__(self, unique_rules):
+        self.violations = []
+        # Key is the rule name, value is {key: (sequence, image_id, annotation_id)} of the first
+        # occurrence, where sequence numbers the keys in the order they were checked
+        self.first_seen = {rule.name: {} for rule in unique_rules}
+        # Later occurrences of a key within the shard, as (sequence, violation)
+        self.duplicates = []
+        self.num_keys = 0
+        self.num_images = 0
+        self.num_annotations = 0
+        self.num_small_bbox = 0
+
+
+class Report:
+    def __init__(self, rule_names):
+        self.violations = []
+        # Key is the rule name, value is the number of violations
+        self.counts = {name: 0 for name in rule_names}
+        self.num_images = 0
+        self.num_annotations = 0
+        self.num_small_bbox = 0
+
+    def add(self, violation):
+        self.violations.append(violation)
+        self.counts[violation[0]] += 1
+
+    def is_valid(self):
+        return not self.violations
+
+    def get_violations(self, rule):
+        return [violation for violation in self.violations if violation[0] == rule]
+
+    def print_summary(self):
+        print(f"Checked {self.num_images} images and {self.num_annotations} annotations, {self.num_small_bbox} small bboxes.")
+        for name, count in self.counts.items():
+            print(f"{name}: {count} violations")
+
+    def to_json(self):
+        return {
+            "num_images": self.num_images,
+            "num_annotations": self.num_annotations,
+            "num_small_bbox": self.num_small_bbox,
+            "counts": self.counts,
+            "violations": [dict(zip(REPORT_FIELDS, violation)) for violation in self.violations],
+        }
+
+    def write(self, output_path):
+        # A CSV with one row per violation if output_path ends with .csv, the JSON report otherwise
+        trace.info(f"Writing verification report to {output_path}")
+        if os.path.splitext(output_path)[1].lower() == ".csv":
+            with open(output_path, 'w', encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(REPORT_FIELDS)
+                writer.writerows(self.violations)
+        else:
+            with open(output_path, 'w', encoding="utf-8") as f:
+                json.dump(self.to_json(), f, ensure_ascii=False, indent=1)
+
+
+class Validator:
+    # Evaluates every registered rule in a single pass over the images, optionally split into
+    # shards checked by a pool of worker processes. Every violation is collected in a Report
+    # as a (rule, image_id, annotation_id, message) tuple.
+    def __init__(self, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+        self.small_bbox_filter = small_bbox_filter
+        self.rules = []
+
+    def add_image_rule(self, name, func):
+        self.rules.append(Rule(name, "image", func))
+        return self
+
+    def add_annotation_rule(self, name, func):
+        self.rules.append(Rule(name, "annotation", func))
+        return self
+
+    def add_unique_image_rule(self, name, func):
+        self.rules.append(Rule(name, "unique_image", func))
+        return self
+
+    def add_unique_annotation_rule(self, name, func):
+        self.rules.append(Rule(name, "unique_annotation", func))
+        return self
+
+    def add_images_rule(self, name, func):
+        self.rules.append(Rule(name, "images", func))
+        return self
+
+    def get_rules(self, kind):
+        return [rule for rule in self.rules if rule.kind == kind]
+
+    def check_images(self, images):
+        image_rules = self.get_rules("image")
+        annotation_rules = self.get_rules("annotation")
+        unique_image_rules = self.get_rules("unique_image")
+        unique_annotation_rules = self.get_rules("unique_annotation")
+        images_rules = self.get_rules("images")
+        result = ShardResult(unique_image_rules + unique_annotation_rules)
+
+        def see(rule, key, image_id, annotation_id):
+            first_seen = result.first_seen[rule.name]
+            sequence = result.num_keys
+            result.num_keys += 1
+            if key in first_seen:
+                result.duplicates.append((sequence, (rule.name, image_id, annotation_id, f"{key!r} is not unique")))
+            else:
+                first_seen[key] = (sequence, image_id, annotation_id)
+
+        with paused_gc():
+            # The images rules get the images batch by batch, so that a StreamingDataset is
+            # never loaded all at once
+            images = iter(images)
+            while True:
+                batch = list(itertools.islice(images, IMAGES_RULE_BATCH))
+                if not batch:
+                    break
+                # Key is the position of the image in the batch, value is its violations of the
+                # images rules, reported after its other violations as if checked image by image
+                batch_violations = {}
+                for rule in images_rules:
+                    for position, annotation_id, message in rule.func(batch):
+                        batch_violations.setdefault(position, []).append((rule.name, batch[position].get_id(), annotation_id, message))
+
+                for position, image in enumerate(batch):
+                    image_id = image.get_id()
+                    annotations = image.get_annotations()
+                    small_mask = self.small_bbox_filter.image_mask(image)
+                    result.num_images += 1
+                    result.num_annotations += len(annotations)
+                    result.num_small_bbox += sum(small_mask)
+
+                    for rule in unique_image_rules:
+                        see(rule, rule.func(image), image_id, None)
+                    for rule in image_rules:
+                        message = rule.func(image, small_mask)
+                        if message is not None:
+                            result.violations.append((rule.name, image_id, None, message))
+
+                    for annotation, small in zip(annotations, small_mask):
+                        annotation_id = annotation.get_id()
+                        for rule in unique_annotation_rules:
+                            see(rule, rule.func(annotation), image_id, annotation_id)
+                        for rule in annotation_rules:
+                            message = rule.func(image, annotation, small)
+                            if message is not None:
+                                result.violations.append((rule.name, image_id, annotation_id, message))
+                    result.violations.extend(batch_violations.get(position, ()))
+        return result
+
+    def run(self, dataset, processes=1, shards_per_process=4):
+        images = dataset.get_images()
+        num_images = len(images)
+        if processes > 1 and num_images > 0 and "fork" in multiprocessing.get_all_start_methods():
+            # The workers inherit the dataset and the validator through fork, so that only
+            # the shard bounds and the results are sent between processes
+            shard_size = -(-num_images // (processes * shards_per_process))
+            bounds = [(start, min(start + shard_size, num_images)) for start in range(0, num_images, shard_size)]
+            global _worker_state
+            _worker_state = (self, dataset)
+            try:
+                context = multiprocessing.get_context("fork")
+                with context.Pool(processes, initializer=init_worker) as pool:
+                    results = pool.map(check_shard, bounds)
+            finally:
+                _worker_state = None
+        else:
+            results = [self.check_images(images)]
+        return self.merge(results)
+
+    def merge(self, results):
+        report = Report([rule.name for rule in self.rules])
+        first_seen = {name: {} for name in results[0].first_seen} if results else {}
+        duplicates = []
+        for result in results:
+            report.num_images += result.num_images
+            report.num_annotations += result.num_annotations
+            report.num_small_bbox += result.num_small_bbox
+            for violation in result.violations:
+                report.add(violation)
+            # Keys first seen in this shard are duplicates if an earlier shard had them. They are
+            # put back in the order they were checked among the duplicates within the shard, so
+            # that the report is the same whatever the number of shards.
+            shard_duplicates = list(result.duplicates)
+            for name, keys in result.first_seen.items():
+                seen = first_seen[name]
+                for key, (sequence, image_id, annotation_id) in keys.items():
+                    if key in seen:
+                        shard_duplicates.append((sequence, (name, image_id, annotation_id, f"{key!r} is not unique")))
+                    else:
+                        seen[key] = (image_id, annotation_id)
+            shard_duplicates.sort(key=lambda duplicate: duplicate[0])
+            duplicates.extend(violation for _, violation in shard_duplicates)
+
+        for violation in duplicates:
+            report.add(violation)
+        return report
+
+
+_worker_state = None
+
+def init_worker():
+    # A StreamingDataset must not share its open file, and its read position, with the parent
+    _, dataset = _worker_state
+    if hasattr(dataset, "close"):
+        dataset.close()
+
+def check_shard(bounds):
+    validator, dataset = _worker_state
+    images = dataset.get_images()
+    start, stop = bounds
+    return validator.check_images(images[position] for position in range(start, stop))
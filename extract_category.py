@@ -1,33 +1,72 @@
 import os
-import json
 
-from dataset.dataset import Dataset, Image, Annotation
+from dataset import trace
+from dataset.dataset import Dataset, Image, Annotation, FieldProjection
+from dataset.stream import StreamingDataset
+from dataset.cache import load_json
+from dataset.statistics import read_categories_of
+from dataset.codec import DEFAULT_CODEC, get_codec
 
-def main(json_path):
-    with open(json_path, 'r', encoding="utf-8") as f:
-        print(f"Loading {json_path}")
-        json_data = json.load(f)
+# Only the category of every annotation is read, and image_id to group them by image
+CATEGORY_PROJECTION = FieldProjection(keep=("image_id", "category_id", "category"), drop=("segmentation", "bbox"))
 
+def main(json_path, stream=False, cache=False, categories_path=None, codec=DEFAULT_CODEC):
+    # processing.py writes the categories table next to category_analysis.txt, with the path
+    # and content hash of its output, so the processed dataset only has to be read when the
+    # table is missing or was written for another file
+    category_list = None if categories_path is None else read_categories_of(categories_path, json_path)
+    if category_list is not None:
+        trace.info(f"Read the categories from {categories_path}")
+        category_list = [{"id": category["id"], "name": category["name"]} for category in category_list]
+    else:
+        category_list = scan_categories(json_path, stream, cache, codec)
+    print_categories(category_list)
+
+def print_categories(category_list):
+    for category in category_list:
+        print(category)
+
+def scan_categories(json_path, stream, cache, codec):
+    if stream:
+        trace.info(f"Streaming {json_path}")
+        dataset = StreamingDataset(json_path, codec)
+    else:
+        trace.info(f"Loading {json_path}")
+        json_data = load_json(json_path, cache, CATEGORY_PROJECTION, codec)
 
-    dataset = Dataset(json_data)
 
+        # Only the annotation dicts are read, so no Annotation objects are needed
+        dataset = Dataset(json_data, lazy=True)
+    category_list = get_category_list(dataset)
+    if stream:
+        dataset.close()
+    return category_list
+
+def get_category_list(dataset):
     # key is the category id
     # value is the category name
     categories = {}
-    for annotation in dataset.get_all_annotations():
-        category = annotation.get_category()
-        category_id = annotation.get_category_id()
-        if category_id not in categories:
-            categories[category_id] = category
+    for image in dataset.get_images():
+        for anno_data in image.get_anno_datas():
+            category_id = anno_data["category_id"]
+            if category_id not in categories:
+                categories[category_id] = anno_data["category"]
 
     category_list = []
-    for category_id, category_name in categories.items():
+    for category_id, category_name in sorted(categories.items()):
         category_list.append({"id": category_id, "name": category_name})
-
-    for category in category_list:
-        print(category)
+    return category_list
 
 
 if __name__ == "__main__":
     json_path = "./data/combined_processed.json"
-    main(json_path)
\ No newline at end of file
+    # Read the file image by image instead of loading it all
+    stream = False
+    # Keep a binary snapshot of the parsed file next to it, reused while the file is unchanged.
+    # It takes up to twice the size of the file on disk (see dataset.cache).
+    cache = False
+    # The categories table written by processing.py, used instead of reading json_path when it was written for it
+    categories_path = "./data/categories.json"
+    # The JSON parser: orjson when it is installed, json otherwise
+    codec = get_codec()
+    main(json_path, stream, cache, categories_path, codec)
\ No newline at end of file
@@ -1,6 +1,23 @@
 import os
-import json
+import functools
+from dataset import trace
 from dataset.dataset import Dataset, Image, Annotation
+from dataset.pipeline import Pipeline
+from dataset.stream import StreamingDataset
+from dataset.columnar import ColumnarDataset
+from dataset.category import CategoryNormalizer
+from dataset.caption import CaptionNormalizer
+from dataset.statistics import CategoryStatistics, read_categories, set_categories_source
+from dataset.shard import Sharding, write_shards
+from dataset.cache import load_dataset
+from dataset.small_bbox import SmallBboxFilter, DEFAULT_SMALL_BBOX_FILTER
+from dataset.codec import DEFAULT_CODEC, get_codec
+from dataset.remap import IdRemap, get_remap_path
+
+# Where the category statistics are written by default: category_analysis.txt, and the COCO
+# categories table that extract_category.py reads instead of the processed dataset
+CATEGORY_ANALYSIS_PATH = "./data/category_analysis.txt"
+CATEGORIES_PATH = "./data/categories.json"
 
 def get_all_categories(dataset):
     categories = set()
@@ -21,203 +38,359 @@ def define_category_id(dataset):
 
     return dataset
 
-def process_category(dataset):
-    refine_map = {
-        "moray eels": "moray eel",
-        "nurse sharks": "nurse shark",
-        "orca (killer whale)": "orca",
-        "sea star (starfish)": "sea star",
-        "sharks as wild animals": "shark",
-        "spong": "sponge",
-        "whale sharks": "whale shark",
-        "whitetip reef sharks": "whitetip reef shark",
-        "wrasses": "wrasse",
-        "crinoids (feather stars)": "crinoid",
-        "belly countershading (on whale sharks)": "whale shark",
-        "black rock sharks (unspecified species)": "black rock shark",
-        "zebra shark juveniles (rarely seen with stripes)": "zebra shark",
-        "banded sea kraits": "banded sea krait",
-        "banggai cardinal fis": "banggai cardinalfish",
-        "bare tailed goatfis": "bare-tailed goatfish",
-        "beaked coral fis": "beaked coral fish",
-        "beluga": "beluga whale",
-        "blackfin": "blackfin tuna",
-        "blue-spotted stingrays": "Bluespotted ribbontail ray",
-        "bluespotted stingrays": "Bluespotted ribbontail ray",
-        "clark's anemone fis": "clark's anemonefish",
-        "crown of thorns starfish": "crown-of-thorns starfish",
-        "dendronephthya soft corals": "dendronephthya",
-        "fihs": "fish",
-        "fimbriated morays": "fimbriated moray",
-        "fsh": "fish",
-        "giant manta rays": "giant manta ray",
-        "grey reef sharks": "grey reef shark",
-        "harlequin shrimps": "harlequin shrimp",
-        "horned banner fis": "horned bannerfish",
-        "juvenile emperor angelfis": "emperor angelfish",
-        "leopard sharks (also known as zebra sharks)": "leopard shark",
-        "moorish idols": "moorish idol",
-        "yellow mask angel fis": "yellow mask angelfish",
-        "yellow mask surgeron fis": "yellow mask surgeonfish",
-        "yellow-edged morays": "yellow-edged moray",
-        "croal": "coral",
-
-        "albacore tuna": "albacore",
-        "anemone": "sea anemone",
-        "angel shark": "angelshark",
-        "bare-tailed goatfish": "bare tailed goatfish",
-        "butterfly fish": "butterflyfish",
-        "chionoecetes opilio underwater": "chionoecetes opilio",
-        "clown fish": "clownfish",
-        "common octopus": "octopus",
-        "common decorator crab": "decorator crab",
-        "common whelk": "whelk",
-        "crinoids": "crinoid",
-        "jelly fish": "jellyfish",
-        "longtail": "tuna",
-        "manta": "manta ray",
-        "octopuscoral": "coral",
-        "porcupine fish": "porcupinefish",
-        "scsllop": "scallop",
-        "sea eel": "eel",
-        "sea snell": "seashell",
-        "sea ship": "sea whip",
-        "sea urchine": "sea urchin",
-        "sea weed": "seaweed",
-        "sea shell": "seashell",
-        "shell": "seashell",
-        "unicorn fish": "unicornfish",
-        "yellowfin": "yellowfin tuna",
-        "pink anemone fis": "pink anemone fish",
-        "red tailed butterfly fis": "red tailed butterfly fish",
-        "goby fish": "goby",
-        "sea fans": "sea fan",
-        "sea grape": "seagrape",
-
-        "atlantic blue marlin": "marlin",
-        "sailfish": "marilin",
-        "benthic cnidarian": "coral",
-        "pacific bluefin": "tuna",
-        "atlantic bluefin": "tuna",
-        "southern bluefin": "tuna",
-        "chimera monstrosa": "chimaera",
-        "finback": "whale",
-        "giant frogfish": "frogfish",
-        "goby fish": "goby",
-        "humpback": "whale",
-        "right whale": "whale",
-        "minke whale": "whale",
-        "narwhal": "whale",
-        "megalodon": "whale",
-        "large shark": "fish",
-        "sea worm": "feather duster worm",
-        "kind crab": "red king crab",
-        # "lontra canadensis": "otter",
-    }
-    #by html
-    #refine imageid 7350 -> marlin
-    #refine imageid 7761 -> bigeye tuna
-    #refine imageid 11569 -> fish -> starry flounder
+REFINE_MAP = {
+    "moray eels": "moray eel",
+    "nurse sharks": "nurse shark",
+    "orca (killer whale)": "orca",
+    "sea star (starfish)": "sea star",
+    "sharks as wild animals": "shark",
+    "spong": "sponge",
+    "whale sharks": "whale shark",
+    "whitetip reef sharks": "whitetip reef shark",
+    "wrasses": "wrasse",
+    "crinoids (feather stars)": "crinoid",
+    "belly countershading (on whale sharks)": "whale shark",
+    "black rock sharks (unspecified species)": "black rock shark",
+    "zebra shark juveniles (rarely seen with stripes)": "zebra shark",
+    "banded sea kraits": "banded sea krait",
+    "banggai cardinal fis": "banggai cardinalfish",
+    "bare tailed goatfis": "bare-tailed goatfish",
+    "beaked coral fis": "beaked coral fish",
+    "beluga": "beluga whale",
+    "blackfin": "blackfin tuna",
+    "blue-spotted stingrays": "Bluespotted ribbontail ray",
+    "bluespotted stingrays": "Bluespotted ribbontail ray",
+    "clark's anemone fis": "clark's anemonefish",
+    "crown of thorns starfish": "crown-of-thorns starfish",
+    "dendronephthya soft corals": "dendronephthya",
+    "fihs": "fish",
+    "fimbriated morays": "fimbriated moray",
+    "fsh": "fish",
+    "giant manta rays": "giant manta ray",
+    "grey reef sharks": "grey reef shark",
+    "harlequin shrimps": "harlequin shrimp",
+    "horned banner fis": "horned bannerfish",
+    "juvenile emperor angelfis": "emperor angelfish",
+    "leopard sharks (also known as zebra sharks)": "leopard shark",
+    "moorish idols": "moorish idol",
+    "yellow mask angel fis": "yellow mask angelfish",
+    "yellow mask surgeron fis": "yellow mask surgeonfish",
+    "yellow-edged morays": "yellow-edged moray",
+    "croal": "coral",
 
-    for annotation in dataset.get_all_annotations():
-        category = annotation.get_category()
-        if category in refine_map:
-            print(f"Refine {category} to {refine_map[category]}")
-            annotation.set_category(refine_map[category])
+    "albacore tuna": "albacore",
+    "anemone": "sea anemone",
+    "angel shark": "angelshark",
+    "bare-tailed goatfish": "bare tailed goatfish",
+    "butterfly fish": "butterflyfish",
+    "chionoecetes opilio underwater": "chionoecetes opilio",
+    "clown fish": "clownfish",
+    "common octopus": "octopus",
+    "common decorator crab": "decorator crab",
+    "common whelk": "whelk",
+    "crinoids": "crinoid",
+    "jelly fish": "jellyfish",
+    "longtail": "tuna",
+    "manta": "manta ray",
+    "octopuscoral": "coral",
+    "porcupine fish": "porcupinefish",
+    "scsllop": "scallop",
+    "sea eel": "eel",
+    "sea snell": "seashell",
+    "sea ship": "sea whip",
+    "sea urchine": "sea urchin",
+    "sea weed": "seaweed",
+    "sea shell": "seashell",
+    "shell": "seashell",
+    "unicorn fish": "unicornfish",
+    "yellowfin": "yellowfin tuna",
+    "pink anemone fis": "pink anemone fish",
+    "red tailed butterfly fis": "red tailed butterfly fish",
+    "goby fish": "goby",
+    "sea fans": "sea fan",
+    "sea grape": "seagrape",
 
-        category = annotation.get_category()
-        new_category = category.strip().lower()
-        annotation.set_category(new_category)
+    "atlantic blue marlin": "marlin",
+    "sailfish": "marilin",
+    "benthic cnidarian": "coral",
+    "pacific bluefin": "tuna",
+    "atlantic bluefin": "tuna",
+    "southern bluefin": "tuna",
+    "chimera monstrosa": "chimaera",
+    "finback": "whale",
+    "giant frogfish": "frogfish",
+    "goby fish": "goby",
+    "humpback": "whale",
+    "right whale": "whale",
+    "minke whale": "whale",
+    "narwhal": "whale",
+    "megalodon": "whale",
+    "large shark": "fish",
+    "sea worm": "feather duster worm",
+    "kind crab": "red king crab",
+    # "lontra canadensis": "otter",
+}
+#by html
+#refine imageid 7350 -> marlin
+#refine imageid 7761 -> bigeye tuna
+#refine imageid 11569 -> fish -> starry flounder
 
-    return dataset
+def process_category(dataset, category_normalizer=None):
+    if category_normalizer is None:
+        category_normalizer = CategoryNormalizer(REFINE_MAP)
+    category_normalizer.apply(dataset)
+    category_normalizer.print_summary()
 
-def process_caption(dataset):
-    print(f"Processing captions")
-    for annotation in dataset.get_all_annotations():
-        caption = annotation.get_caption()
-        new_caption = caption.strip()
-        new_caption = new_caption.replace("  ", " ")
-        annotation.set_caption(new_caption)
+    return dataset
 
-        if annotation.is_small_bbox():
-            annotation.set_caption("")
+def process_caption(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, caption_normalizer=None, processes=1):
+    trace.info(f"Processing captions")
+    if caption_normalizer is None:
+        caption_normalizer = CaptionNormalizer()
+    caption_normalizer.apply(dataset, small_bbox_filter, processes)
+    caption_normalizer.print_summary()
 
     return dataset
 
-def category_analysis(dataset, output_path):
-    print(f"Category analysis")
-    # Key is the category_id
-    # Value is the (category_name, count)
-    category_count = {}
+def category_analysis(dataset, output_path, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, categories_path=None):
+    trace.info(f"Category analysis")
+    statistics = CategoryStatistics().add_dataset(dataset, small_bbox_filter)
+    write_statistics(statistics, output_path, categories_path)
 
-    for annotation in dataset.get_all_annotations():
-        category = annotation.get_category()
-        category_id = annotation.get_category_id()
-        if category_id not in category_count:
-            category_count[category_id] = (category, 1)
-        else:
-            # Check is the category_name match or not
-            assert category_count[category_id][0] == category, f"Category name mismatch {category_count[category_id][0]} vs {category}"
-            category_count[category_id] = (category, category_count[category_id][1] + 1)
+def write_statistics(statistics, category_analysis_path, categories_path=None):
+    # category_analysis.txt, and the COCO categories table when categories_path is given,
+    # so that extract_category.py does not have to read the processed dataset again
+    write_category_analysis(statistics.get_category_count(), category_analysis_path)
+    if categories_path is not None:
+        trace.info(f"Writing categories to {categories_path}")
+        statistics.write_categories(categories_path)
 
+def write_category_analysis(category_count, output_path):
     # Sort the category by id
     category_count = {k: v for k, v in sorted(category_count.items(), key=lambda item: item[0])}
     
-    print(f"Writing category analysis to {output_path}")
+    trace.info(f"Writing category analysis to {output_path}")
     with open(output_path, 'w', encoding="utf-8") as f:
         for category_id, (category, count) in category_count.items():
             f.write(f"{category_id};{category};{count}\n")
 
-def clean_small_bbox_label(dataset):
-    for annotation in dataset.get_all_annotations():
-        if annotation.is_small_bbox():
-            annotation.set_label(-1)
-    return dataset
+def clean_small_bbox_label(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    return small_bbox_filter.clear_labels(dataset)
 
-def clean_small_bbox_negative_tags(dataset):
-    for annotation in dataset.get_all_annotations():
-        if annotation.is_small_bbox():
-            annotation.set_negative_tags("")
-    return dataset
+def clean_small_bbox_negative_tags(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    return small_bbox_filter.clear_negative_tags(dataset)
 
-def rearrange_ids(dataset):
-    # Rearrange annotation ids
-    for i, anno in enumerate(dataset.get_all_annotations()):
-        anno.json_data["id"] = i + 1
-    
-    # Rearrange image ids and the corresponding annotation ids
-    for i, image in enumerate(dataset.get_images()):
-        image.json_data["id"] = i + 1
-        for anno in image.get_annotations():
-            anno.json_data["image_id"] = i + 1
+def clean_small_bbox(annotation, small):
+    # clean_small_bbox_label and clean_small_bbox_negative_tags for a single annotation
+    if small:
+        annotation.set_field("label", -1)
+        annotation.set_field("negative_tags", "")
+
+def rearrange_ids(dataset, remap=None):
+    # Image ids become 1..M in image order and annotation ids 1..N, recording the old ids in remap
+    return (IdRemap() if remap is None else remap).renumber(dataset)
+
+# The small bbox stages run per image, as a streamed dataset has no mask over all annotations
+def normalize_image_captions(small_bbox_filter, caption_normalizer, image):
+    for annotation, small in zip(image.get_annotations(), small_bbox_filter.image_mask(image)):
+        caption_normalizer.normalize_annotation(annotation, small)
+
+def clean_image_small_bbox(small_bbox_filter, image):
+    for annotation, small in zip(image.get_annotations(), small_bbox_filter.image_mask(image)):
+        clean_small_bbox(annotation, small)
+
+def reserve_global_fields(annotation):
+    # define_category_id and rearrange_ids ran before clean_small_bbox, so an annotation without
+    # a category_id or an id gets the key here, keeping the key order of the output the same as
+    # running the steps in order
+    for field in ("category_id", "id"):
+        if field not in annotation.json_data:
+            annotation.set_field(field, None)
 
+def add_local_stages(pipeline, category_normalizer, caption_normalizer, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    # The steps whose result only depends on the image and its annotations
+    pipeline.add_annotation_stage("process_category", category_normalizer.normalize_annotation,
+                                  finish=lambda dataset: category_normalizer.print_summary())
+    pipeline.add_image_stage("process_caption", functools.partial(normalize_image_captions, small_bbox_filter, caption_normalizer),
+                             finish=lambda dataset: caption_normalizer.print_summary())
+    pipeline.add_annotation_stage("reserve_global_fields", reserve_global_fields)
+    pipeline.add_image_stage("clean_small_bbox", functools.partial(clean_image_small_bbox, small_bbox_filter))
+    return pipeline
+
+def add_global_stages(pipeline, category_analysis_path, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, categories_path=None, remap=None):
+    # The steps that depend on the whole dataset: category ids are given by the sorted set of
+    # all categories, and image and annotation ids by their position, with the old ids recorded in remap
+    categories = set()
+    category_map = {}
+    statistics = CategoryStatistics()
+    if remap is None:
+        remap = IdRemap()
+
+    def collect_category(annotation):
+        categories.add(annotation.json_data["category"])
+
+    def build_category_map(dataset):
+        category_map.update({category: i for i, category in enumerate(sorted(categories))})
+
+    def assign_category_id(annotation):
+        annotation.set_field("category_id", category_map[annotation.json_data["category"]])
+
+    def count_image(image):
+        statistics.add_image(image, small_bbox_filter.image_mask(image))
+
+    pipeline.add_annotation_stage("get_all_categories", collect_category, finish=build_category_map)
+    pipeline.add_annotation_stage("define_category_id", assign_category_id, needs=["get_all_categories"])
+    pipeline.add_image_stage("rearrange_ids", remap.renumber_image, finish=lambda dataset: dataset.reindex())
+    pipeline.add_image_stage("category_analysis", count_image,
+                             finish=lambda dataset: write_statistics(statistics, category_analysis_path, categories_path))
+    return pipeline
+
+def build_pipeline(category_analysis_path, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, stage_timing=False, caption_normalizer=None, categories_path=None, remap=None):
+    # The same steps as calling process_category, process_caption, define_category_id,
+    # rearrange_ids, clean_small_bbox_label, clean_small_bbox_negative_tags and category_analysis
+    # one after another, fused into two passes over the dataset. This saves the lists and
+    # small bbox masks every step built again, not the per-annotation work of the steps, which
+    # is most of the time: the passes are about 1.3x faster than the steps, not 3x.
+    # caption_normalizer may have been prepared with the captions of the dataset beforehand.
+    if caption_normalizer is None:
+        caption_normalizer = CaptionNormalizer()
+    pipeline = Pipeline(stage_timing)
+    # process_category must be called before define_category_id
+    add_local_stages(pipeline, CategoryNormalizer(REFINE_MAP), caption_normalizer, small_bbox_filter)
+    add_global_stages(pipeline, category_analysis_path, small_bbox_filter, categories_path, remap)
+    return pipeline
+
+def process_columnar(dataset, category_analysis_path, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, processes=1, categories_path=None, remap=None):
+    # The steps of build_pipeline as vectorized passes over a ColumnarDataset
+    with trace.span("process_category", "stage"):
+        process_category(dataset)
+
+    with trace.span("process_caption", "stage"):
+        process_caption(dataset, small_bbox_filter, processes=processes)
+
+    with trace.span("define_category_id", "stage"):
+        dataset.define_category_ids()
+    with trace.span("rearrange_ids", "stage"):
+        dataset.rearrange_ids(remap)
+    with trace.span("clean_small_bbox", "stage"):
+        small_bbox_filter.clear_labels(dataset)
+        small_bbox_filter.clear_negative_tags(dataset)
+
+    with trace.span("category_analysis", "stage"):
+        write_statistics(CategoryStatistics().add_dataset(dataset, small_bbox_filter), category_analysis_path, categories_path)
     return dataset
 
-def main(json_path):
+def main(json_path, stream=False, columnar=False, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, cache=False, trace_path=None, stage_timing=False, processes=1, sharding=None, codec=DEFAULT_CODEC,
+         category_analysis_path=CATEGORY_ANALYSIS_PATH, categories_path=CATEGORIES_PATH):
+    try:
+        with trace.span("processing", "script", path=json_path):
+            process_file(json_path, stream, columnar, small_bbox_filter, cache, stage_timing, processes, sharding, codec, category_analysis_path, categories_path)
+    finally:
+        trace.tracer.flush()
+        if trace_path is not None:
+            trace.tracer.write(trace_path)
 
-    with open(json_path, 'r', encoding="utf-8") as f:
-        print(f"Loading {json_path}")
-        main_json_data = json.load(f)
+def get_output_path(json_path):
+    return json_path.replace(".json", "_processed.json")
 
-    dataset = Dataset(main_json_data)
+def process_file(json_path, stream, columnar, small_bbox_filter, cache, stage_timing, processes, sharding, codec, category_analysis_path, categories_path):
+    if stream and sharding is not None:
+        raise ValueError("Sharded output needs the whole dataset, it cannot be streamed")
+    output_path = get_output_path(json_path)
 
-    # process_category must be called before dataset.define_category_id()
-    dataset = process_category(dataset)
-    dataset = process_caption(dataset)
-    dataset = define_category_id(dataset)
-    dataset = rearrange_ids(dataset)
-    dataset = clean_small_bbox_label(dataset)
-    dataset = clean_small_bbox_negative_tags(dataset)
+    if stream:
+        trace.info(f"Streaming {json_path} to {output_path}")
+        dataset = StreamingDataset(json_path, codec)
+        remap = IdRemap(json_path)
+        pipeline = build_pipeline(category_analysis_path, small_bbox_filter, stage_timing, CaptionNormalizer(), categories_path, remap)
+        num_images, num_annotations = pipeline.run_streaming(dataset, output_path, codec=codec)
+        dataset.close()
+        remap.save(get_remap_path(output_path))
+        if categories_path is not None:
+            set_categories_source(categories_path, output_path)
+        trace.info(f"There are in total {num_images} images and {num_annotations} annotations in the combined dataset.")
+        return
 
-    category_analysis(dataset, "./data/category_analysis.txt")
+    trace.info(f"Loading {json_path}")
+    with trace.span("load", "io", path=json_path):
+        dataset = load_dataset(json_path, columnar, cache, codec)
 
-    print(f"There are in total {len(dataset.get_images())} images and {len(dataset.get_all_annotations())} annotations in the combined dataset.")
-    output_path = json_path.replace(".json", "_processed.json")
-    with open(output_path, 'w', encoding="utf-8") as f:
-        print(f"Writing to {output_path}")
-        json.dump(dataset.to_json(), f)
+    # The old ids of the processed dataset, written next to it
+    remap = IdRemap(json_path)
+    dataset = process_dataset(dataset, small_bbox_filter, stage_timing, processes, columnar, remap, category_analysis_path, categories_path)
+    write_processed(dataset, json_path, sharding, processes, codec, remap, categories_path)
+
+def process_dataset(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, stage_timing=False, processes=1, columnar=False, remap=None,
+                    category_analysis_path=CATEGORY_ANALYSIS_PATH, categories_path=CATEGORIES_PATH):
+    # The processing of a loaded dataset, with the vectorized passes when columnar (a
+    # ColumnarDataset then). The old ids are recorded in remap.
+    if columnar:
+        dataset = process_columnar(dataset, category_analysis_path, small_bbox_filter, processes, categories_path, remap)
+    else:
+        caption_normalizer = CaptionNormalizer()
+        pipeline = build_pipeline(category_analysis_path, small_bbox_filter, stage_timing, caption_normalizer, categories_path, remap)
+        # The distinct captions are normalized up front, in batches across the processes,
+        # so that the process_caption stage only looks them up
+        with trace.span("prepare captions", "stage", processes=processes):
+            caption_normalizer.prepare((anno_data["caption"] for image in dataset.get_images() for anno_data in image.get_anno_datas()), processes)
+        dataset = pipeline.run(dataset)
+
+    trace.info(f"There are in total {len(dataset.get_images())} images and {len(dataset.get_all_annotations())} annotations in the combined dataset.")
+    return dataset
+
+def write_processed(dataset, json_path, sharding=None, processes=1, codec=DEFAULT_CODEC, remap=None, categories_path=CATEGORIES_PATH):
+    output_path = get_output_path(json_path)
+    if sharding is not None:
+        # A folder of COCO files instead of output_path, each with the categories table of the whole dataset
+        output_path = json_path.replace(".json", "_processed")
+        # Without a table, write_shards makes one from the annotations of the dataset
+        categories = read_categories(categories_path) if categories_path is not None else None
+        write_shards(dataset, output_path, sharding, categories, processes, codec=codec)
+    else:
+        with trace.span("write", "io", path=output_path):
+            trace.info(f"Writing to {output_path}")
+            codec.dump(dataset.to_json(), output_path)
+        # The categories table is written by the last pass, before the output: the output it
+        # describes is recorded in it now, for extract_category.py
+        if categories_path is not None:
+            set_categories_source(categories_path, output_path)
+    if remap is not None:
+        remap.save(get_remap_path(output_path))
 
 
 if __name__ == "__main__":
     json_path = "./data/combined.json"
-    main(json_path)
\ No newline at end of file
+    # Process the file image by image instead of loading it all, for files that do not fit in memory
+    stream = False
+    # Keep the annotations in NumPy columns and process them with vectorized passes
+    columnar = False
+    # Annotations with a bbox area below SMALL_BBOX_AREA (1024 pixels) are small bboxes.
+    # SmallBboxFilter(0.001, relative=True) would use 0.1% of the image area instead.
+    small_bbox_filter = SmallBboxFilter()
+    # Keep a binary snapshot of the parsed file next to it, reused while the file is unchanged.
+    # It takes up to twice the size of the file on disk (see dataset.cache), and only opens in
+    # well under a second with columnar=True.
+    cache = False
+    # Write a Chrome trace of the run (open it in chrome://tracing or ui.perfetto.dev), with the
+    # time, CPU time and peak memory of every pass; None to skip it
+    trace_path = "./data/processing_trace.json"
+    # Also time every call of every stage, to trace the stages of a pass separately.
+    # This makes the passes about 40% slower.
+    stage_timing = False
+    # Normalize the distinct captions of large files, and write the shards, in this many worker
+    # processes. The caption pool is slower than one process on a machine with few cores (see
+    # benchmark/caption.py), so it is opt-in: e.g. os.cpu_count() on a machine with many cores.
+    processes = 1
+    # Write the processed dataset as shards in ./data/combined_processed/ (with a manifest.json)
+    # instead of one file, in the worker processes: Sharding(num_shards=8), Sharding(max_annotations=100_000)
+    # or Sharding(splits={"train": 0.9, "val": 0.1}); None for one file
+    sharding = None
+    # The JSON parser and serializer: orjson when it is installed, json otherwise. Output is
+    # compact either way; get_codec("json", compact=False) writes the spaced json.dumps layout.
+    # A json_path ending in .gz (or .zst, with zstandard installed) is read and written compressed.
+    codec = get_codec()
+    # category_analysis.txt (category_id;category;count per line) and the COCO categories table
+    # with the statistics of every category, which extract_category.py reads instead of the output
+    category_analysis_path = "./data/category_analysis.txt"
+    categories_path = "./data/categories.json"
+    main(json_path, stream, columnar, small_bbox_filter, cache, trace_path, stage_timing, processes, sharding, codec, category_analysis_path, categories_path)
\ No newline at end of file
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# The tests import the modules of the repository root, as the scripts do when run from it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_json_data():
+    # Two images, three annotations on the first one. Annotation 2 is a small bbox (area 100
+    # < SMALL_BBOX_AREA), and the captions carry what CaptionNormalizer removes.
+    images = [
+        {"id": 1, "file_name": "00000001.jpg", "width": 1280, "height": 720},
+        {"id": 2, "file_name": "00000002.jpg", "width": 1280, "height": 720},
+    ]
+    annotations = [
+        {"id": 1, "image_id": 1, "category": "Fish", "category_id": 0, "caption": "description: a fish  near the coral",
+         "label": 1, "negative_tags": "", "bbox": [10, 10, 100, 50], "segmentation": [[10, 10, 110, 10, 110, 60]]},
+        {"id": 2, "image_id": 1, "category": "sponge", "category_id": 0, "caption": "a small sponge",
+         "label": 1, "negative_tags": "rock", "bbox": [200, 200, 10, 10], "segmentation": []},
+        {"id": 3, "image_id": 2, "category": "coral", "category_id": 0, "caption": "<image> a coral",
+         "label": 2, "negative_tags": "", "bbox": [0, 0, 300, 200], "segmentation": []},
+        {"id": 4, "image_id": 1, "category": "fish", "category_id": 0, "caption": "two fish",
+         "label": 1, "negative_tags": "", "bbox": [400, 300, 64, 64], "segmentation": []},
+    ]
+    return {"images": images, "annotations": annotations}
+
+@pytest.fixture
+def json_data():
+    return make_json_data()
@@ -0,0 +1,59 @@
+import os
+import json
+
+from benchmark import suite
+from benchmark.generate import MarineDetGenerator, SMALL_BBOX_RATIO, read_category_counts
+from dataset.dataset import SMALL_BBOX_AREA
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORY_ANALYSIS_PATH = os.path.join(REPO_ROOT, "category_analysis.txt")
+
+
+def make_generator(num_annotations, seed=0, **kwargs):
+    return MarineDetGenerator(num_annotations, seed, category_analysis_path=CATEGORY_ANALYSIS_PATH, **kwargs)
+
+def test_generator_is_deterministic(tmp_path):
+    json_data = make_generator(3000).make_json()
+    assert make_generator(3000).make_json() == json_data
+    assert make_generator(3000, seed=1).make_json() != json_data
+    make_generator(3000).write_json(str(tmp_path / "synthetic.json"))
+    assert (tmp_path / "synthetic.json").read_text(encoding="utf-8") == json.dumps(json_data)
+
+def test_generator_shape():
+    json_data = make_generator(6000).make_json()
+    images = {image_data["id"]: image_data for image_data in json_data["images"]}
+    annotations = json_data["annotations"]
+    assert len(images) == 1000
+    assert [anno_data["id"] for anno_data in annotations] == list(range(1, 6001))
+    assert all(anno_data["image_id"] in images for anno_data in annotations)
+
+    small = [anno_data for anno_data in annotations if anno_data["bbox"][2] * anno_data["bbox"][3] < SMALL_BBOX_AREA]
+    assert abs(len(small) / len(annotations) - SMALL_BBOX_RATIO) < 0.03
+    assert all(anno_data["caption"] == "" for anno_data in small)
+    for anno_data in annotations:
+        x, y, w, h = anno_data["bbox"]
+        image_data = images[anno_data["image_id"]]
+        assert 0 <= x and x + w <= image_data["width"] + 0.01 and 0 <= y and y + h <= image_data["height"] + 0.01
+
+    # Most categories are canonical ones, drawn with the frequencies of category_analysis.txt
+    counts = read_category_counts(CATEGORY_ANALYSIS_PATH)
+    canonical = sum(anno_data["category"] in counts for anno_data in annotations)
+    assert canonical > 0.9 * len(annotations)
+
+def test_suite_records_every_step(tmp_path, monkeypatch):
+    # The suite reads category_analysis.txt from the repository root
+    monkeypatch.chdir(REPO_ROOT)
+    steps = suite.run_size(300, 0, str(tmp_path / "steps.json"))
+    names = [(step["group"], step["name"]) for step in steps]
+    assert ("processing", "build_pipeline (fused)") in names and ("verify", "validator") in names
+    assert len(set(names)) == len(names)
+    assert all(step["seconds"] >= 0 for step in steps)
+    assert not os.path.exists(str(tmp_path / "steps.json.category_analysis.txt"))
+
+def test_compare(tmp_path, capsys):
+    for name, seconds in (("old", 2.0), ("new", 1.0)):
+        steps = [{"group": "load", "name": "Dataset", "seconds": seconds}]
+        with open(tmp_path / f"{name}.json", 'w', encoding="utf-8") as f:
+            json.dump({"commit": name, "sizes": {"1000": steps}}, f)
+    suite.compare(str(tmp_path / "old.json"), str(tmp_path / "new.json"))
+    assert "0.50x" in capsys.readouterr().out
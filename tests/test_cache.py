@@ -0,0 +1,88 @@
+import os
+import json
+
+import pytest
+
+import processing
+from benchmark.load_dataset import make_synthetic_json
+from dataset import cache
+from dataset.cache import load_json, load_dataset, get_cache_dir
+from dataset.codec import get_codec
+from dataset.columnar import np
+from dataset.dataset import FieldProjection
+
+
+def write_input(path, json_data):
+    with open(path, 'w', encoding="utf-8") as f:
+        json.dump(json_data, f)
+    return str(path)
+
+def is_from_cache(capsys):
+    return "from cache" in capsys.readouterr().out
+
+def test_snapshot_is_reused_until_the_file_changes(tmp_path, capsys):
+    json_data = make_synthetic_json(300)
+    json_path = write_input(tmp_path / "combined.json", json_data)
+    assert load_json(json_path, cache=True) == json_data
+    assert not is_from_cache(capsys)
+    assert load_json(json_path, cache=True) == json_data
+    assert is_from_cache(capsys)
+
+    # The same content with a new mtime keeps the snapshot
+    os.utime(json_path, ns=(0, 10 ** 18))
+    assert load_json(json_path, cache=True) == json_data
+    assert is_from_cache(capsys)
+
+    json_data["annotations"][0]["caption"] = "changed"
+    write_input(json_path, json_data)
+    assert load_json(json_path, cache=True) == json_data
+    assert not is_from_cache(capsys)
+    assert load_json(json_path, cache=True) == json_data
+    assert is_from_cache(capsys)
+
+def test_projection_has_its_own_snapshot(tmp_path, capsys):
+    json_data = make_synthetic_json(300)
+    json_path = write_input(tmp_path / "combined.json", json_data)
+    projection = FieldProjection(drop=["segmentation"])
+    expected = projection.read_json(json_path)
+    assert load_json(json_path, cache=True) == json_data
+    assert load_json(json_path, cache=True, projection=projection) == expected
+    assert not is_from_cache(capsys)
+    assert load_json(json_path, cache=True, projection=projection) == expected
+    assert load_json(json_path, cache=True) == json_data
+    assert capsys.readouterr().out.count("from cache") == 2
+
+@pytest.mark.skipif(np is None, reason="numpy is not installed")
+def test_columnar_snapshot(tmp_path, capsys):
+    json_data = make_synthetic_json(300)
+    json_path = write_input(tmp_path / "combined.json", json_data)
+    expected = load_dataset(json_path, columnar=True).to_json()
+    assert load_dataset(json_path, columnar=True, cache=True).to_json() == expected
+    dataset = load_dataset(json_path, columnar=True, cache=True)
+    assert is_from_cache(capsys)
+    assert dataset.to_json() == expected
+    # The arrays are mapped copy-on-write, so changes are not written back to the snapshot
+    dataset.get_all_annotations()[0].set_bbox([1, 2, 3, 4])
+    assert load_dataset(json_path, columnar=True, cache=True).to_json() == expected
+
+def test_snapshots_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "MAX_CACHE_RATIO", 1)
+    json_path = write_input(tmp_path / "combined.json", make_synthetic_json(300))
+    load_json(json_path, cache=True)
+    load_json(json_path, cache=True, projection=FieldProjection(drop=["segmentation"]))
+    # Each snapshot is close to the size of the file, so only the newest one fits
+    names = sorted(name for name in os.listdir(get_cache_dir(json_path)) if name.endswith(".marshal"))
+    assert len(names) == 1 and names != ["json.marshal"]
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_cached_processing_is_the_same(tmp_path, columnar):
+    if columnar and np is None:
+        pytest.skip("numpy is not installed")
+    json_path = write_input(tmp_path / "combined.json", make_synthetic_json(500))
+    outputs = []
+    for use_cache in (False, True, True):
+        processing.main(json_path, columnar=columnar, cache=use_cache, codec=get_codec("json"),
+                        category_analysis_path=str(tmp_path / "category_analysis.txt"), categories_path=None)
+        with open(processing.get_output_path(json_path), 'rb') as f:
+            outputs.append(f.read())
+    assert outputs[1] == outputs[0] and outputs[2] == outputs[0]
@@ -0,0 +1,90 @@
+import re
+import json
+
+import pytest
+
+import verify
+from dataset import caption
+from dataset.caption import CaptionNormalizer, CAPTION_RULES
+from dataset.columnar import ColumnarDataset, np
+from dataset.dataset import Dataset
+from dataset.small_bbox import DEFAULT_SMALL_BBOX_FILTER
+
+CAPTIONS = [
+    "a fish", "a fish  near   the coral", " \ta fish\n", "<image> a coral", "a<image>coral", "description: a sponge",
+    "description:<image>  a  ray ", "<image><image>", "", "   ", "a fish there", "un récif  élégant", "undefined",
+]
+
+
+def normalize(text, rules=CAPTION_RULES):
+    # The rules applied in turn, then the whitespace collapsed
+    for _, pattern, replacement in rules:
+        text = re.sub(pattern, replacement, text)
+    return " ".join(text.split())
+
+def test_captions_are_normalized():
+    normalizer = CaptionNormalizer()
+    for text in CAPTIONS:
+        result = normalizer.normalize(text)
+        assert result == normalize(text)
+        annotation = Dataset({"images": [{"id": 1}], "annotations": [
+            {"id": 1, "image_id": 1, "category": "fish", "caption": result, "bbox": [0, 0, 100, 100]}]}).get_all_annotations()[0]
+        assert verify.rule_caption(None, annotation, False) in (None, "caption is empty.")
+        assert verify.rule_double_space(None, annotation, False) is None
+
+def test_pattern_rules():
+    rules = (("tag", r"<[a-z]+>", " "), ("prefix", r"^\s*description:", ""))
+    normalizer = CaptionNormalizer(rules)
+    for text in CAPTIONS + ["<video> a description: fish"]:
+        assert normalizer.normalize(text) == normalize(text, rules)
+
+def count_rules(texts):
+    # The number of captions each rule changes, the rules applied in turn
+    counts = {name: 0 for name, _, _ in CAPTION_RULES}
+    counts["whitespace"] = 0
+    for text in texts:
+        for name, pattern, replacement in CAPTION_RULES:
+            result = re.sub(pattern, replacement, text)
+            counts[name] += result != text
+            text = result
+        counts["whitespace"] += " ".join(text.split()) != text
+    return counts
+
+def test_rules_are_counted_per_annotation():
+    normalizer = CaptionNormalizer()
+    texts = CAPTIONS + CAPTIONS[:4]
+    for text in texts:
+        normalizer.normalize(text)
+    normalizer.normalize("a fish", small=True)
+    normalizer.normalize("", small=True)
+    assert normalizer.counts == dict(count_rules(texts), small_bbox=1)
+    assert normalizer.counts["image_token"] == 5
+
+def test_parallel_prepare_is_serial(monkeypatch):
+    monkeypatch.setattr(caption, "PARALLEL_MIN_CAPTIONS", 1)
+    monkeypatch.setattr(caption, "BATCH_SIZE", 3)
+    texts = [f"{text} {i}  " for i in range(10) for text in CAPTIONS]
+    serial = CaptionNormalizer()
+    serial.prepare(texts)
+    parallel = CaptionNormalizer()
+    parallel.prepare(texts, processes=2)
+    assert parallel.cache == serial.cache
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_apply(columnar):
+    if columnar and np is None:
+        pytest.skip("numpy is not installed")
+    images = [{"id": 1, "file_name": "00000001.jpg", "width": 1280, "height": 720}]
+    annotations = [{"id": i + 1, "image_id": 1, "category": "fish", "caption": text, "bbox": [0, 0, 10 if i % 4 == 0 else 100, 10]}
+                   for i, text in enumerate(CAPTIONS * 3)]
+    dataset = (ColumnarDataset if columnar else Dataset)({"images": images, "annotations": json.loads(json.dumps(annotations))})
+    normalizer = CaptionNormalizer()
+    normalizer.apply(dataset, DEFAULT_SMALL_BBOX_FILTER)
+    small = [anno_data["bbox"][2] * anno_data["bbox"][3] < 1024 for anno_data in annotations]
+    assert [annotation.get_caption() for annotation in dataset.get_all_annotations()] == [
+        "" if is_small else normalize(anno_data["caption"]) for anno_data, is_small in zip(annotations, small)]
+    assert normalizer.counts["small_bbox"] == sum(is_small and anno_data["caption"] != "" for anno_data, is_small in zip(annotations, small))
+    expected = CaptionNormalizer()
+    for anno_data, is_small in zip(annotations, small):
+        expected.normalize(anno_data["caption"], small=is_small)
+    assert normalizer.counts == expected.counts
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from processing import REFINE_MAP
+from dataset.category import CategoryNormalizer
+from dataset.columnar import ColumnarDataset, np
+from dataset.dataset import Dataset
+
+
+def refine(category, refine_map):
+    # strip().lower(), then the refine map applied to the normalized names until nothing changes
+    refine_map = {key.strip().lower(): value.strip().lower() for key, value in refine_map.items()}
+    category = category.strip().lower()
+    while category in refine_map and refine_map[category] != category:
+        category = refine_map[category]
+    return category
+
+def make_categories():
+    categories = []
+    for category in list(REFINE_MAP) + list(REFINE_MAP.values()) + ["fish", "coral"]:
+        categories.extend([category, category.title(), f" {category.upper()} "])
+    return categories
+
+def test_categories_are_refined_to_a_fixed_point():
+    normalizer = CategoryNormalizer(REFINE_MAP)
+    for category in make_categories():
+        assert normalizer.normalize(category) == refine(category, REFINE_MAP)
+    assert normalizer.normalize("bare tailed goatfis") == "bare tailed goatfish"
+    assert normalizer.normalize("Blue-spotted stingrays ") == "bluespotted ribbontail ray"
+    assert normalizer.normalize("Sea Star (Starfish)") == "sea star"
+
+def test_refinement_cycle_is_an_error():
+    with pytest.raises(ValueError):
+        CategoryNormalizer({"a": "b", "b": "c", "c": "a"})
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_apply_counts_the_refined_annotations(columnar):
+    if columnar and np is None:
+        pytest.skip("numpy is not installed")
+    categories = make_categories()
+    images = [{"id": 1, "file_name": "00000001.jpg", "width": 1280, "height": 720}]
+    annotations = [{"id": i + 1, "image_id": 1, "category": category, "bbox": [0, 0, 10, 10]}
+                   for i, category in enumerate(categories + categories[::3])]
+    # Dataset strips and lowercases the categories as it loads them, so the counts are those of the refined names
+    loaded = [category.strip().lower() for category in categories + categories[::3]]
+    json_data = {"images": images, "annotations": annotations}
+    dataset = (ColumnarDataset if columnar else Dataset)(json.loads(json.dumps(json_data)))
+    normalizer = CategoryNormalizer(REFINE_MAP)
+    normalizer.apply(dataset)
+    assert [annotation.get_category() for annotation in dataset.get_all_annotations()] == [refine(category, REFINE_MAP) for category in loaded]
+    expected = {}
+    for category in loaded:
+        if refine(category, REFINE_MAP) != category:
+            expected[category] = expected.get(category, 0) + 1
+    assert normalizer.counts == expected
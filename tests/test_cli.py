@@ -0,0 +1,106 @@
+import os
+import json
+import random
+
+import pytest
+
+import cli
+import combine
+import processing
+import verify
+import extract_category
+import clean_segmentation
+
+CAPTIONS = ["a fish", "  a  big   fish  ", "<image> a coral", "description: a sponge", "", "undefined"]
+CATEGORIES = ["fish", "Coral ", "sponge", "sea star (starfish)"]
+
+
+def write_inputs(folder):
+    # A main dataset and two small bbox datasets, in the layout combine.py reads
+    rng = random.Random(0)
+    images = [{"id": i + 10, "file_name": f"{i:04d}.jpg", "width": 1280, "height": 720} for i in range(40)]
+    annotations = []
+    for i in range(200):
+        annotations.append({"id": i + 100, "image_id": rng.choice(images)["id"], "category": rng.choice(CATEGORIES),
+                            "category_id": 0, "caption": rng.choice(CAPTIONS), "label": rng.choice([0, 1]),
+                            "negative_tags": rng.choice(["", "shark"]), "segmentation": [[1.5, 2, 3, 4]],
+                            "bbox": [rng.randint(0, 900), rng.randint(0, 400), rng.randint(3, 200), rng.randint(3, 200)]})
+    os.makedirs(os.path.join(folder, "small", "a"))
+    os.makedirs(os.path.join(folder, "small", "b"))
+    with open(os.path.join(folder, "main.json"), 'w', encoding="utf-8") as f:
+        json.dump({"images": images, "annotations": annotations}, f)
+    for name in ("a", "b"):
+        small_images = [dict(image) for image in rng.sample(images, 10)] + [{"id": 999, "file_name": f"new_{name}.jpg"}]
+        small_annotations = [{"id": i, "image_id": image["id"], "category": rng.choice(CATEGORIES), "category_id": 0,
+                              "caption": "undefined", "label": 1, "negative_tags": "x", "segmentation": [],
+                              "bbox": [1, 2, rng.randint(2, 40), rng.randint(2, 40)]}
+                             for i, image in enumerate(small_images)]
+        with open(os.path.join(folder, "small", name, "annotations.json"), 'w', encoding="utf-8") as f:
+            json.dump({"images": small_images, "annotations": small_annotations}, f)
+
+def read_outputs(folder):
+    # The files the commands write, but the trace
+    outputs = {}
+    for name in sorted(os.listdir(os.path.join(folder, "data"))):
+        if name != "cli_trace.json":
+            with open(os.path.join(folder, "data", name), 'rb') as f:
+                outputs[name] = f.read()
+    return outputs
+
+def get_category_lines(output):
+    return [line for line in output.splitlines() if line.startswith("{")]
+
+@pytest.fixture
+def run_folder(tmp_path, monkeypatch):
+    # The scripts write to ./data of the current folder
+    def make(name):
+        folder = str(tmp_path / name)
+        os.makedirs(os.path.join(folder, "data"))
+        write_inputs(os.path.join(folder, "in"))
+        monkeypatch.chdir(folder)
+        return folder
+    return make
+
+def run_scripts(capsys):
+    combine.main("in/main.json", "in/small")
+    processing.main("./data/combined.json")
+    verify.main("./data/combined_processed.json")
+    capsys.readouterr()
+    extract_category.main("./data/combined_processed.json")
+    categories = get_category_lines(capsys.readouterr().out)
+    clean_segmentation.main("./data/combined_processed.json")
+    return categories
+
+def test_chained_commands_write_what_the_scripts_write(run_folder, capsys):
+    scripts_folder = run_folder("scripts")
+    categories = run_scripts(capsys)
+    assert categories
+
+    cli_folder = run_folder("cli")
+    cli.main(cli.parse_args(["combine", "process", "verify", "categories", "clean-seg",
+                             "--main-json-path", "in/main.json", "--small-bbox-folder", "in/small"]))
+    assert get_category_lines(capsys.readouterr().out) == categories
+    expected = read_outputs(scripts_folder)
+    assert read_outputs(cli_folder) == expected
+    assert "verify_report.json" in expected and "combined_processed_cleaned.json" in expected
+
+def test_chain_from_a_file(run_folder, capsys):
+    # The first command loads its file, by default the one the script would read
+    scripts_folder = run_folder("scripts")
+    run_scripts(capsys)
+    expected = read_outputs(scripts_folder)
+
+    cli_folder = run_folder("cli")
+    combine.main("in/main.json", "in/small")
+    cli.main(cli.parse_args(["process", "verify", "clean-seg"]))
+    assert read_outputs(cli_folder) == expected
+
+@pytest.mark.parametrize("commands", [["process", "combine"], ["verify", "verify"]])
+def test_commands_out_of_order(commands):
+    with pytest.raises(SystemExit):
+        cli.parse_args(commands)
+
+def test_default_json_path():
+    assert cli.parse_args(["process"]).json_path == "./data/combined.json"
+    assert cli.parse_args(["verify", "categories"]).json_path == "./data/combined_processed.json"
+    assert cli.parse_args(["clean-seg", "--json-path", "other.json"]).json_path == "other.json"
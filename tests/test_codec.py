@@ -0,0 +1,90 @@
+import os
+import math
+import json
+
+import pytest
+
+import processing
+from benchmark.load_dataset import make_synthetic_json
+from dataset.codec import get_codec, orjson, zstandard
+
+needs_orjson = pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+CODECS = ["json"] + (["orjson"] if orjson is not None else [])
+EXTENSIONS = [".json", ".json.gz"] + ([".json.zst"] if zstandard is not None else [])
+
+
+def make_records(json_data):
+    # The fixture, with what the codecs escape or write differently
+    json_data["images"][0]["file_name"] = "café/🐟 \\ \"x\".jpg"
+    json_data["annotations"][0]["caption"] = "tab\t, nul \x00, del \x7f and line \u2028 separator"
+    json_data["annotations"][1]["bbox"] = [0.1, 2.5, 1e-05, 1e+16]
+    json_data["annotations"][2]["category_id"] = None
+    json_data["annotations"][3]["flags"] = {"crowd": False, "score": -0.0, "nested": [[], {}]}
+    return json_data
+
+@pytest.mark.parametrize("name", CODECS)
+@pytest.mark.parametrize("extension", EXTENSIONS)
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_round_trip(tmp_path, json_data, name, extension, ensure_ascii):
+    json_data = make_records(json_data)
+    codec = get_codec(name)
+    path = str(tmp_path / ("annotations" + extension))
+    codec.dump(json_data, path, ensure_ascii)
+    assert codec.load(path) == json_data
+    data = codec.dumps(json_data, ensure_ascii)
+    assert data.isascii() == ensure_ascii
+    # Every codec reads what the others write
+    for other in CODECS:
+        assert get_codec(other).loads(data) == json_data
+    assert json.loads(data) == json_data
+
+@needs_orjson
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_orjson_writes_as_json(json_data, ensure_ascii):
+    # The same bytes, except for floats in exponent notation
+    json_data = make_records(json_data)
+    json_data["annotations"][1]["bbox"] = [0.1, 2.5, 100.0, 123456789.125]
+    assert get_codec("orjson").dumps(json_data, ensure_ascii) == get_codec("json").dumps(json_data, ensure_ascii)
+    floats = [1e-05, 1e+16, 1.5e-07, 1e22]
+    assert get_codec("orjson").dumps(floats) == b"[0.00001,1e16,1.5e-7,1e22]"
+    assert get_codec("json").loads(get_codec("orjson").dumps(floats)) == floats
+
+@needs_orjson
+def test_pipeline_output_is_the_same(tmp_path):
+    # processing.py writes the same file, whichever codec reads and writes it
+    outputs = []
+    for name in ("json", "orjson"):
+        folder = tmp_path / name
+        os.mkdir(folder)
+        json_path = str(folder / "combined.json")
+        with open(json_path, 'w', encoding="utf-8") as f:
+            json.dump(make_synthetic_json(300), f)
+        processing.main(json_path, codec=get_codec(name), category_analysis_path=str(folder / "category_analysis.txt"),
+                        categories_path=str(folder / "categories.json"))
+        with open(processing.get_output_path(json_path), 'rb') as f:
+            outputs.append(f.read())
+    assert outputs[0] == outputs[1]
+
+def test_non_finite_floats(tmp_path):
+    codec = get_codec("json")
+    data = codec.dumps([math.nan, math.inf])
+    assert data == b"[NaN,Infinity]"
+    values = codec.loads(data)
+    assert math.isnan(values[0]) and values[1] == math.inf
+    if orjson is not None:
+        # Rejected rather than read as something else
+        with pytest.raises(orjson.JSONDecodeError):
+            get_codec("orjson").loads(data)
+
+def test_spaced_json(json_data):
+    codec = get_codec("json", compact=False)
+    assert codec.dumps({"a": [1, 2]}) == b'{"a": [1, 2]}'
+    assert codec.loads(codec.dumps(json_data)) == json_data
+
+def test_get_codec():
+    assert get_codec().name == ("orjson" if orjson is not None else "json")
+    assert get_codec(compact=False).name == "json"
+    with pytest.raises(ValueError):
+        get_codec("orjson", compact=False)
+    with pytest.raises(ValueError):
+        get_codec("yaml")
@@ -0,0 +1,60 @@
+import os
+import json
+
+import pytest
+
+import processing
+from benchmark.load_dataset import make_synthetic_json
+from dataset.dataset import Dataset
+from dataset.remap import IdRemap
+
+np = pytest.importorskip("numpy")
+from dataset.columnar import ColumnarDataset
+
+
+def run_processing(folder, json_data, columnar):
+    os.makedirs(folder)
+    json_path = os.path.join(folder, "combined.json")
+    with open(json_path, 'w', encoding="utf-8") as f:
+        json.dump(json_data, f)
+    processing.main(json_path, columnar=columnar, category_analysis_path=os.path.join(folder, "category_analysis.txt"),
+                    categories_path=os.path.join(folder, "categories.json"))
+    outputs = {}
+    for name in sorted(os.listdir(folder)):
+        if name != "combined.json" and name != "categories.json":
+            with open(os.path.join(folder, name), 'rb') as f:
+                outputs[name] = f.read()
+    # The table records the path of the output it describes, which differs
+    with open(os.path.join(folder, "categories.json"), 'r', encoding="utf-8") as f:
+        outputs["categories"] = json.load(f)["categories"]
+    return outputs
+
+def make_odd_json_data(json_data):
+    # Records the columns do not hold as such: no id, a float id, a float bbox and an unknown field
+    del json_data["annotations"][1]["id"]
+    json_data["annotations"][2]["id"] = 3.5
+    json_data["annotations"][0]["bbox"] = [10.5, 10, 100, 50]
+    json_data["annotations"][3]["extra"] = {"note": "kept"}
+    return json_data
+
+@pytest.mark.parametrize("name", ["fixture", "odd", "synthetic"])
+def test_columnar_processing_is_the_same(tmp_path, json_data, name):
+    if name == "odd":
+        json_data = make_odd_json_data(json_data)
+    elif name == "synthetic":
+        json_data = make_synthetic_json(500)
+    expected = run_processing(str(tmp_path / "dicts"), json_data, columnar=False)
+    assert run_processing(str(tmp_path / "columns"), json_data, columnar=True) == expected
+
+def test_rearrange_ids_adds_missing_ids(json_data):
+    json_data = make_odd_json_data(json_data)
+    dataset = Dataset(json.loads(json.dumps(json_data)))
+    dict_remap = IdRemap()
+    dict_remap.renumber(dataset)
+    columnar = ColumnarDataset(json_data)
+    columnar_remap = IdRemap()
+    columnar.rearrange_ids(columnar_remap)
+    assert columnar.to_json() == dataset.to_json()
+    assert list(columnar.to_json()["annotations"][2]) == list(dataset.to_json()["annotations"][2])
+    assert list(columnar_remap.annotations.old_ids) == list(dict_remap.annotations.old_ids)
+    assert list(columnar_remap.images.old_ids) == list(dict_remap.images.old_ids)
@@ -0,0 +1,69 @@
+import os
+import json
+import random
+
+import pytest
+
+import combine
+
+
+def write_inputs(folder):
+    # A main dataset and three small bbox datasets in the layout combine.py reads, one without captions
+    rng = random.Random(1)
+    images = [{"id": i + 1, "file_name": f"{i:04d}.jpg", "width": 1280, "height": 720} for i in range(60)]
+    annotations = [{"id": i + 1, "image_id": rng.choice(images)["id"], "category": "fish", "category_id": 0,
+                    "caption": "a fish — près du récif", "label": 1, "negative_tags": "", "segmentation": [],
+                    "bbox": [rng.randint(0, 900), rng.randint(0, 400), rng.randint(3, 200), rng.randint(3, 200)]}
+                   for i in range(300)]
+    with open(os.path.join(folder, "main.json"), 'w', encoding="utf-8") as f:
+        json.dump({"images": images, "annotations": annotations}, f)
+    for name in ("a", "b", "c"):
+        small_images = [dict(image) for image in rng.sample(images, 15)] + [{"id": 999, "file_name": f"new_{name}.jpg"}]
+        small_annotations = [{"id": i + 1, "image_id": image["id"], "category": "coral", "category_id": 0,
+                              "caption": "undefined", "label": 1, "negative_tags": "", "segmentation": [],
+                              "bbox": [1, 2, rng.randint(2, 60), rng.randint(2, 60)]}
+                             for i, image in enumerate(small_images)]
+        if name == "c":
+            for anno_data in small_annotations:
+                del anno_data["caption"]
+        os.makedirs(os.path.join(folder, "small", name))
+        with open(os.path.join(folder, "small", name, "annotations.json"), 'w', encoding="utf-8") as f:
+            json.dump({"images": small_images, "annotations": small_annotations}, f)
+
+def run_combine(folder, **kwargs):
+    # combine.py writes to ./data of the current folder. The paths are relative, as the
+    # outputs record those of the inputs.
+    os.makedirs(os.path.join(folder, "data"))
+    write_inputs(folder)
+    os.chdir(folder)
+    combine.main("main.json", "small", **kwargs)
+    outputs = {}
+    for name in sorted(os.listdir(os.path.join(folder, "data"))):
+        with open(os.path.join(folder, "data", name), 'rb') as f:
+            outputs[name] = f.read()
+    return outputs
+
+@pytest.mark.parametrize("kwargs", [
+    {"processes": 2},
+    {"read_ahead": 0},
+    {"read_ahead_bytes": 1},
+    {"stream": True},
+    {"stream": True, "processes": 2},
+])
+def test_modes_give_the_same_output(tmp_path, monkeypatch, kwargs):
+    monkeypatch.chdir(tmp_path)
+    expected = run_combine(str(tmp_path / "default"))
+    assert sorted(expected) == ["combined.json", "combined.json.ids", "dropped_images.txt"]
+    assert run_combine(str(tmp_path / "mode"), **kwargs) == expected
+
+def test_small_bbox_annotations_are_merged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    outputs = run_combine(str(tmp_path / "default"))
+    combined = json.loads(outputs["combined.json"])
+    assert len(combined["images"]) == 60
+    assert len(combined["annotations"]) == 300 + 3 * 15
+    assert [anno_data["id"] for anno_data in combined["annotations"]] == list(range(1, 346))
+    # Every annotation of the small bbox datasets is below SMALL_BBOX_AREA, so they lose their caption
+    assert sum(anno_data["caption"] == "" for anno_data in combined["annotations"]) >= 3 * 15
+    assert sorted(outputs["dropped_images.txt"].decode().splitlines()) == [
+        f"{os.path.join('small', name, 'annotations.json')};new_{name}.jpg;1" for name in ("a", "b", "c")]
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from benchmark.load_dataset import make_synthetic_json
+from dataset.dataset import Dataset, Annotation
+
+
+def copy_json_data(json_data):
+    return json.loads(json.dumps(json_data))
+
+def scan_annotation_ids(json_data):
+    # The annotations of every image as the linear scan over all annotations found them
+    return [[anno_data["id"] for anno_data in json_data["annotations"] if anno_data["image_id"] == image_data["id"]]
+            for image_data in json_data["images"]]
+
+def make_unordered_json_data():
+    # Annotations in no image order, one of an image that does not exist, and two images with the same id
+    json_data = make_synthetic_json(300)
+    json_data["annotations"][7]["image_id"] = 10 ** 6
+    json_data["images"][20]["id"] = json_data["images"][3]["id"]
+    return json_data
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_annotations_are_grouped_as_the_scan(lazy):
+    json_data = make_unordered_json_data()
+    dataset = Dataset(copy_json_data(json_data), lazy=lazy)
+    assert [[annotation.get_id() for annotation in image.get_annotations()] for image in dataset.get_images()] == scan_annotation_ids(json_data)
+    assert [image.get_num_annotations() for image in dataset.get_images()] == [len(ids) for ids in scan_annotation_ids(json_data)]
+
+def test_categories_are_normalized(json_data):
+    dataset = Dataset(json_data)
+    assert [annotation.get_category() for annotation in dataset.get_all_annotations()] == ["fish", "sponge", "fish", "coral"]
+
+def test_lookups_find_the_first_match():
+    json_data = make_unordered_json_data()
+    json_data["images"][30]["file_name"] = json_data["images"][4]["file_name"]
+    json_data["annotations"][40]["id"] = json_data["annotations"][2]["id"]
+    dataset = Dataset(json_data)
+    images = dataset.get_images()
+    for image in images:
+        assert dataset.get_image(image.get_filename()) is next(other for other in images if other.get_filename() == image.get_filename())
+        assert dataset.get_image_by_id(image.get_id()) is next(other for other in images if other.get_id() == image.get_id())
+    annotations = dataset.get_all_annotations()
+    for annotation in annotations:
+        assert dataset.get_annotation_by_id(annotation.get_id()) is next(other for other in annotations if other.get_id() == annotation.get_id())
+    assert dataset.get_image("missing.jpg") is None
+    assert dataset.get_image_by_id(-1) is None
+
+def test_lookups_follow_changes(json_data):
+    dataset = Dataset(json_data)
+    assert dataset.get_annotation_by_id(5) is None
+    other = Dataset({"images": [dict(json_data["images"][1])], "annotations": [dict(json_data["annotations"][2], id=5)]})
+    annotation = other.get_all_annotations()[0]
+    dataset.get_images()[0].add_annotation(annotation)
+    assert dataset.get_annotation_by_id(5) is annotation
+
+    image = other.get_images()[0]
+    image.json_data["file_name"] = "00000003.jpg"
+    dataset.set_images(dataset.get_images() + [image])
+    assert dataset.get_image("00000003.jpg") is image
+
+def test_append_dataset(json_data):
+    dataset = Dataset(copy_json_data(json_data))
+    small = copy_json_data(json_data)
+    small["images"].append({"id": 3, "file_name": "00000003.jpg", "width": 1280, "height": 720})
+    small["annotations"] = [dict(small["annotations"][1], id=10, image_id=2), dict(small["annotations"][1], id=11, image_id=3)]
+    dropped = dataset.append_dataset(Dataset(small))
+    assert [image.get_filename() for image in dropped] == ["00000003.jpg"]
+    assert [annotation.get_id() for annotation in dataset.get_image("00000002.jpg").get_annotations()] == [3, 10]
+    assert dataset.get_annotation_by_id(10).get_image_id() == 2
+
+def test_lazy_dataset_is_the_eager_dataset():
+    json_data = make_unordered_json_data()
+    eager = Dataset(copy_json_data(json_data))
+    lazy = Dataset(copy_json_data(json_data), lazy=True)
+    assert lazy.to_json() == eager.to_json()
+    assert [annotation.json_data for annotation in lazy.get_all_annotations()] == [annotation.json_data for annotation in eager.get_all_annotations()]
+    assert lazy.get_annotation_by_id(5).json_data == eager.get_annotation_by_id(5).json_data
+
+def test_lazy_annotations_write_to_their_dicts(json_data):
+    dataset = Dataset(json_data, lazy=True)
+    image = dataset.get_images()[0]
+    # The categories are normalized when the annotations are first asked for
+    assert json_data["annotations"][0]["category"] == "Fish"
+    image.get_annotations()[0].set_caption("a fish")
+    assert (json_data["annotations"][0]["category"], json_data["annotations"][0]["caption"]) == ("fish", "a fish")
+
+    image.add_annotation(Annotation(dict(json_data["annotations"][2], id=5, category="Coral")))
+    assert [annotation.get_id() for annotation in image.get_annotations()] == [1, 2, 4, 5]
+    assert dataset.get_annotation_by_id(5).get_category() == "coral"
+    image.set_annotations(image.get_annotations()[1:])
+    assert [anno_data["id"] for anno_data in dataset.to_json()["annotations"]] == [2, 4, 5, 3]
+    assert dataset.get_annotation_by_id(1) is None
+
+def test_fork_of_a_lazy_image_copies_on_write(json_data):
+    dataset = Dataset(json_data, lazy=True)
+    image = dataset.get_images()[0]
+    fork = image.fork()
+    fork.get_annotations()[0].set_caption("changed")
+    # Writing the value a field already has leaves the record shared
+    fork.get_annotations()[1].set_caption("a small sponge")
+    assert image.get_annotations()[0].get_caption() == "description: a fish  near the coral"
+    assert fork.get_annotations()[0].json_data is not image.get_annotations()[0].json_data
+    assert fork.get_annotations()[1].json_data is image.get_annotations()[1].json_data
@@ -0,0 +1,71 @@
+import pytest
+
+from dataset import overlap
+from dataset.dataset import Dataset
+from dataset.overlap import OVERLAP_THRESHOLD, find_overlaps, find_overlapping_annotations, get_redundant_annotations
+
+
+@pytest.fixture(params=["python", "numpy"])
+def backend(request, monkeypatch):
+    # Every case runs through both implementations of find_overlaps
+    if request.param == "numpy":
+        if overlap.np is None:
+            pytest.skip("NumPy is not installed")
+        monkeypatch.setattr(overlap, "NUMPY_MIN_BOXES", 0)
+    else:
+        monkeypatch.setattr(overlap, "NUMPY_MIN_BOXES", float("inf"))
+    return request.param
+
+def make_dataset(boxes, categories=None):
+    # One image with an annotation per box, ids 1..N
+    categories = categories or ["fish"] * len(boxes)
+    annotations = [{"id": i + 1, "image_id": 1, "category": category, "bbox": box}
+                   for i, (box, category) in enumerate(zip(boxes, categories))]
+    return Dataset({"images": [{"id": 1, "file_name": "a.jpg"}], "annotations": annotations})
+
+def get_pairs(dataset, threshold=OVERLAP_THRESHOLD):
+    return [(first["id"], second["id"], iou) for _, first, second, iou in find_overlapping_annotations(dataset.get_images(), threshold)]
+
+def test_identical_boxes(backend):
+    # Duplicates whatever the threshold, and the third one is only paired with the first
+    dataset = make_dataset([[5, 5, 10, 10], [5.0, 5, 10, 10], [5, 5, 10, 10]])
+    assert get_pairs(dataset) == [(1, 2, None), (1, 3, None)]
+    assert get_pairs(dataset, threshold=1.0) == [(1, 2, None), (1, 3, None)]
+    assert [anno_data["id"] for anno_data in get_redundant_annotations(dataset.get_images())] == [2, 3]
+
+def test_identical_empty_boxes(backend):
+    assert get_pairs(make_dataset([[3, 3, 0, 0], [3, 3, 0, 0], [3, 3, 0, 5]])) == [(1, 2, None)]
+
+def test_iou_at_threshold(backend):
+    # 90 / 100, exactly the float 0.9
+    dataset = make_dataset([[0, 0, 10, 10], [0, 0, 9, 10]])
+    assert get_pairs(dataset, threshold=0.9) == [(1, 2, 0.9)]
+    assert get_pairs(dataset, threshold=0.9000000000000001) == []
+    # 50 / 100
+    dataset = make_dataset([[0, 0, 10, 10], [0, 5, 10, 10]])
+    assert get_pairs(dataset, threshold=0.5) == []
+    dataset = make_dataset([[0, 0, 10, 10], [0, 0, 10, 5]])
+    assert get_pairs(dataset, threshold=0.5) == [(1, 2, 0.5)]
+
+def test_touching_boxes(backend):
+    # Touching boxes do not overlap even at threshold 0, as boxes further apart are not compared
+    dataset = make_dataset([[0, 0, 10, 10], [10, 0, 10, 10], [0, 10, 10, 10], [30, 0, 5, 5]])
+    assert get_pairs(dataset, threshold=0.0) == []
+    assert find_overlaps([0, 0], [[0, 0, 10, 10], [9, 0, 10, 10]], 0.0) == [(0, 1, 10 / 190)]
+
+def test_other_category(backend):
+    dataset = make_dataset([[0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 10, 10]], ["fish", "coral", "fish"])
+    assert get_pairs(dataset) == [(1, 3, None)]
+
+def test_backends_agree(monkeypatch):
+    if overlap.np is None:
+        pytest.skip("NumPy is not installed")
+    import random
+    rng = random.Random(0)
+    groups = [rng.randint(0, 3) for _ in range(300)]
+    boxes = [[rng.randint(0, 50), rng.randint(0, 50), rng.randint(0, 20), rng.randint(0, 20)] for _ in groups]
+    monkeypatch.setattr(overlap, "NUMPY_MIN_BOXES", float("inf"))
+    expected = sorted(find_overlaps(groups, boxes, 0.3))
+    monkeypatch.setattr(overlap, "NUMPY_MIN_BOXES", 0)
+    assert sorted(find_overlaps(groups, boxes, 0.3)) == expected
+    assert expected
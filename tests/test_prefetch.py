@@ -0,0 +1,43 @@
+import gzip
+
+import pytest
+
+from dataset import trace
+from dataset.prefetch import PrefetchReader
+
+
+def write_files(folder, count):
+    paths = []
+    for i in range(count):
+        path = str(folder / f"{i:03d}.json")
+        if i % 3 == 0:
+            path += ".gz"
+            with gzip.open(path, 'wb') as f:
+                f.write(b'{"i": %d}' % i)
+        else:
+            with open(path, 'wb') as f:
+                f.write(b'{"i": %d}' % i)
+        paths.append(path)
+    return paths
+
+@pytest.mark.parametrize("window, max_bytes", [(0, None), (1, None), (3, None), (3, 1)])
+def test_files_in_order(tmp_path, window, max_bytes):
+    paths = write_files(tmp_path, 10)
+    with PrefetchReader(paths, window, max_bytes) as reader:
+        items = [(path, data) for path, data, _ in reader]
+    assert items == [(path, b'{"i": %d}' % i) for i, path in enumerate(paths)]
+    assert [timing.path for timing in reader.timings] == paths
+
+def test_every_timing_is_printed(tmp_path, capsys):
+    paths = write_files(tmp_path, trace.RATE_LIMIT + 10)
+    with PrefetchReader(paths, window=2) as reader:
+        for path, data, timing in reader:
+            with timing.measure("parse"):
+                pass
+    reader.print_timings()
+    trace.tracer.flush()
+    lines = capsys.readouterr().out.splitlines()
+    for path in paths:
+        assert sum(line.startswith(f"{path}:") for line in lines) == 1
+    assert not any("suppressed" in line for line in lines)
+    assert f"Read {len(paths)} files with a read-ahead window of 2" in lines[-1]
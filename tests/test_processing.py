@@ -0,0 +1,126 @@
+import os
+import copy
+import json
+
+import pytest
+
+import processing
+from benchmark.generate import make_marinedet_json
+from dataset.dataset import Dataset
+from dataset.columnar import ColumnarDataset, np
+from dataset.shard import Sharding, MANIFEST_NAME
+from dataset.small_bbox import DEFAULT_SMALL_BBOX_FILTER
+
+
+def write_input(folder, json_data):
+    os.makedirs(folder, exist_ok=True)
+    json_path = os.path.join(folder, "combined.json")
+    with open(json_path, 'w', encoding="utf-8") as f:
+        json.dump(json_data, f)
+    return json_path
+
+def read_json(path):
+    with open(path, 'r', encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.mark.parametrize("mode", [{}, {"stream": True}, {"columnar": True}])
+def test_main_without_categories_file(tmp_path, json_data, mode):
+    json_path = write_input(str(tmp_path), json_data)
+    processing.main(json_path, category_analysis_path=str(tmp_path / "category_analysis.txt"), categories_path=None, **mode)
+    assert not os.path.exists(tmp_path / "categories.json")
+    output = read_json(processing.get_output_path(json_path))
+    assert [anno_data["id"] for anno_data in output["annotations"]] == [1, 2, 3, 4]
+
+def test_sharded_main_without_categories_file(tmp_path, json_data):
+    json_path = write_input(str(tmp_path), json_data)
+    processing.main(json_path, sharding=Sharding(num_shards=2), category_analysis_path=str(tmp_path / "category_analysis.txt"),
+                    categories_path=None)
+    manifest = read_json(str(tmp_path / "combined_processed" / MANIFEST_NAME))
+    assert [category["name"] for category in manifest["categories"]] == ["coral", "fish", "sponge"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_marinedet_data(num_annotations):
+    return make_marinedet_json(num_annotations, category_analysis_path=os.path.join(REPO_ROOT, "category_analysis.txt"))
+
+def read_outputs(folder):
+    # The text of every file written, but the categories table, which records the path of the output it describes
+    outputs = {}
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name == "categories.json":
+            outputs[name] = read_json(path)["categories"]
+        elif name != "combined.json":
+            with open(path, 'rb') as f:
+                outputs[name] = f.read()
+    return outputs
+
+def run_steps(dataset, folder):
+    # The steps of processing.py one after another, as they were before they were fused
+    small_bbox_filter = DEFAULT_SMALL_BBOX_FILTER
+    processing.process_category(dataset)
+    processing.process_caption(dataset, small_bbox_filter)
+    processing.define_category_id(dataset)
+    processing.rearrange_ids(dataset)
+    processing.clean_small_bbox_label(dataset, small_bbox_filter)
+    processing.clean_small_bbox_negative_tags(dataset, small_bbox_filter)
+    processing.category_analysis(dataset, os.path.join(folder, "category_analysis.txt"), small_bbox_filter, os.path.join(folder, "categories.json"))
+    return dataset
+
+@pytest.mark.parametrize("stage_timing", [False, True])
+def test_fused_pipeline_is_the_steps(tmp_path, stage_timing):
+    json_data = make_marinedet_data(2000)
+    steps_folder = str(tmp_path / "steps")
+    os.makedirs(steps_folder)
+    expected = run_steps(Dataset(copy.deepcopy(json_data)), steps_folder).to_json()
+
+    pipeline_folder = str(tmp_path / "pipeline")
+    os.makedirs(pipeline_folder)
+    dataset = processing.process_dataset(Dataset(json_data), stage_timing=stage_timing,
+                                         category_analysis_path=os.path.join(pipeline_folder, "category_analysis.txt"),
+                                         categories_path=os.path.join(pipeline_folder, "categories.json"))
+    assert dataset.to_json() == expected
+    assert read_outputs(pipeline_folder) == read_outputs(steps_folder)
+
+def test_pipeline_runs_in_two_passes(tmp_path):
+    pipeline = processing.build_pipeline(str(tmp_path / "category_analysis.txt"))
+    assert [[stage.name for stage in stages] for stages in pipeline.plan()] == [
+        ["process_category", "process_caption", "reserve_global_fields", "clean_small_bbox", "get_all_categories"],
+        ["define_category_id", "rearrange_ids", "category_analysis"],
+    ]
+
+@pytest.mark.parametrize("mode", [{"stream": True}, {"processes": 2}])
+def test_modes_give_the_same_output(tmp_path, mode):
+    # Every output file of main, against those of the default mode
+    json_data = make_marinedet_data(2000)
+    outputs = []
+    for name, kwargs in [("default", {}), ("mode", mode)]:
+        folder = tmp_path / name
+        json_path = write_input(str(folder), json_data)
+        processing.main(json_path, category_analysis_path=str(folder / "category_analysis.txt"),
+                        categories_path=str(folder / "categories.json"), **kwargs)
+        outputs.append(read_outputs(str(folder)))
+    assert "combined_processed.json.ids" in outputs[0]
+    assert outputs[1] == outputs[0]
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_fused_pipeline_keeps_the_key_order(tmp_path, columnar):
+    if columnar and np is None:
+        pytest.skip("numpy is not installed")
+    # clean_small_bbox runs before the category ids and ids are defined, so annotations without
+    # them must get the keys before the label and negative tags clean_small_bbox adds
+    json_data = make_marinedet_data(500)
+    for anno_data in json_data["annotations"][::2]:
+        del anno_data["category_id"]
+    for anno_data in json_data["annotations"][1::5]:
+        del anno_data["id"]
+    for anno_data in json_data["annotations"][::3]:
+        del anno_data["label"], anno_data["negative_tags"]
+    steps_folder = str(tmp_path / "steps")
+    os.makedirs(steps_folder)
+    expected = run_steps(Dataset(copy.deepcopy(json_data)), steps_folder).to_json()
+    dataset = ColumnarDataset(json_data) if columnar else Dataset(json_data)
+    dataset = processing.process_dataset(dataset, columnar=columnar, category_analysis_path=str(tmp_path / "category_analysis.txt"), categories_path=None)
+    output = dataset.to_json()
+    assert [list(anno_data) for anno_data in output["annotations"]] == [list(anno_data) for anno_data in expected["annotations"]]
+    assert output == expected
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import dataset.dataset
+import clean_segmentation
+from dataset.dataset import FieldProjection, ProjectionError
+from dataset.stream import iter_json_items
+from dataset.codec import get_codec, orjson
+
+CODECS = ["json"] + (["orjson"] if orjson is not None else [])
+PROJECTIONS = [
+    FieldProjection(clear=("segmentation",)),
+    FieldProjection(drop=("segmentation",)),
+    FieldProjection(keep=("image_id", "category_id", "category"), drop=("segmentation", "bbox")),
+]
+
+
+def make_json_data():
+    images = [{"id": 1, "file_name": "a.jpg"}, {"id": 2, "file_name": "b.jpg"}]
+    annotations = [
+        # Polygons, an empty polygon and numbers in every notation
+        {"id": 1, "image_id": 1, "category": "fish", "segmentation": [[1, 2.5, -3, 4e2], [], [5E-1, 6]], "bbox": [1, 2, 3, 4]},
+        # A field name written in strings, with escaped quotes and backslashes
+        {"id": 2, "image_id": 1, "category": 'say "segmentation": [1, 2]', "caption": '\\"segmentation\\": [3] \\',
+         "segmentation": [], "bbox": [0, 0, 1, 1]},
+        # RLE is not an array of numbers, it is parsed and then cleared
+        {"id": 3, "image_id": 2, "category": "coral", "segmentation": {"counts": [1, 2, 3], "size": [4, 5]}, "bbox": [[1], [2]]},
+        # The field is the last one of the record, and an annotation without it
+        {"id": 4, "image_id": 2, "category": "segmentation", "bbox": [1, 1, 1, 1], "segmentation": [[7, 8]]},
+        {"id": 5, "image_id": 2, "category": "sponge"},
+    ]
+    return {"images": images, "annotations": annotations}
+
+def write_json(path, json_data, indent=None):
+    with open(path, 'w', encoding="utf-8") as f:
+        json.dump(json_data, f, indent=indent)
+
+def get_expected(json_data, projection):
+    json_data = json.loads(json.dumps(json_data))
+    for anno_data in json_data["annotations"]:
+        projection.project(anno_data)
+    return json_data
+
+@pytest.mark.parametrize("projection", PROJECTIONS)
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("indent", [None, 2])
+def test_read_json(tmp_path, monkeypatch, projection, codec, indent):
+    json_data = make_json_data()
+    path = str(tmp_path / "annotations.json")
+    write_json(path, json_data, indent)
+    expected = get_expected(json_data, projection)
+    assert projection.read_json(path, get_codec(codec)) == expected
+    # Values and keys cut by the chunks
+    monkeypatch.setattr(dataset.dataset, "PROJECTION_CHUNK_SIZE", 7)
+    assert projection.read_json(path, get_codec(codec)) == expected
+
+@pytest.mark.parametrize("projection", PROJECTIONS)
+def test_iter_json_items(tmp_path, projection):
+    json_data = make_json_data()
+    path = str(tmp_path / "annotations.json")
+    write_json(path, json_data)
+    items = {"images": [], "annotations": []}
+    for key, value, _, _ in iter_json_items(path, projection=projection):
+        items[key].append(value)
+    assert items == get_expected(json_data, projection)
+
+def test_filter_text_skips_strings():
+    projection = FieldProjection(clear=("segmentation",))
+    text = json.dumps({"caption": '"segmentation": [1]', "segmentation": [1]})
+    assert projection.filter_text(text, final=True) == ('{"caption": "\\"segmentation\\": [1]", "segmentation": []}', "", 1)
+
+def make_nested_json_data():
+    # The same field name in an image and in a nested record, which project keeps
+    json_data = make_json_data()
+    json_data["images"][0]["segmentation"] = [1, 2]
+    json_data["annotations"][1]["attributes"] = {"segmentation": [3, 4], "bbox": [5]}
+    return json_data
+
+@pytest.mark.parametrize("projection", PROJECTIONS)
+def test_nested_fields(tmp_path, projection):
+    json_data = make_nested_json_data()
+    path = str(tmp_path / "annotations.json")
+    write_json(path, json_data)
+    expected = get_expected(json_data, projection)
+    assert projection.read_json(path) == expected
+    with pytest.raises(ProjectionError):
+        list(iter_json_items(path, projection=projection))
+
+def test_clean_segmentation_nested_fields(tmp_path):
+    json_data = make_nested_json_data()
+    path = str(tmp_path / "annotations.json")
+    write_json(path, json_data)
+    clean_segmentation.main(path)
+    with open(clean_segmentation.get_output_path(path), 'rb') as f:
+        expected = f.read()
+    clean_segmentation.main(path, stream=True)
+    with open(clean_segmentation.get_output_path(path), 'rb') as f:
+        assert f.read() == expected
+    assert json.loads(expected)["images"][0]["segmentation"] == [1, 2]
@@ -0,0 +1,33 @@
+from dataset.dataset import Dataset
+from dataset.category import CategoryNormalizer
+from dataset.caption import CaptionNormalizer
+from dataset.small_bbox import SmallBboxFilter
+
+
+def test_query_after_category_normalizer(json_data):
+    dataset = Dataset(json_data)
+    assert dataset.query().category("fish").ids() == [1, 4]
+    assert dataset.query().category("sponge").ids() == [2]
+
+    CategoryNormalizer({"sponge": "coral"}).apply(dataset)
+    assert dataset.query().category("sponge").ids() == []
+    assert dataset.query().category("coral").ids() == [2, 3]
+
+def test_query_after_caption_normalizer(json_data):
+    dataset = Dataset(json_data)
+    small_bbox_filter = SmallBboxFilter()
+    assert dataset.query().caption_empty().ids() == []
+    assert dataset.query().small(small_bbox_filter).caption_empty(False).ids() == [2]
+
+    CaptionNormalizer().apply(dataset, small_bbox_filter)
+    assert dataset.query().caption_empty().ids() == [2]
+    assert dataset.query().small(small_bbox_filter).caption_empty(False).ids() == []
+
+def test_query_after_set_bbox(json_data):
+    dataset = Dataset(json_data)
+    small_bbox_filter = SmallBboxFilter()
+    assert dataset.query().small(small_bbox_filter).ids() == [2]
+
+    dataset.get_annotation_by_id(3).set_bbox([0, 0, 20, 20])
+    assert dataset.query().small(small_bbox_filter).ids() == [2, 3]
+    assert dataset.query().area(min_area=1000).ids() == [1, 4]
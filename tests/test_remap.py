@@ -0,0 +1,77 @@
+import os
+import stat
+
+from dataset.dataset import Dataset
+from dataset.remap import IdRemap, NO_ID, AMBIGUOUS_ID, get_remap_path, load_remap
+
+
+def make_sparse_dataset(json_data):
+    for image_data in json_data["images"]:
+        image_data["id"] *= 10
+    for anno_data in json_data["annotations"]:
+        anno_data["id"] = anno_data["id"] * 7 + 100
+        anno_data["image_id"] *= 10
+    return Dataset(json_data)
+
+def test_round_trip(json_data, tmp_path):
+    dataset = make_sparse_dataset(json_data)
+    old_ids = [annotation.get_id() for annotation in dataset.get_all_annotations()]
+    source = str(tmp_path / "input" / "annotations.json")
+    remap = IdRemap(source)
+    remap.renumber(dataset)
+    new_ids = [annotation.get_id() for annotation in dataset.get_all_annotations()]
+    assert new_ids == [1, 2, 3, 4]
+
+    path = get_remap_path(str(tmp_path / "output" / "annotations.json"))
+    os.mkdir(tmp_path / "output")
+    remap.save(path)
+    loaded = load_remap(path)
+    assert loaded.annotations.translate(old_ids) == new_ids
+    assert loaded.annotations.translate_back(new_ids) == old_ids
+    assert loaded.annotations.get_new_id(old_ids[2], source) == 3
+    assert loaded.annotations.get_new_id(12345) == NO_ID
+    assert loaded.images.translate([10, 20, 30]) == [1, 2, NO_ID]
+    assert loaded.annotations.get_sources([1]) == [source]
+
+def test_duplicate_old_ids(json_data, tmp_path):
+    json_data["annotations"][3]["id"] = 1
+    dataset = Dataset(json_data)
+    remap = IdRemap()
+    remap.renumber(dataset)
+    path = str(tmp_path / "annotations.json.ids")
+    remap.save(path)
+    loaded = load_remap(path)
+    assert loaded.annotations.translate([1, 2, 3]) == [AMBIGUOUS_ID, 2, 4]
+
+def test_saved_sources_are_relative(json_data, tmp_path, monkeypatch):
+    # The header holds no absolute path, and the sidecar still finds its sources once moved with them
+    os.makedirs(tmp_path / "before" / "input")
+    os.makedirs(tmp_path / "before" / "output")
+    monkeypatch.chdir(tmp_path / "before")
+    remap = IdRemap(os.path.abspath("input/main.json"))
+    remap.renumber(Dataset(json_data))
+    remap.add_source("input/small.json", [])
+    remap.save("output/main.json.ids")
+    with open("output/main.json.ids", 'rb') as f:
+        header = f.read()
+    assert str(tmp_path).encode() not in header
+    assert b"../input/main.json" in header
+
+    os.rename(tmp_path / "before", tmp_path / "after")
+    monkeypatch.chdir(tmp_path / "after")
+    loaded = load_remap("output/main.json.ids")
+    assert loaded.annotations.sources == ["input/main.json", "input/small.json"]
+    assert loaded.annotations.get_new_id(1, "./input/main.json") == 1
+    assert loaded.annotations.get_new_id(1, os.path.abspath("input/main.json")) == 1
+
+def test_save_applies_umask(json_data, tmp_path):
+    remap = IdRemap()
+    remap.renumber(Dataset(json_data))
+    path = str(tmp_path / "annotations.json.ids")
+    umask = os.umask(0o022)
+    try:
+        remap.save(path)
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert os.listdir(tmp_path) == ["annotations.json.ids"]
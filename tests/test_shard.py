@@ -0,0 +1,61 @@
+import os
+import json
+
+import pytest
+
+import processing
+from benchmark.load_dataset import make_synthetic_json
+from dataset.shard import Sharding, MANIFEST_NAME
+
+
+def run_processing(folder, json_data, sharding=None, processes=1):
+    os.makedirs(folder)
+    json_path = os.path.join(folder, "combined.json")
+    with open(json_path, 'w', encoding="utf-8") as f:
+        json.dump(json_data, f)
+    processing.main(json_path, processes=processes, sharding=sharding,
+                    category_analysis_path=os.path.join(folder, "category_analysis.txt"),
+                    categories_path=os.path.join(folder, "categories.json"))
+    return json_path
+
+def read_json(path):
+    with open(path, 'r', encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.mark.parametrize("sharding, processes", [
+    (Sharding(num_shards=4), 1),
+    (Sharding(num_shards=4), 2),
+    (Sharding(max_annotations=50), 1),
+    (Sharding(num_shards=2, splits={"train": 0.8, "val": 0.2}), 1),
+])
+def test_shards_recombine_into_unsharded_file(tmp_path, sharding, processes):
+    json_data = make_synthetic_json(600)
+    json_path = run_processing(str(tmp_path / "file"), json_data)
+    expected = read_json(processing.get_output_path(json_path))
+    categories = read_json(str(tmp_path / "file" / "categories.json"))["categories"]
+
+    json_path = run_processing(str(tmp_path / "shards"), json_data, sharding, processes)
+    output_dir = json_path.replace(".json", "_processed")
+    manifest = read_json(os.path.join(output_dir, MANIFEST_NAME))
+    assert len(manifest["shards"]) > 1
+    images = []
+    annotations = []
+    for entry in manifest["shards"]:
+        shard = read_json(os.path.join(output_dir, entry["file"]))
+        assert shard["categories"] == categories
+        assert (entry["images"], entry["annotations"]) == (len(shard["images"]), len(shard["annotations"]))
+        images.extend(shard["images"])
+        annotations.extend(shard["annotations"])
+    assert (manifest["images"], manifest["annotations"]) == (len(images), len(annotations))
+
+    # The ids follow the order of the unsharded file, which splits break up
+    images.sort(key=lambda image_data: image_data["id"])
+    annotations.sort(key=lambda anno_data: anno_data["id"])
+    assert images == expected["images"]
+    assert annotations == expected["annotations"]
+
+def test_sharding_arguments():
+    with pytest.raises(ValueError):
+        Sharding(num_shards=2, max_annotations=10)
+    with pytest.raises(ValueError):
+        Sharding(splits={"train": 0.8, "val": 0.1})
@@ -0,0 +1,63 @@
+import os
+import json
+
+import pytest
+
+from benchmark.generate import make_marinedet_json
+from dataset.dataset import Dataset
+from dataset.columnar import ColumnarDataset, np
+from dataset.small_bbox import SmallBboxFilter, DEFAULT_SMALL_BBOX_FILTER
+
+FILTERS = [DEFAULT_SMALL_BBOX_FILTER, SmallBboxFilter(4096), SmallBboxFilter(0.001, relative=True)]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_json_data():
+    return make_marinedet_json(1000, category_analysis_path=os.path.join(REPO_ROOT, "category_analysis.txt"))
+
+def scan_mask(json_data, small_bbox_filter):
+    # The flags as the annotations were tested one by one, in image order
+    mask = []
+    for image_data in json_data["images"]:
+        threshold = small_bbox_filter.threshold
+        if small_bbox_filter.relative:
+            threshold *= image_data["width"] * image_data["height"]
+        for anno_data in json_data["annotations"]:
+            if anno_data["image_id"] == image_data["id"]:
+                mask.append(anno_data["bbox"][2] * anno_data["bbox"][3] < threshold)
+    return mask
+
+def make_datasets(json_data):
+    datasets = [Dataset(json.loads(json.dumps(json_data))), Dataset(json.loads(json.dumps(json_data)), lazy=True)]
+    if np is not None:
+        datasets.append(ColumnarDataset(json.loads(json.dumps(json_data))))
+    return datasets
+
+@pytest.mark.parametrize("small_bbox_filter", FILTERS)
+def test_mask_is_the_scan(small_bbox_filter):
+    json_data = make_json_data()
+    expected = scan_mask(json_data, small_bbox_filter)
+    assert 0 < sum(expected) < len(expected)
+    for dataset in make_datasets(json_data):
+        assert [bool(small) for small in small_bbox_filter.get_mask(dataset)] == expected
+        assert [small for image in dataset.get_images() for small in small_bbox_filter.image_mask(image)] == expected
+        assert small_bbox_filter.count(dataset) == sum(expected)
+
+def test_mask_follows_bbox_changes():
+    json_data = make_json_data()
+    for dataset in make_datasets(json_data):
+        mask = [bool(small) for small in DEFAULT_SMALL_BBOX_FILTER.get_mask(dataset)]
+        annotation = dataset.get_images()[0].get_annotations()[0]
+        annotation.set_bbox([0, 0, 1, 1] if not mask[0] else [0, 0, 100, 100])
+        assert [bool(small) for small in DEFAULT_SMALL_BBOX_FILTER.get_mask(dataset)] == [not mask[0]] + mask[1:]
+
+def test_clear_small_bbox_fields():
+    json_data = make_json_data()
+    expected = scan_mask(json_data, DEFAULT_SMALL_BBOX_FILTER)
+    for dataset in make_datasets(json_data):
+        DEFAULT_SMALL_BBOX_FILTER.clear_labels(dataset)
+        DEFAULT_SMALL_BBOX_FILTER.clear_negative_tags(dataset)
+        for annotation, small in zip(dataset.get_all_annotations(), expected):
+            if small:
+                assert (annotation.get_label(), annotation.get_negative_tags()) == (-1, "")
+            else:
+                assert annotation.get_label() != -1
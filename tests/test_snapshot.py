@@ -0,0 +1,85 @@
+from dataset.dataset import Dataset
+from dataset.category import CategoryNormalizer
+from dataset.remap import IdRemap
+from dataset.small_bbox import SmallBboxFilter
+from dataset.snapshot import fork_dataset, diff_datasets
+
+
+def test_fork_write_does_not_leak(json_data):
+    dataset = Dataset(json_data)
+    expected = dataset.to_json()
+    fork = fork_dataset(dataset)
+
+    CategoryNormalizer({"sponge": "coral"}).apply(fork)
+    fork.get_annotation_by_id(1).set_bbox([0, 0, 1, 1])
+    fork.get_images()[1].set_id(20)
+    assert dataset.to_json() == expected
+
+    # Nor the other way round
+    dataset.get_annotation_by_id(3).set_caption("changed")
+    assert fork.get_annotation_by_id(3).get_caption() == "<image> a coral"
+    assert fork.get_annotation_by_id(2).get_category() == "coral"
+
+def test_fork_equal_write_keeps_record_shared(json_data):
+    dataset = Dataset(json_data)
+    fork = fork_dataset(dataset)
+    annotation = fork.get_annotation_by_id(4)
+    annotation.set_field("label", 1)
+    assert annotation.json_data is dataset.get_annotation_by_id(4).json_data
+    # 1.0 == 1, but it is written differently
+    annotation.set_field("label", 1.0)
+    assert annotation.json_data is not dataset.get_annotation_by_id(4).json_data
+    assert dataset.get_annotation_by_id(4).get_label() == 1
+
+def test_diff_after_rearrange_ids(json_data):
+    for image_data in json_data["images"]:
+        image_data["id"] += 100
+    for anno_data in json_data["annotations"]:
+        anno_data["id"] += 1000
+        anno_data["image_id"] += 100
+    dataset = Dataset(json_data)
+    fork = fork_dataset(dataset)
+    IdRemap().renumber(fork)
+    fork.get_annotation_by_id(2).set_caption("")
+
+    changes = diff_datasets(dataset, fork)
+    # Paired by record, not by id: every annotation is changed, none added or removed
+    assert [(kind, annotation_id) for kind, annotation_id, _ in changes] == [
+        ("changed", 1), ("changed", 2), ("changed", 3), ("changed", 4)]
+    assert changes[0][2] == {"id": (1001, 1), "image_id": (101, 1)}
+    assert changes[1][2] == {"id": (1002, 2), "image_id": (101, 1), "caption": ("a small sponge", "")}
+    assert changes[2][2] == {"id": (1004, 3), "image_id": (101, 1)}
+    assert changes[3][2] == {"id": (1003, 4), "image_id": (102, 2)}
+
+def test_diff_duplicate_image_ids(json_data):
+    # Both images with id 1 share the records of its annotations in a lazy dataset
+    json_data["images"][1]["id"] = 1
+    json_data["annotations"][2]["image_id"] = 1
+    dataset = Dataset(json_data, lazy=True)
+    fork = fork_dataset(dataset)
+    first, second = fork.get_images()
+    assert all(a.json_data is b.json_data for a, b in zip(first.get_annotations(), second.get_annotations()))
+
+    second.get_annotations()[0].set_caption("")
+    changes = diff_datasets(dataset, fork)
+    assert changes == [("changed", 1, {"caption": ("description: a fish  near the coral", "")})]
+    assert first.get_annotations()[0].get_caption() == "description: a fish  near the coral"
+
+    # Removing the copies of the second image leaves the first ones paired
+    second.set_annotations([])
+    changes = diff_datasets(dataset, fork)
+    assert sorted((kind, annotation_id) for kind, annotation_id, _ in changes) == [
+        ("removed", 1), ("removed", 2), ("removed", 3), ("removed", 4)]
+
+def test_set_field_bbox_invalidates_mask(json_data):
+    dataset = Dataset(json_data)
+    small_bbox_filter = SmallBboxFilter()
+    assert list(small_bbox_filter.get_mask(dataset)) == [False, True, False, False]
+    dataset.get_annotation_by_id(1).set_field("bbox", [10, 10, 5, 5])
+    assert list(small_bbox_filter.get_mask(dataset)) == [True, True, False, False]
+
+    fork = fork_dataset(dataset)
+    assert list(small_bbox_filter.get_mask(fork)) == [True, True, False, False]
+    fork.get_annotation_by_id(2).set_field("bbox", [0, 0, 100, 100])
+    assert list(small_bbox_filter.get_mask(fork)) == [True, False, False, False]
+    assert list(small_bbox_filter.get_mask(dataset)) == [True, True, False, False]
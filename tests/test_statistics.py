@@ -0,0 +1,106 @@
+import os
+import json
+import collections
+
+import pytest
+
+import processing
+import extract_category
+from benchmark.generate import make_marinedet_json
+from dataset.columnar import ColumnarDataset, np
+from dataset.dataset import Dataset
+from dataset.small_bbox import DEFAULT_SMALL_BBOX_FILTER
+from dataset.statistics import CategoryStatistics, read_categories, set_categories_source, read_categories_of
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_processed_json_data():
+    json_data = make_marinedet_json(2000, category_analysis_path=os.path.join(REPO_ROOT, "category_analysis.txt"))
+    dataset = processing.define_category_id(processing.process_category(Dataset(json_data)))
+    json_data = dataset.to_json()
+    # Annotations without a caption count as not captioned
+    for anno_data in json_data["annotations"][::50]:
+        del anno_data["caption"]
+    return json_data
+
+def count_categories(json_data):
+    # Every statistic, annotation by annotation and image by image
+    counts = {name: collections.Counter() for name in ("annotations", "small_bboxes", "captioned", "images")}
+    for image_data in json_data["images"]:
+        keys = set()
+        for anno_data in json_data["annotations"]:
+            if anno_data["image_id"] != image_data["id"]:
+                continue
+            key = (anno_data["category_id"], anno_data["category"])
+            counts["annotations"][key] += 1
+            counts["small_bboxes"][key] += anno_data["bbox"][2] * anno_data["bbox"][3] < DEFAULT_SMALL_BBOX_FILTER.threshold
+            counts["captioned"][key] += bool(anno_data.get("caption"))
+            keys.add(key)
+        counts["images"].update(keys)
+    return {name: +counter for name, counter in counts.items()}
+
+def extract_category_lines(output):
+    return [line for line in output.splitlines() if line.startswith("{")]
+
+@pytest.mark.parametrize("kind", ["dataset", "images", "columnar"])
+def test_counts_are_the_scan(kind):
+    if kind == "columnar" and np is None:
+        pytest.skip("numpy is not installed")
+    json_data = make_processed_json_data()
+    expected = count_categories(json.loads(json.dumps(json_data)))
+    statistics = CategoryStatistics()
+    if kind == "images":
+        dataset = Dataset(json_data)
+        for image in dataset.get_images():
+            statistics.add_image(image, DEFAULT_SMALL_BBOX_FILTER.image_mask(image))
+    else:
+        dataset = ColumnarDataset(json_data) if kind == "columnar" else Dataset(json_data)
+        statistics.add_dataset(dataset, DEFAULT_SMALL_BBOX_FILTER)
+    assert {name: +counter for name, counter in statistics.counts.items()} == expected
+
+def test_category_analysis_is_the_count_by_id(tmp_path):
+    json_data = make_processed_json_data()
+    processing.category_analysis(Dataset(json.loads(json.dumps(json_data))), str(tmp_path / "category_analysis.txt"))
+    counts = collections.Counter((anno_data["category_id"], anno_data["category"]) for anno_data in json_data["annotations"])
+    lines = [f"{category_id};{category};{count}\n" for (category_id, category), count in sorted(counts.items())]
+    assert (tmp_path / "category_analysis.txt").read_text(encoding="utf-8") == "".join(lines)
+
+def test_categories_table(tmp_path):
+    json_data = make_processed_json_data()
+    statistics = CategoryStatistics().add_dataset(Dataset(json_data), DEFAULT_SMALL_BBOX_FILTER)
+    categories_path = str(tmp_path / "categories.json")
+    statistics.write_categories(categories_path)
+    categories = read_categories(categories_path)
+    assert categories == [{"id": category_id, "name": category, "supercategory": "marine"}
+                          for category_id, category in sorted(statistics.counts["annotations"])]
+    with open(categories_path, 'r', encoding="utf-8") as f:
+        entry = json.load(f)["statistics"][0]
+    assert entry["caption_coverage"] == round(entry["captioned"] / entry["annotations"], 4)
+
+    # The table is only used for the file it was written for, while it is unchanged
+    dataset_path = tmp_path / "combined_processed.json"
+    dataset_path.write_text(json.dumps(json_data), encoding="utf-8")
+    assert read_categories_of(categories_path, str(dataset_path)) is None
+    set_categories_source(categories_path, str(dataset_path))
+    assert read_categories_of(categories_path, str(dataset_path)) == categories
+    other_path = tmp_path / "other.json"
+    other_path.write_text(json.dumps(json_data), encoding="utf-8")
+    assert read_categories_of(categories_path, str(other_path)) is None
+    dataset_path.write_text(json.dumps(json_data) + " ", encoding="utf-8")
+    assert read_categories_of(categories_path, str(dataset_path)) is None
+
+def test_extract_category_reads_the_table(tmp_path, capsys):
+    json_path = str(tmp_path / "combined.json")
+    with open(json_path, 'w', encoding="utf-8") as f:
+        json.dump(make_marinedet_json(1000, category_analysis_path=os.path.join(REPO_ROOT, "category_analysis.txt")), f)
+    categories_path = str(tmp_path / "categories.json")
+    processing.main(json_path, category_analysis_path=str(tmp_path / "category_analysis.txt"), categories_path=categories_path)
+    output_path = processing.get_output_path(json_path)
+    capsys.readouterr()
+    extract_category.main(output_path, categories_path=categories_path)
+    from_table = capsys.readouterr().out
+    assert f"Read the categories from {categories_path}" in from_table
+    extract_category.main(output_path)
+    scanned = capsys.readouterr().out
+    assert extract_category_lines(from_table) == extract_category_lines(scanned) != []
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from benchmark.load_dataset import make_synthetic_json
+from dataset.codec import get_codec
+from dataset.dataset import Dataset
+from dataset.stream import StreamingDataset, iter_json_items, write_json
+
+
+def make_text_json_data():
+    # Non-ASCII and escaped characters, so that the byte offsets differ from the character offsets
+    json_data = make_synthetic_json(200)
+    for i, anno_data in enumerate(json_data["annotations"]):
+        if i % 3 == 0:
+            anno_data["caption"] = f"une raie élégante {i} — \"près\" du récif\n"
+    json_data["info"] = {"description": "海洋"}
+    return json_data
+
+def write_input(path, json_data, ensure_ascii):
+    with open(path, 'w', encoding="utf-8") as f:
+        json.dump(json_data, f, ensure_ascii=ensure_ascii)
+    return str(path)
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_streamed_images_are_the_loaded_images(tmp_path, ensure_ascii):
+    json_data = make_text_json_data()
+    json_path = write_input(tmp_path / "combined.json", json_data, ensure_ascii)
+    dataset = Dataset(json.loads(json.dumps(json_data)))
+    stream = StreamingDataset(json_path)
+    assert len(stream.get_images()) == len(dataset.get_images())
+    for streamed, loaded in zip(stream.get_images(), dataset.get_images()):
+        assert streamed.json_data == loaded.json_data
+        assert [annotation.json_data for annotation in streamed.get_annotations()] == loaded.get_anno_datas()
+    assert stream.get_image("00000007.jpg").get_id() == 7
+    assert stream.get_image_by_id(9).get_filename() == "00000009.jpg"
+    stream.close()
+
+def test_json_items(tmp_path):
+    json_data = make_text_json_data()
+    json_path = write_input(tmp_path / "combined.json", json_data, False)
+    items = list(iter_json_items(json_path))
+    assert [value for key, value, _, _ in items if key == "annotations"] == json_data["annotations"]
+    assert [value for key, value, _, _ in items if key == "info"] == [json_data["info"]]
+    with open(json_path, 'rb') as f:
+        text = f.read()
+    for key, value, start, end in items:
+        if key == "images":
+            assert json.loads(text[start:end]) == value
+
+@pytest.mark.parametrize("compact", [True, False])
+def test_write_json_is_dump(tmp_path, compact):
+    codec = get_codec("json", compact=compact)
+    dataset = Dataset(make_text_json_data())
+    codec.dump(dataset.to_json(), str(tmp_path / "dumped.json"))
+    counts = write_json(str(tmp_path / "written.json"), dataset.get_images(), codec)
+    assert counts == (len(dataset.get_images()), len(dataset.get_all_annotations()))
+    assert (tmp_path / "written.json").read_bytes() == (tmp_path / "dumped.json").read_bytes()
@@ -0,0 +1,60 @@
+import json
+
+import processing
+from benchmark.load_dataset import make_synthetic_json
+from dataset import trace
+from dataset.trace import Tracer, RATE_LIMIT
+
+
+def test_messages_are_rate_limited_by_key(capsys):
+    tracer = Tracer()
+    for i in range(RATE_LIMIT + 5):
+        tracer.info(f"image {i}", key="image")
+    tracer.info("other")
+    tracer.flush()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == [f"image {i}" for i in range(RATE_LIMIT)] + ["other", "(5 more messages like 'image' suppressed)"]
+    tracer.flush()
+    assert capsys.readouterr().out == ""
+
+def test_levels(capsys):
+    tracer = Tracer()
+    tracer.debug("hidden")
+    tracer.warning("careful")
+    tracer.set_level(trace.DEBUG)
+    tracer.debug("shown")
+    assert capsys.readouterr().out.splitlines() == ["[WARNING] careful", "[DEBUG] shown"]
+
+def test_spans_are_written_as_a_chrome_trace(tmp_path):
+    tracer = Tracer()
+    with tracer.span("outer", "script", path="a.json"):
+        with tracer.span("inner", images=3) as span:
+            span.args["violations"] = 1
+    tracer.write(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json", 'r', encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    # Events are added as the spans end, so the inner span comes first and lies within the outer one
+    assert [(event["name"], event["cat"], event["ph"]) for event in events] == [("inner", "stage", "X"), ("outer", "script", "X")]
+    inner, outer = events
+    assert inner["args"]["images"] == 3 and inner["args"]["violations"] == 1 and outer["args"]["path"] == "a.json"
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"] + 1
+    assert "cpu_seconds" in inner["args"]
+
+def test_processing_trace_has_every_stage(tmp_path, monkeypatch):
+    json_path = str(tmp_path / "combined.json")
+    with open(json_path, 'w', encoding="utf-8") as f:
+        json.dump(make_synthetic_json(300), f)
+    trace_path = str(tmp_path / "trace.json")
+    monkeypatch.setattr(trace.tracer, "events", [])
+    processing.main(json_path, stage_timing=True, trace_path=trace_path,
+                    category_analysis_path=str(tmp_path / "category_analysis.txt"), categories_path=None)
+    with open(trace_path, 'r', encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    names = [event["name"] for event in events]
+    assert "processing" in names and "load" in names and "write" in names
+    assert sum(event["cat"] == "pass" for event in events) == 2
+    stages = [stage.name for stages in processing.build_pipeline(None).plan() for stage in stages]
+    timed = {event["name"]: event["args"] for event in events if event["cat"] == "stage" and event["args"].get("summed")}
+    assert set(timed) == set(stages)
+    # Every annotation stage is called once per annotation, every image stage once per image
+    assert timed["process_category"]["calls"] == 300 and timed["rearrange_ids"]["calls"] == 60
@@ -0,0 +1,56 @@
+import os
+import json
+
+import pytest
+
+import verify
+from benchmark.load_dataset import make_synthetic_json
+from dataset.dataset import Dataset
+
+
+def make_duplicate_json_data():
+    json_data = make_synthetic_json(400)
+    images = json_data["images"]
+    annotations = json_data["annotations"]
+    # Keys repeated within a shard and across shards
+    for i in range(10, len(images), 7):
+        images[i]["id"] = images[i - 9]["id"]
+    for i in range(5, len(images), 11):
+        images[i]["file_name"] = images[-i]["file_name"]
+    for i in range(3, len(annotations), 13):
+        annotations[i]["id"] = annotations[-i]["id"]
+    return json_data
+
+def run_verify(folder, json_data, **kwargs):
+    os.makedirs(folder)
+    json_path = os.path.join(folder, "combined_processed.json")
+    with open(json_path, 'w', encoding="utf-8") as f:
+        json.dump(json_data, f)
+    report_path = os.path.join(folder, "verify_report.json")
+    verify.main(json_path, report_path=report_path, **kwargs)
+    with open(report_path, 'rb') as f:
+        return f.read()
+
+@pytest.mark.parametrize("kwargs", [
+    {"processes": 2},
+    {"processes": 3},
+    {"stream": True},
+    {"stream": True, "processes": 2},
+])
+def test_parallel_report_is_the_serial_report(tmp_path, kwargs):
+    json_data = make_duplicate_json_data()
+    expected = run_verify(str(tmp_path / "serial"), json_data)
+    counts = json.loads(expected)["counts"]
+    assert counts["image_id"] > 0 and counts["annotation_id"] > 0 and counts["image_filename"] > 0
+    assert run_verify(str(tmp_path / "parallel"), json_data, **kwargs) == expected
+
+@pytest.mark.parametrize("shard_size", [1, 2, 5, 16])
+def test_merged_shards_are_the_single_shard(shard_size):
+    dataset = Dataset(make_duplicate_json_data())
+    validator = verify.build_validator()
+    images = dataset.get_images()
+    expected = validator.merge([validator.check_images(images)])
+    results = [validator.check_images(images[start:start + shard_size]) for start in range(0, len(images), shard_size)]
+    report = validator.merge(results)
+    assert report.violations == expected.violations
+    assert report.counts == expected.counts
@@ -1,25 +1,35 @@
 import os
 import json
-from dataset.dataset import Dataset, Image, Annotation
+from dataset import trace
+from dataset.dataset import Dataset, Image, Annotation, FieldProjection
+from dataset.stream import StreamingDataset
+from dataset.small_bbox import SmallBboxFilter, DEFAULT_SMALL_BBOX_FILTER
+from dataset.validation import Validator
+from dataset.cache import load_json
+from dataset.overlap import OVERLAP_THRESHOLD, find_overlapping_annotations
+from dataset.codec import DEFAULT_CODEC, get_codec
+
+# The rules of build_validator do not read the segmentations, which are dropped while the file
+# is read. Set it to None when rule_segmentation is enabled.
+LOAD_PROJECTION = FieldProjection(drop=("segmentation",))
 
 def check_image_id(dataset):
-    print("Checking image id...")
+    trace.info("Checking image id...")
     # Check if image ids are unique
-    image_ids = [image.get_id() for image in dataset.get_images()]
-    if len(image_ids) != len(set(image_ids)):
+    if len(dataset.get_image_id_index()) != len(dataset.get_images()):
         return False
     return True
 
 def check_annotation_id(dataset):
-    print("Checking annotation id...")
+    trace.info("Checking annotation id...")
     # Check if annotation ids are unique
-    annotation_ids = [anno.get_id() for anno in dataset.get_all_annotations()]
-    if len(annotation_ids) != len(set(annotation_ids)):
+    num_annotations = sum(len(image.get_annotations()) for image in dataset.get_images())
+    if len(dataset.get_annotation_id_index()) != num_annotations:
         return False
     return True
 
 def check_image_annotation_id(dataset):
-    print("Checking image and annotation id...")
+    trace.info("Checking image and annotation id...")
     # Check if image containing the annotation has the same id as the annotation
     for image in dataset.get_images():
         for annotation in image.get_annotations():
@@ -28,139 +38,241 @@ def check_image_annotation_id(dataset):
     return True
 
 def check_image_filename(dataset):
-    print("Checking image filename...")
+    trace.info("Checking image filename...")
     # Check if image filenames are unique
-    filenames = [image.get_filename() for image in dataset.get_images()]
-    if len(filenames) != len(set(filenames)):
+    if len(dataset.get_filename_index()) != len(dataset.get_images()):
         return False
     return True 
 
 def check_category(dataset):
-    print("Checking category...")
+    trace.info("Checking category...")
     # Check if category in annotation are not empty string
     for annotation in dataset.get_all_annotations():
         if annotation.get_category() == "":
-            print(f"At annotation id {annotation.get_id()}, category is empty.")
+            trace.warning(f"At annotation id {annotation.get_id()}, category is empty.", key="check_category")
 
     return True
 
-def count_small_bbox(dataset):
-    count = 0
-    for annotation in dataset.get_all_annotations():
-        if annotation.is_small_bbox():
-            count += 1
-    print(f"Number of small bounding box: {count}")
+def count_small_bbox(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    count = small_bbox_filter.count(dataset)
+    trace.info(f"Number of small bounding box: {count}")
 
-def check_small_bbox_caption(dataset):
-    print("Checking small bounding box caption...")
-    for annotation in dataset.get_all_annotations():
-        if annotation.is_small_bbox() and annotation.get_caption() != "":
-            print(f"At annotation id {annotation.get_id()}, it is a small bbox, and the caption should be empty.")
+def check_small_bbox_caption(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    trace.info("Checking small bounding box caption...")
+    mask = small_bbox_filter.get_mask(dataset)
+    for annotation, small in zip(dataset.get_all_annotations(), mask):
+        if small and annotation.get_caption() != "":
+            trace.warning(f"At annotation id {annotation.get_id()}, it is a small bbox, and the caption should be empty.", key="check_small_bbox_caption")
 
 def check_segmentation(dataset):
-    print("Checking segmentation...")
+    trace.info("Checking segmentation...")
     for annotation in dataset.get_all_annotations():
         if annotation.get_segmentation() != []:
-            print(f"At annotation id {annotation.get_id()}, segmentation is not empty.")
+            trace.warning(f"At annotation id {annotation.get_id()}, segmentation is not empty.", key="check_segmentation")
 
-def check_caption(dataset):
-    print("Checking caption...")
+def check_caption(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    trace.info("Checking caption...")
 
     for image in dataset.get_images():
         have_caption = False
-        for annotation in image.get_annotations():
+        for annotation, small in zip(image.get_annotations(), small_bbox_filter.image_mask(image)):
             
-            if annotation.is_small_bbox():
+            if small:
                 # Small bounding box does not require caption
                 continue
             
             if annotation.get_caption() == "":
-                print(f"At annotation id {annotation.get_id()}, caption is empty.")
+                trace.warning(f"At annotation id {annotation.get_id()}, caption is empty.", key="check_caption")
                 continue
 
             have_caption = True
             
             # Check if the caption contain "<image>"
             if "<image>" in annotation.get_caption():
-                print(f"At annotation id {annotation.get_id()}, caption contains '<image>'.")
+                trace.warning(f"At annotation id {annotation.get_id()}, caption contains '<image>'.", key="check_caption")
                 continue
             
             # Check if the caption contain "description:"
             if "description:" in annotation.get_caption():
-                print(f"At annotation id {annotation.get_id()}, caption contains 'description:'.")
+                trace.warning(f"At annotation id {annotation.get_id()}, caption contains 'description:'.", key="check_caption")
                 continue
 
         if not have_caption:
-            print(f"At image id {image.get_id()}, there is no caption.")
+            trace.warning(f"At image id {image.get_id()}, there is no caption.", key="check_caption")
         
     return True
 
 def check_double_space(dataset):
-    print("Checking double space...")
+    trace.info("Checking double space...")
     for image in dataset.get_images():
         for annotation in image.get_annotations():
             caption = annotation.get_caption()
             if "  " in caption:
-                print(f"At annotation id {annotation.get_id()}, caption contains double space.")
+                trace.warning(f"At annotation id {annotation.get_id()}, caption contains double space.", key="check_double_space")
     return True
 
-def check_small_bbox_label(dataset):
-    print("Checking small bbox label...")
-    for annotation in dataset.get_all_annotations():
-        if annotation.is_small_bbox():
+def check_small_bbox_label(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    trace.info("Checking small bbox label...")
+    mask = small_bbox_filter.get_mask(dataset)
+    for annotation, small in zip(dataset.get_all_annotations(), mask):
+        if small:
             if annotation.get_label() != -1:
-                print(f"At annotation id {annotation.get_id()}, label should be -1.")
+                trace.warning(f"At annotation id {annotation.get_id()}, label should be -1.", key="check_small_bbox_label")
     return True
 
-def check_small_bbox_negative_tags(dataset):
-    print("Checking small bbox negative tags...")
-    for annotation in dataset.get_all_annotations():
-        if annotation.is_small_bbox():
+def check_small_bbox_negative_tags(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER):
+    trace.info("Checking small bbox negative tags...")
+    mask = small_bbox_filter.get_mask(dataset)
+    for annotation, small in zip(dataset.get_all_annotations(), mask):
+        if small:
             if annotation.get_negative_tags() != "":
-                print(f"At annotation id {annotation.get_id()}, negative tags should be empty.")
+                trace.warning(f"At annotation id {annotation.get_id()}, negative tags should be empty.", key="check_small_bbox_negative_tags")
     return True
 
-def main(json_path):
-    with open(json_path, 'r', encoding="utf-8") as f:
-        print(f"Reading {json_path}...")
-        json_data = json.load(f)
+def get_overlap_message(first, iou):
+    if iou is None:
+        return f"it is a duplicate of annotation id {first['id']}."
+    return f"it overlaps annotation id {first['id']} with IoU {iou:.3f}."
 
-    dataset = Dataset(json_data)
-    check_small_bbox_caption(dataset)
-    # check_segmentation(dataset)
+def check_overlap(dataset, threshold=OVERLAP_THRESHOLD):
+    trace.info("Checking duplicate and overlapping annotations...")
+    for _, first, second, iou in find_overlapping_annotations(dataset.get_images(), threshold):
+        trace.warning(f"At annotation id {second['id']}, {get_overlap_message(first, iou)}", key="check_overlap")
+    return True
 
-    check_image_id(dataset)
+# Rules of the validator, the same checks as the check_* functions above.
+# Each returns the violation message, or None when the annotation or image is fine.
 
-        
-    
-    if not check_annotation_id(dataset):
-        print("Annotation ids are not unique.")
-        
-    
-    if not check_image_annotation_id(dataset):
-        print("Image ids and annotation ids do not match.")
-        
-    
-    if not check_image_filename(dataset):
-        print("Image filenames are not unique.")
-        
-    
-    if not check_category(dataset):
-        print("Category in annotation is empty.")
-        
-    
-    if not check_caption(dataset):
-        print("Caption in annotation is empty or contains '<image>' or 'description:'.")
-    
-    check_double_space(dataset)
-    check_small_bbox_label(dataset)
-    check_small_bbox_negative_tags(dataset)
+def rule_image_annotation_id(image, annotation, small):
+    if annotation.get_image_id() != image.get_id():
+        return f"image id {annotation.get_image_id()} does not match the image."
+
+def rule_category(image, annotation, small):
+    if annotation.get_category() == "":
+        return "category is empty."
+
+def rule_segmentation(image, annotation, small):
+    if annotation.get_segmentation() != []:
+        return "segmentation is not empty."
+
+def rule_caption(image, annotation, small):
+    if small:
+        # Small bounding box does not require caption
+        return None
+    caption = annotation.get_caption()
+    if caption == "":
+        return "caption is empty."
+    if "<image>" in caption:
+        return "caption contains '<image>'."
+    if "description:" in caption:
+        return "caption contains 'description:'."
+
+def rule_image_caption(image, small_mask):
+    for annotation, small in zip(image.get_annotations(), small_mask):
+        if not small and annotation.get_caption() != "":
+            return None
+    return "there is no caption."
+
+def rule_double_space(image, annotation, small):
+    if "  " in annotation.get_caption():
+        return "caption contains double space."
+
+def rule_small_bbox_caption(image, annotation, small):
+    if small and annotation.get_caption() != "":
+        return "it is a small bbox, and the caption should be empty."
+
+def rule_small_bbox_label(image, annotation, small):
+    if small and annotation.get_label() != -1:
+        return "label should be -1."
+
+def rule_small_bbox_negative_tags(image, annotation, small):
+    if small and annotation.get_negative_tags() != "":
+        return "negative tags should be empty."
+
+def rule_overlap(images, threshold=OVERLAP_THRESHOLD):
+    for position, first, second, iou in find_overlapping_annotations(images, threshold):
+        yield position, second["id"], get_overlap_message(first, iou)
+
+def build_validator(small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, overlap_threshold=OVERLAP_THRESHOLD):
+    validator = Validator(small_bbox_filter)
+    validator.add_unique_image_rule("image_id", lambda image: image.get_id())
+    validator.add_unique_annotation_rule("annotation_id", lambda annotation: annotation.get_id())
+    validator.add_annotation_rule("image_annotation_id", rule_image_annotation_id)
+    validator.add_unique_image_rule("image_filename", lambda image: image.get_filename())
+    validator.add_annotation_rule("category", rule_category)
+    # Needs LOAD_PROJECTION = None
+    # validator.add_annotation_rule("segmentation", rule_segmentation)
+    validator.add_annotation_rule("caption", rule_caption)
+    validator.add_image_rule("image_caption", rule_image_caption)
+    validator.add_annotation_rule("double_space", rule_double_space)
+    validator.add_annotation_rule("small_bbox_caption", rule_small_bbox_caption)
+    validator.add_annotation_rule("small_bbox_label", rule_small_bbox_label)
+    validator.add_annotation_rule("small_bbox_negative_tags", rule_small_bbox_negative_tags)
+    # Compared within a batch of images, across the images of the batch at once
+    validator.add_images_rule("overlap", lambda images: rule_overlap(images, overlap_threshold))
+    return validator
+
+def main(json_path, stream=False, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, processes=1, report_path="./data/verify_report.json", cache=False, trace_path=None, overlap_threshold=OVERLAP_THRESHOLD, codec=DEFAULT_CODEC):
+    # The spans of the worker processes are not traced
+    try:
+        with trace.span("verify", "script", path=json_path):
+            return verify_file(json_path, stream, small_bbox_filter, processes, report_path, cache, overlap_threshold, codec)
+    finally:
+        trace.tracer.flush()
+        if trace_path is not None:
+            trace.tracer.write(trace_path)
+
+def verify_file(json_path, stream, small_bbox_filter, processes, report_path, cache, overlap_threshold, codec):
+    with trace.span("load", "io", path=json_path):
+        if stream:
+            trace.info(f"Streaming {json_path}...")
+            dataset = StreamingDataset(json_path, codec)
+        else:
+            trace.info(f"Reading {json_path}...")
+            json_data = load_json(json_path, cache, LOAD_PROJECTION, codec)
+
+            # The checks only read, so the annotations are wrapped one image at a time
+            dataset = Dataset(json_data, lazy=True)
+
+    report = verify_dataset(dataset, small_bbox_filter, processes, report_path, overlap_threshold)
+    if stream:
+        dataset.close()
+    return report
+
+def verify_dataset(dataset, small_bbox_filter=DEFAULT_SMALL_BBOX_FILTER, processes=1, report_path="./data/verify_report.json", overlap_threshold=OVERLAP_THRESHOLD):
+    validator = build_validator(small_bbox_filter, overlap_threshold)
+    with trace.span("check", "stage", images=len(dataset.get_images()), processes=processes) as span:
+        trace.info(f"Checking {len(dataset.get_images())} images with {processes} processes...")
+        report = validator.run(dataset, processes)
+        span.args["violations"] = len(report.violations)
 
-    count_small_bbox(dataset)
+    report.print_summary()
+    print(f"Number of small bounding box: {report.num_small_bbox}")
+    with trace.span("write report", "io", path=report_path):
+        report.write(report_path)
+    return report
     
 if __name__ == "__main__":
     json_path = "./data/combined_processed.json"
-    main(json_path)
+    # Read the file image by image instead of loading it all
+    stream = False
+    # Must match the small bbox threshold used by combine.py and processing.py
+    small_bbox_filter = SmallBboxFilter()
+    # Split the images across this many worker processes
+    processes = os.cpu_count()
+    # Every violation is written there, as CSV if the path ends with .csv
+    report_path = "./data/verify_report.json"
+    # Keep a binary snapshot of the parsed file next to it, reused while the file is unchanged.
+    # It takes up to twice the size of the file on disk (see dataset.cache).
+    cache = False
+    # Write a Chrome trace of the run (open it in chrome://tracing or ui.perfetto.dev); None to skip it
+    trace_path = "./data/verify_trace.json"
+    # Annotations of an image and category whose bboxes have at least this IoU are reported as
+    # overlapping, and identical ones as duplicates
+    overlap_threshold = OVERLAP_THRESHOLD
+    # The JSON parser: orjson when it is installed, json otherwise
+    codec = get_codec()
+    main(json_path, stream, small_bbox_filter, processes, report_path, cache, trace_path, overlap_threshold, codec)
     
 
     